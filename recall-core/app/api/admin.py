@@ -1,13 +1,19 @@
+import json
 import uuid
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import update
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from sqlalchemy import case, func, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app import profiling
 from app.api.deps import get_db, get_current_agent
-from app.db.models import Agent, Memory
+from app.db import slowlog
+from app.db.models import Agent
 from app.db.queries.system import set_config
+from app.jobs import clusters, maintenance, transfer, vector_index
+from app.jobs.quarantine import conflicting_job, get_job, run_quarantine_job, start_job
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -30,29 +36,284 @@ async def admin_heartbeat(
     return {"success": True, "heartbeat": now, "global_write_enabled": True}
 
 
-@router.post("/quarantine/{agent_id}")
+def _job_conflict(job: dict) -> JSONResponse:
+    return JSONResponse(
+        status_code=409,
+        content={"detail": f"A {job['action']} job for this agent is still running", "job": job},
+    )
+
+
+@router.post("/quarantine/{agent_id}", status_code=202)
 async def quarantine_agent(
     agent_id: uuid.UUID,
+    background: BackgroundTasks,
     agent: Agent = Depends(get_current_agent),
     db: AsyncSession = Depends(get_db),
 ):
     require_core(agent)
 
-    # Disable the agent
+    # Disable the agent now; its memories are quarantined in the background. A repeat or
+    # resume POST for an agent that is already disabled is not another quarantine
     result = await db.execute(
         update(Agent)
         .where(Agent.id == agent_id)
-        .values(disabled_at=datetime.now(timezone.utc))
+        .values(
+            disabled_at=func.coalesce(Agent.disabled_at, datetime.now(timezone.utc)),
+            quarantine_count=case(
+                (Agent.disabled_at.is_(None), Agent.quarantine_count + 1), else_=Agent.quarantine_count
+            ),
+        )
     )
     if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Agent not found")
+    # Still holding the agent row: concurrent POSTs for it see each other's job
+    conflict = await conflicting_job(db, agent_id, "quarantine")
+    if conflict is not None:
+        await db.rollback()
+        return _job_conflict(conflict)
+    await db.commit()
+
+    job, start = await start_job(db, agent_id, "quarantine")
+    if start:
+        background.add_task(run_quarantine_job, agent_id, "quarantine")
+
+    return {"success": True, "agent_id": str(agent_id), "status": "quarantined", "job": job}
+
 
-    # Mark all their memories as quarantined
-    await db.execute(
-        update(Memory)
-        .where(Memory.agent_id == agent_id)
-        .values(quality=-2)
+@router.post("/unquarantine/{agent_id}", status_code=202)
+async def unquarantine_agent(
+    agent_id: uuid.UUID,
+    background: BackgroundTasks,
+    agent: Agent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_db),
+):
+    require_core(agent)
+
+    result = await db.execute(
+        update(Agent)
+        .where(Agent.id == agent_id)
+        .values(disabled_at=None)
+        .returning(Agent.trust_level)
     )
+    trust_level = result.scalar_one_or_none()
+    if trust_level is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    conflict = await conflicting_job(db, agent_id, "unquarantine")
+    if conflict is not None:
+        await db.rollback()
+        return _job_conflict(conflict)
     await db.commit()
 
-    return {"success": True, "agent_id": str(agent_id), "status": "quarantined"}
+    # Original per-memory quality isn't kept; restore the write-time default for the agent's tier
+    restore_quality = -1 if trust_level == 0 else 0
+    job, start = await start_job(db, agent_id, "unquarantine")
+    if start:
+        background.add_task(run_quarantine_job, agent_id, "unquarantine", restore_quality)
+
+    return {"success": True, "agent_id": str(agent_id), "status": "active", "job": job}
+
+
+@router.get("/quarantine/{agent_id}")
+async def quarantine_status(
+    agent_id: uuid.UUID,
+    agent: Agent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_db),
+):
+    require_core(agent)
+    job = await get_job(db, agent_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No quarantine job for this agent")
+    return {"success": True, "agent_id": str(agent_id), "job": job}
+
+
+@router.post("/clusters/rebuild", status_code=202)
+async def rebuild_clusters(
+    background: BackgroundTasks,
+    agent: Agent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_db),
+):
+    require_core(agent)
+    job = clusters.new_job()
+    await set_config(db, clusters.JOB_KEY, json.dumps(job))
+    background.add_task(clusters.run_cluster_rebuild)
+    return {"success": True, "job": job}
+
+
+@router.get("/clusters/rebuild")
+async def rebuild_clusters_status(
+    agent: Agent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_db),
+):
+    require_core(agent)
+    job = await clusters.get_job(db)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No cluster rebuild has run")
+    return {"success": True, "job": job}
+
+
+async def _start_maintenance(background: BackgroundTasks, db: AsyncSession, steps: list[str]):
+    if await maintenance.is_running(db):
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "Maintenance already running", "job": await maintenance.get_job(db)},
+        )
+    job = maintenance.new_job(steps)
+    await set_config(db, maintenance.JOB_KEY, json.dumps(job))
+    background.add_task(maintenance.run_maintenance, steps)
+    return {"success": True, "job": job}
+
+
+@router.post("/recompute-quality", status_code=202)
+async def recompute_quality(
+    background: BackgroundTasks,
+    agent: Agent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_db),
+):
+    require_core(agent)
+    return await _start_maintenance(background, db, ["counters", "quality"])
+
+
+@router.post("/promote-trust", status_code=202)
+async def promote_trust(
+    background: BackgroundTasks,
+    agent: Agent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_db),
+):
+    require_core(agent)
+    return await _start_maintenance(background, db, ["counters", "trust"])
+
+
+@router.get("/maintenance")
+async def maintenance_status(
+    agent: Agent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_db),
+):
+    require_core(agent)
+    job = await maintenance.get_job(db)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No maintenance job has run")
+    return {"success": True, "job": job}
+
+
+@router.get("/vector-index")
+async def vector_index_health(agent: Agent = Depends(get_current_agent)):
+    require_core(agent)
+    return {"success": True, **await vector_index.health()}
+
+
+@router.post("/vector-index/reindex", status_code=202)
+async def reindex_vector_index(
+    background: BackgroundTasks,
+    force: bool = False,
+    agent: Agent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_db),
+):
+    require_core(agent)
+    if await vector_index.is_running(db):
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "Vector index rebuild already running", "job": await vector_index.get_job(db)},
+        )
+    report = await vector_index.health()
+    if not (force or report["reindex_recommended"]):
+        return JSONResponse({"success": True, "started": False, "health": report})
+
+    job = vector_index.new_job(report["reasons"] or ["forced"])
+    job["index_bytes_before"] = report["index_bytes"]
+    await set_config(db, vector_index.JOB_KEY, json.dumps(job))
+    background.add_task(vector_index.run_reindex, job, report)
+    return {"success": True, "started": True, "health": report, "job": job}
+
+
+@router.get("/vector-index/reindex")
+async def reindex_vector_index_status(
+    agent: Agent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_db),
+):
+    require_core(agent)
+    job = await vector_index.get_job(db)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No vector index rebuild has run")
+    return {"success": True, "job": job}
+
+
+@router.get("/slow-queries")
+async def slow_queries(
+    limit: int = Query(20, ge=1, le=1000),
+    agent: Agent = Depends(get_current_agent),
+):
+    require_core(agent)
+    # This worker's ring buffer, newest first; each API process keeps its own
+    return {"success": True, **slowlog.status(limit)}
+
+
+@router.delete("/slow-queries")
+async def clear_slow_queries(agent: Agent = Depends(get_current_agent)):
+    require_core(agent)
+    slowlog.clear()
+    return {"success": True}
+
+
+@router.get("/profiling")
+async def profiling_status(agent: Agent = Depends(get_current_agent)):
+    require_core(agent)
+    return {
+        "success": True,
+        "available": profiling.available(),
+        "sample_rate": await profiling.sample_rate.get(),
+        "profiles": profiling.list_profiles(),
+    }
+
+
+@router.put("/profiling")
+async def set_profiling_rate(
+    sample_rate: float = Query(..., ge=0, le=1),
+    agent: Agent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_db),
+):
+    require_core(agent)
+    if not profiling.available():
+        raise HTTPException(status_code=501, detail="Profiling needs the profiling extra (pyinstrument)")
+    await set_config(db, profiling.RATE_KEY, str(sample_rate))
+    # Other workers pick it up within profiling_rate_refresh seconds
+    profiling.sample_rate.set(sample_rate)
+    return {"success": True, "sample_rate": sample_rate}
+
+
+@router.get("/profiling/{profile_id}")
+async def get_profile(profile_id: str, agent: Agent = Depends(get_current_agent)):
+    require_core(agent)
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=path.name)
+
+
+@router.get("/export")
+async def export_corpus(
+    agents: bool = True,
+    agent: Agent = Depends(get_current_agent),
+):
+    require_core(agent)
+
+    async def body():
+        async with transfer.raw_connection() as conn:
+            async for chunk in transfer.export_ndjson(conn, agents=agents):
+                yield chunk
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@router.post("/import")
+async def import_corpus(
+    request: Request,
+    agent_id: uuid.UUID | None = None,
+    agent: Agent = Depends(get_current_agent),
+):
+    require_core(agent)
+    try:
+        async with transfer.raw_connection() as conn:
+            stats = await transfer.import_ndjson(conn, transfer.iter_lines(request.stream()), agent_id=agent_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return {"success": True, **stats}
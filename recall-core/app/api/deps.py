@@ -1,3 +1,3 @@
-from app.auth.middleware import get_db, get_current_agent
+from app.auth.middleware import get_db, get_current_agent, get_read_db
 
-__all__ = ["get_db", "get_current_agent"]
+__all__ = ["get_db", "get_current_agent", "get_read_db"]
@@ -1,8 +1,30 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app import search_node, warmup
+from app.config import settings
+from app.db.engine import pool_stats
+from app.embedding.client import embedding_client
+from app.ratelimit.breaker import breaker
+from app.ratelimit.local import local_limiter
 
 router = APIRouter()
 
 
 @router.get("/health")
 async def health():
-    return {"status": "ok", "protocol_version": "1.0.0"}
+    # 503 while warming up so load balancers hold traffic until pools and caches are warm
+    ready = warmup.state.ready
+    body = {
+        "status": "ok" if ready else "warming",
+        "ready": ready,
+        "protocol_version": "1.0.0",
+        "warmup": warmup.state.report(),
+        # Degraded, not down: with the breaker open requests still succeed on local fallbacks
+        "redis": {**breaker.status(), "local_rate_limiter": local_limiter.status()},
+        "embedding": embedding_client.status(),
+        "db_pool": pool_stats(),
+    }
+    if settings.search_node_enabled:
+        body["search_node"] = search_node.node.status()
+    return JSONResponse(body, status_code=200 if ready else 503)
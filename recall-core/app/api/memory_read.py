@@ -1,22 +1,46 @@
+import base64
+import binascii
 import hashlib
-import json
+import re
+import time
+import uuid
+from typing import Literal
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import JSONResponse
+import orjson
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.deps import get_db, get_current_agent
+from app import search_node
+from app.api.deps import get_db, get_current_agent, get_read_db
+from app.cache import etag_for, get_cached_memory, is_recent_write, set_cached_memory
+from app.config import settings
+from app.db import slowlog
+from app.db.engine import release
 from app.db.models import Agent
-from app.db.queries.memories import vector_search, get_memory_by_id_or_short
-from app.db.queries.retrieval import log_retrieval
+from app.db.queries.memories import (
+    get_memory_by_id_or_short,
+    get_search_rows_by_ids,
+    hybrid_search,
+    lexical_search,
+    vector_search,
+    vector_search_batch,
+)
+from app.db.queries.links import get_memory_graph
+from app.db.queries.retrieval import log_retrievals
 from app.embedding.client import embedding_client
+from app.ratelimit.breaker import RedisUnavailable
 from app.ratelimit.limiter import check_rate_limit, get_redis
 from app.schemas.memories import (
     AuthorInfo,
+    MemoryBatchSearchRequest,
+    MemoryBatchSearchResponse,
     MemoryDetail,
     MemoryGetResponse,
+    MemoryGraphResponse,
     MemorySearchResponse,
-    MemorySearchResult,
     RelatedMemory,
 )
 
@@ -24,19 +48,136 @@ router = APIRouter()
 
 SEARCH_CACHE_TTL = 120  # seconds
 
+SearchMode = Literal["vector", "hybrid", "lexical"]
+
+# A query made only of quoted phrases ("ERR_SSL_PROTOCOL", "numpy 2.0.1") is an
+# exact-identifier lookup: the lexical leg alone answers it, no embedding needed.
+_QUOTED_ONLY = re.compile(r'^\s*("[^"]+"\s*)+$')
+
+
+def _cache_keys(q: str, limit: int, mode: str) -> tuple[str, str]:
+    """(rendered body key, retrieval hits key) for a first-page search."""
+    h = hashlib.sha256(f"{q}:{limit}:{mode}".encode()).hexdigest()[:16]
+    return f"search_cache:{h}", f"search_hits:{h}"
+
+
+def _graph_cache_key(memory_id: str, depth: int, max_nodes: int, min_similarity: float) -> str:
+    return f"memory_graph:{memory_id}:{depth}:{max_nodes}:{min_similarity}"
 
-def _cache_key(q: str, limit: int) -> str:
+
+def _batch_cache_key(q: str, limit: int) -> str:
     h = hashlib.sha256(f"{q}:{limit}".encode()).hexdigest()[:16]
-    return f"search_cache:{h}"
+    return f"search_batch_cache:{h}"
+
+
+def _cursor_token() -> str:
+    # One per ranking, never derived from the query: a later search for the same q (any
+    # limit) stores its own list instead of replacing one that live cursors index into
+    return uuid.uuid4().hex[:16]
+
+
+def _encode_cursor(token: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{token}:{offset}".encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        token, offset = raw.split(":")
+        return token, int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def _run_search(
+    db: AsyncSession, q: str, limit: int, mode: SearchMode, collapse: bool = False, timings: dict | None = None
+) -> list[dict]:
+    if mode == "hybrid" and _QUOTED_ONLY.match(q):
+        mode = "lexical"
+    if mode == "lexical":
+        return await lexical_search(db, query=q, limit=limit, collapse=collapse)
+    t0 = time.perf_counter()
+    vector = await embedding_client.embed(q, settings.embedding_search_budget)
+    if timings is not None:
+        timings["embed"] = _ms(t0)
+    if mode == "hybrid":
+        return await hybrid_search(db, query=q, embedding=vector, limit=limit, collapse=collapse)
+    if search_node.node.ready and not collapse:
+        return await search_node.vector_search(db, embedding=vector, limit=limit)
+    return await vector_search(db, embedding=vector, limit=limit, collapse=collapse)
+
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 2)
+
+
+async def _explain_search(db: AsyncSession, q: str, limit: int, mode: SearchMode, collapse: bool) -> Response:
+    """Uncached search with every statement's plan and per-stage timings. Not logged as retrievals."""
+    timings = {"embed": 0.0}
+    t0 = time.perf_counter()
+    with slowlog.capture() as statements:
+        rows = await _run_search(db, q, limit, mode, collapse, timings=timings)
+    # EXPLAIN ANALYZE re-runs each statement; that time isn't the search's
+    timings["database"] = round(
+        _ms(t0) - timings["embed"] - sum(s["explain_ms"] for s in statements), 2
+    )
+    t1 = time.perf_counter()
+    results = [_render_result(row) for row in rows]
+    timings["render"] = _ms(t1)
+    timings["total"] = round(timings["embed"] + timings["database"] + timings["render"], 2)
+    return Response(
+        content=_render({
+            "success": True,
+            "query": q,
+            "results": results,
+            "next_cursor": None,
+            "explain": {"mode": mode, "timings_ms": timings, "statements": statements},
+        }),
+        media_type="application/json",
+    )
+
+
+def _render_result(row: dict) -> dict:
+    """Search row -> MemorySearchResult-shaped dict, ready for orjson."""
+    result = {
+        "id": row["id"],
+        "short_id": row["short_id"],
+        "content": row["content"],
+        "tags": row["tags"],
+        "source_url": row["source_url"],
+        "author": {"name": row["author_name"]},
+        "created_at": row["created_at"],
+        "similarity": row["similarity"],
+        "retrieval_count": row["retrieval_count"],
+    }
+    if "cluster_size" in row:
+        result["cluster_size"] = row["cluster_size"]
+    return result
+
+
+def _render(payload: dict) -> bytes:
+    # Server-built payloads skip pydantic; OPT_UTC_Z matches its "Z" datetime suffix.
+    # default=str covers asyncpg's own UUID type, which orjson doesn't recognize.
+    return orjson.dumps(payload, default=str, option=orjson.OPT_UTC_Z)
 
 
 @router.get("/memory/search", response_model=MemorySearchResponse)
 async def search_memories(
-    q: str = Query(..., min_length=1, max_length=500),
+    q: str | None = Query(None, min_length=1, max_length=500),
     limit: int = Query(10, ge=1, le=50),
+    mode: SearchMode = Query("vector"),
+    collapse: bool = Query(False),
+    cursor: str | None = Query(None, max_length=200),
+    explain: bool = Query(False),
     agent: Agent = Depends(get_current_agent),
     db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db),
 ):
+    if q is None and cursor is None:
+        raise HTTPException(status_code=422, detail="Either q or cursor is required")
+    if explain and agent.trust_level < 2:
+        raise HTTPException(status_code=403, detail="explain requires trust_level >= 2")
+
     allowed, retry_after = await check_rate_limit(str(agent.id), "memory:search", agent.trust_level)
     if not allowed:
         return JSONResponse(
@@ -45,56 +186,205 @@ async def search_memories(
             headers={"Retry-After": str(retry_after)},
         )
 
-    # Check cache
+    if explain:
+        if q is None:
+            raise HTTPException(status_code=422, detail="explain needs q")
+        return await _explain_search(read_db, q, limit, mode, collapse)
+
     r = await get_redis()
-    ck = _cache_key(q, limit)
-    cached = await r.get(ck)
+    if cursor is not None:
+        return await _search_page(db, read_db, r, agent, cursor, limit)
+
+    # Collapsed and full rankings are cached and paged separately
+    variant = f"{mode}:collapse" if collapse else mode
 
-    if cached:
-        rows = json.loads(cached)
+    # Cache holds the rendered response body plus (id, similarity) hits for logging,
+    # so a hit is returned as-is with no parsing, validation or re-serialization.
+    body_key, hits_key = _cache_keys(q, limit, variant)
+    try:
+        body, hits = await r.mget(body_key, hits_key)
+    except RedisUnavailable:
+        body = hits = None
+
+    if body is not None and hits is not None:
+        hits = orjson.loads(hits)
     else:
-        vector = await embedding_client.embed(q)
-        rows = await vector_search(db, embedding=vector, limit=limit)
-        # Serialize for cache (convert datetimes to strings)
-        for row in rows:
-            row["created_at"] = row["created_at"].isoformat() if hasattr(row["created_at"], "isoformat") else row["created_at"]
-            row["id"] = str(row["id"])
-        await r.set(ck, json.dumps(rows), ex=SEARCH_CACHE_TTL)
+        # Rank the deeper candidate list in the same query (the ANN step fetches
+        # vector_candidates anyway) so later pages skip embed + ANN
+        ranked = await _run_search(
+            read_db, q, max(limit, settings.search_cursor_candidates), mode, collapse
+        )
+        # Read work is done; a request must not hold this connection while waiting for another
+        await release(read_db)
+        rows = ranked[:limit]
+        token = _cursor_token()
+        next_cursor = _encode_cursor(token, limit) if len(ranked) > limit else None
+        body = _render({
+            "success": True,
+            "query": q,
+            "results": [_render_result(row) for row in rows],
+            "next_cursor": next_cursor,
+        })
+        hits = [[row["id"], row["similarity"]] for row in rows]
+        pipe = r.pipeline()
+        pipe.set(body_key, body, ex=SEARCH_CACHE_TTL)
+        pipe.set(hits_key, orjson.dumps(hits, default=str), ex=SEARCH_CACHE_TTL)
+        if next_cursor is not None:
+            candidates = {"q": q, "items": _cursor_items(ranked)}
+            pipe.set(f"search_cursor:{token}", orjson.dumps(candidates), ex=settings.search_cursor_ttl)
+        try:
+            await pipe.execute()
+        except RedisUnavailable:
+            pass
 
     # Log retrieval events (always, even on cache hit)
-    for row in rows:
-        await log_retrieval(
-            db,
-            agent_id=agent.id,
-            memory_id=row["id"],
-            query=q,
-            similarity=row["similarity"],
+    await log_retrievals(
+        db,
+        agent_id=agent.id,
+        events=[{"memory_id": mid, "query": q, "similarity": sim} for mid, sim in hits],
+    )
+
+    return Response(content=body, media_type="application/json")
+
+
+def _cursor_items(rows: list[dict]) -> list[list]:
+    # Items are [id, similarity] or, collapsed, [id, similarity, cluster_size]
+    return [[str(row["id"]), row["similarity"], *([row["cluster_size"]] if "cluster_size" in row else [])] for row in rows]
+
+
+async def _search_page(
+    db: AsyncSession, read_db: AsyncSession, r: redis.Redis, agent: Agent, cursor: str, limit: int
+):
+    """Serve a follow-up page from the cached candidate list: one Redis read + one PK fetch."""
+    token, offset = _decode_cursor(cursor)
+    try:
+        raw = await r.get(f"search_cursor:{token}")
+    except RedisUnavailable:
+        raw = None
+    if raw is None:
+        raise HTTPException(status_code=410, detail="Cursor expired, repeat the search")
+    candidates = orjson.loads(raw)
+    q = candidates["q"]
+    items = candidates["items"][offset:offset + limit]
+
+    found = await get_search_rows_by_ids(read_db, [uuid.UUID(item[0]) for item in items])
+    await release(read_db)
+    rows = []
+    for mid, sim, *cluster_size in items:
+        row = found.get(uuid.UUID(mid))
+        if row is not None:
+            rows.append({**row, "similarity": sim})
+            if cluster_size:
+                rows[-1]["cluster_size"] = cluster_size[0]
+
+    await log_retrievals(
+        db,
+        agent_id=agent.id,
+        events=[{"memory_id": row["id"], "query": q, "similarity": row["similarity"]} for row in rows],
+    )
+
+    next_offset = offset + limit
+    next_cursor = _encode_cursor(token, next_offset) if next_offset < len(candidates["items"]) else None
+    return Response(
+        content=_render({
+            "success": True,
+            "query": q,
+            "results": [_render_result(row) for row in rows],
+            "next_cursor": next_cursor,
+        }),
+        media_type="application/json",
+    )
+
+
+@router.post("/memory/search/batch", response_model=MemoryBatchSearchResponse)
+async def search_memories_batch(
+    body: MemoryBatchSearchRequest,
+    agent: Agent = Depends(get_current_agent),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db),
+):
+    if len(body.queries) > settings.batch_search_max_queries:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.batch_search_max_queries} queries per batch",
         )
 
-    return MemorySearchResponse(
-        query=q,
-        results=[
-            MemorySearchResult(
-                id=row["id"],
-                short_id=row["short_id"],
-                content=row["content"],
-                tags=row["tags"],
-                source_url=row["source_url"],
-                author=AuthorInfo(name=row["author_name"]),
-                created_at=row["created_at"],
-                similarity=row["similarity"],
-                retrieval_count=row["retrieval_count"],
-            )
-            for row in rows
+    # Each query in the batch counts as one search against the usual limits
+    allowed, retry_after = await check_rate_limit(
+        str(agent.id), "memory:search", agent.trust_level, cost=len(body.queries)
+    )
+    if not allowed:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Rate limit exceeded for search", "retry_after": retry_after},
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    # Per-query rendered result lists; only misses are embedded and searched
+    r = await get_redis()
+    keys = [_batch_cache_key(q, body.limit) for q in body.queries]
+    try:
+        cached = await r.mget(keys)
+    except RedisUnavailable:
+        cached = [None] * len(keys)
+    per_query: list[list[dict] | None] = [orjson.loads(c) if c else None for c in cached]
+
+    misses = [i for i, results in enumerate(per_query) if results is None]
+    if misses:
+        vectors = await embedding_client.embed_many(
+            [body.queries[i] for i in misses], settings.embedding_search_budget
+        )
+        found = await vector_search_batch(read_db, embeddings=vectors, limit=body.limit)
+        await release(read_db)
+        pipe = r.pipeline()
+        for i, rows in zip(misses, found):
+            per_query[i] = [_render_result(row) for row in rows]
+            pipe.set(keys[i], _render(per_query[i]), ex=SEARCH_CACHE_TTL)
+        try:
+            await pipe.execute()
+        except RedisUnavailable:
+            pass
+
+    await log_retrievals(
+        db,
+        agent_id=agent.id,
+        events=[
+            {"memory_id": m["id"], "query": q, "similarity": m["similarity"]}
+            for q, results in zip(body.queries, per_query)
+            for m in results
         ],
     )
 
+    merged = None
+    if body.merge:
+        best: dict[str, dict] = {}
+        for results in per_query:
+            for m in results:
+                mid = str(m["id"])
+                if mid not in best or m["similarity"] > best[mid]["similarity"]:
+                    best[mid] = m
+        merged = sorted(best.values(), key=lambda m: m["similarity"], reverse=True)
+
+    return Response(
+        content=_render({
+            "success": True,
+            "searches": [
+                {"success": True, "query": q, "results": results, "next_cursor": None}
+                for q, results in zip(body.queries, per_query)
+            ],
+            "merged": merged,
+        }),
+        media_type="application/json",
+    )
+
 
 @router.get("/memory/{memory_id}", response_model=MemoryGetResponse)
 async def get_memory(
     memory_id: str,
+    request: Request,
     agent: Agent = Depends(get_current_agent),
     db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db),
 ):
     allowed, retry_after = await check_rate_limit(str(agent.id), "memory:get", agent.trust_level)
     if not allowed:
@@ -104,19 +394,104 @@ async def get_memory(
             headers={"Retry-After": str(retry_after)},
         )
 
-    data = await get_memory_by_id_or_short(db, memory_id)
-    if data is None:
-        raise HTTPException(status_code=404, detail="Memory not found")
-
-    return MemoryGetResponse(
-        memory=MemoryDetail(
-            id=data["id"],
-            short_id=data["short_id"],
-            content=data["content"],
-            tags=data["tags"],
-            source_url=data["source_url"],
-            author=AuthorInfo(name=data["author_name"]),
-            created_at=data["created_at"],
-            related=[RelatedMemory(**r) for r in data["related"]],
+    try:
+        memory_id = str(uuid.UUID(memory_id))
+    except ValueError:
+        pass
+
+    body = await get_cached_memory(memory_id)
+    if body is None:
+        # Read-your-writes: the author's just-written memory may not be on replicas yet
+        session = db if await is_recent_write(str(agent.id), memory_id) else read_db
+        data = await get_memory_by_id_or_short(session, memory_id)
+        await release(session)
+        if data is None:
+            raise HTTPException(status_code=404, detail="Memory not found")
+
+        body = MemoryGetResponse(
+            memory=MemoryDetail(
+                id=data["id"],
+                short_id=data["short_id"],
+                content=data["content"],
+                tags=data["tags"],
+                source_url=data["source_url"],
+                author=AuthorInfo(name=data["author_name"]),
+                created_at=data["created_at"],
+                related=[RelatedMemory(**r) for r in data["related"]],
+            )
+        ).model_dump_json().encode()
+        await set_cached_memory(str(data["id"]), data["short_id"], body)
+
+    etag = etag_for(body)
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+@router.get("/memory/{memory_id}/graph", response_model=MemoryGraphResponse)
+async def get_memory_graph_view(
+    memory_id: str,
+    depth: int = Query(2, ge=1),
+    max_nodes: int = Query(50, ge=1),
+    min_similarity: float | None = Query(None, ge=0, le=1),
+    agent: Agent = Depends(get_current_agent),
+    read_db: AsyncSession = Depends(get_read_db),
+):
+    if depth > settings.graph_max_depth or max_nodes > settings.graph_max_nodes:
+        raise HTTPException(
+            status_code=422,
+            detail=f"depth <= {settings.graph_max_depth} and max_nodes <= {settings.graph_max_nodes}",
         )
+
+    # A walk costs roughly one get per hop
+    allowed, retry_after = await check_rate_limit(
+        str(agent.id), "memory:get", agent.trust_level, cost=depth
     )
+    if not allowed:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Rate limit exceeded", "retry_after": retry_after},
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    try:
+        memory_id = str(uuid.UUID(memory_id))
+    except ValueError:
+        pass
+    if min_similarity is None:
+        min_similarity = settings.graph_min_similarity
+
+    # Links are only ever added, so a short TTL bounds staleness without invalidation
+    r = await get_redis()
+    key = _graph_cache_key(memory_id, depth, max_nodes, min_similarity)
+    try:
+        body = await r.get(key)
+    except RedisUnavailable:
+        body = None
+    if body is None:
+        try:
+            graph = await get_memory_graph(
+                read_db,
+                memory_id,
+                depth=depth,
+                max_nodes=max_nodes,
+                min_similarity=min_similarity,
+                timeout_ms=settings.graph_statement_timeout_ms,
+            )
+        except DBAPIError as exc:
+            await read_db.rollback()
+            if getattr(exc.orig, "sqlstate", None) == "57014":  # query_canceled
+                raise HTTPException(
+                    status_code=422, detail="Graph walk too expensive, lower depth or max_nodes"
+                )
+            raise
+        if graph is None:
+            raise HTTPException(status_code=404, detail="Memory not found")
+
+        body = MemoryGraphResponse(root=memory_id, depth=depth, **graph).model_dump_json().encode()
+        try:
+            await r.set(key, body, ex=settings.graph_cache_ttl)
+        except RedisUnavailable:
+            pass
+
+    return Response(content=body, media_type="application/json")
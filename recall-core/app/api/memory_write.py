@@ -3,9 +3,11 @@ from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_db, get_current_agent
+from app.cache import mark_recent_write
 from app.config import settings
+from app.db.engine import release
 from app.db.models import Agent
-from app.db.queries.memories import insert_memory
+from app.db.queries.memories import find_exact_duplicate, find_near_duplicate, insert_memory
 from app.db.queries.system import is_write_enabled
 from app.embedding.client import embedding_client
 from app.ratelimit.limiter import check_rate_limit
@@ -32,8 +34,45 @@ async def write_memory(
         )
 
     quality = -1 if agent.trust_level == 0 else 0
+    embedding_model = f"openai/{settings.embedding_model}"
 
-    vector = await embedding_client.embed(body.content)
+    # Exact-duplicate fast path: a whitespace-normalized hash hit skips the embed call
+    duplicate_of = None
+    original = None
+    if settings.exact_duplicate_policy != "off":
+        original = await find_exact_duplicate(db, body.content)
+    if original is not None and settings.exact_duplicate_policy == "reject":
+        return JSONResponse(
+            status_code=409,
+            content={
+                "detail": "Exact duplicate of an existing memory",
+                "duplicate_of": original.short_id,
+            },
+        )
+
+    # Trust-0 near-duplicates (SimHash): same policies, still ahead of the embed call. The
+    # text differs (a small edit can flip its meaning), so the new content is still embedded
+    near = None
+    if original is None and agent.trust_level == 0 and settings.near_duplicate_policy != "off":
+        near = await find_near_duplicate(db, body.content)
+        if near is not None and settings.near_duplicate_policy == "reject":
+            return JSONResponse(
+                status_code=409,
+                content={
+                    "detail": "Near duplicate of an existing memory",
+                    "duplicate_of": near.short_id,
+                },
+            )
+        if near is not None:
+            duplicate_of = near.id
+
+    if original is not None and original.embedding_model == embedding_model:
+        vector = [float(v) for v in original.embedding]
+        duplicate_of = original.id
+    else:
+        # The duplicate checks are done: no connection held across the provider call
+        await release(db)
+        vector = await embedding_client.embed(body.content, settings.embedding_write_budget)
 
     memory, similar = await insert_memory(
         db,
@@ -42,10 +81,14 @@ async def write_memory(
         tags=body.tags,
         source_url=body.source_url,
         embedding=vector,
-        embedding_model=f"openai/{settings.embedding_model}",
+        embedding_model=embedding_model,
         quality=quality,
+        duplicate_of=duplicate_of,
     )
 
+    if settings.read_database_urls:
+        await mark_recent_write(str(agent.id), str(memory.id), memory.short_id)
+
     return MemoryWriteResponse(
         id=memory.id,
         short_id=memory.short_id,
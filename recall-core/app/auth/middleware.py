@@ -3,7 +3,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.keys import hash_api_key
-from app.db.engine import async_session
+from app.db.engine import async_session, read_router, release
 from app.db.models import Agent
 
 
@@ -12,6 +12,12 @@ async def get_db():
         yield session
 
 
+async def get_read_db():
+    """Session on a healthy read replica (primary if none). Read-only work only."""
+    async with read_router.session() as session:
+        yield session
+
+
 async def get_current_agent(
     request: Request,
     db: AsyncSession = Depends(get_db),
@@ -31,4 +37,7 @@ async def get_current_agent(
     if agent.disabled_at is not None:
         raise HTTPException(status_code=403, detail="Agent is disabled")
 
+    # Don't sit on a pooled connection while the handler awaits Redis or the embedding
+    # provider; its next statement checks one out again
+    await release(db)
     return agent
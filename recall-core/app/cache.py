@@ -0,0 +1,145 @@
+"""Redis caches around memory reads: rendered GET /memory/{id} bodies, read-your-writes
+marks, and targeted purging of search-cache entries.
+
+Memory content is immutable after write, so a rendered body only goes stale
+when its outgoing links change or the memory is quarantined. Entries are
+stored under both the UUID and the short_id so either lookup form hits.
+
+While Redis is unavailable (app.ratelimit.breaker) reads miss and writes are
+skipped. Invalidations from the request path are kept in process and retried
+before the next cached read, so a lost DEL can't pin a stale body for a TTL.
+"""
+
+import hashlib
+import logging
+import re
+from collections.abc import Iterable
+
+from app.config import settings
+from app.ratelimit.breaker import RedisUnavailable
+from app.ratelimit.limiter import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Cache keys whose invalidation failed while Redis was down, oldest first
+_pending_invalidations: dict[str, None] = {}
+_MAX_PENDING = 10_000
+
+
+def _key(id_or_short: str) -> str:
+    return f"memory_cache:{id_or_short}"
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+async def get_cached_memory(id_or_short: str) -> bytes | None:
+    r = await get_redis()
+    try:
+        if _pending_invalidations:
+            await _flush_pending(r)
+        return await r.get(_key(id_or_short))
+    except RedisUnavailable:
+        return None
+
+
+async def set_cached_memory(memory_id: str, short_id: str, body: bytes) -> None:
+    r = await get_redis()
+    pipe = r.pipeline()
+    pipe.set(_key(memory_id), body, ex=settings.memory_cache_ttl)
+    pipe.set(_key(short_id), body, ex=settings.memory_cache_ttl)
+    try:
+        await pipe.execute()
+    except RedisUnavailable:
+        pass
+
+
+async def invalidate_memories(ids_and_short_ids: Iterable[str], defer: bool = False) -> None:
+    """Drop cached bodies. With `defer`, a Redis outage queues the keys instead of raising."""
+    keys = [_key(str(k)) for k in ids_and_short_ids]
+    if not keys:
+        return
+    r = await get_redis()
+    try:
+        await r.delete(*keys)
+    except RedisUnavailable:
+        if not defer:
+            raise
+        for key in keys:
+            _pending_invalidations[key] = None
+        while len(_pending_invalidations) > _MAX_PENDING:
+            dropped = next(iter(_pending_invalidations))
+            del _pending_invalidations[dropped]
+            logger.warning("pending cache invalidations full, dropped %s", dropped)
+
+
+async def _flush_pending(r) -> None:
+    keys = list(_pending_invalidations)
+    await r.delete(*keys)
+    for key in keys:
+        _pending_invalidations.pop(key, None)
+
+
+def _ryw_key(agent_id: str, id_or_short: str) -> str:
+    return f"ryw:{agent_id}:{id_or_short}"
+
+
+async def mark_recent_write(agent_id: str, memory_id: str, short_id: str) -> None:
+    """Route this agent's reads of its new memory to the primary until replicas catch up."""
+    r = await get_redis()
+    pipe = r.pipeline()
+    pipe.set(_ryw_key(agent_id, memory_id), 1, ex=settings.read_your_writes_ttl)
+    pipe.set(_ryw_key(agent_id, short_id), 1, ex=settings.read_your_writes_ttl)
+    try:
+        await pipe.execute()
+    except RedisUnavailable:
+        pass
+
+
+async def is_recent_write(agent_id: str, id_or_short: str) -> bool:
+    r = await get_redis()
+    try:
+        return bool(await r.exists(_ryw_key(agent_id, id_or_short)))
+    except RedisUnavailable:
+        # Unknown: read from the primary, which always has the write
+        return True
+
+
+_UUID_RE = re.compile(rb"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+# Search-cache key families whose values embed result memory ids. A first-page
+# body (search_cache) is dropped together with its search_hits entry.
+_SEARCH_PREFIXES = ("search_hits:", "search_cursor:", "search_batch_cache:")
+
+
+async def purge_search_cache(memory_ids: Iterable[str]) -> int:
+    """Delete cached searches that reference any of `memory_ids`. Returns keys deleted."""
+    targets = {str(m).encode() for m in memory_ids}
+    if not targets:
+        return 0
+    r = await get_redis()
+    deleted = 0
+    for prefix in _SEARCH_PREFIXES:
+        async for batch in _scan_batches(r, prefix + "*"):
+            values = await r.mget(batch)
+            stale = []
+            for key, value in zip(batch, values):
+                if value is not None and targets.intersection(_UUID_RE.findall(value)):
+                    stale.append(key)
+                    if prefix == "search_hits:":
+                        stale.append(b"search_cache:" + key[len(prefix):])
+            if stale:
+                deleted += await r.delete(*stale)
+    return deleted
+
+
+async def _scan_batches(r, pattern: str, count: int = 500):
+    batch = []
+    async for key in r.scan_iter(match=pattern, count=count):
+        batch.append(key)
+        if len(batch) >= count:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,93 @@
+"""Circuit breaker shared by the Redis client and the embedding providers.
+
+closed: calls go through; `<config>_breaker_failures` consecutive failures open
+the breaker. open: `acquire()` raises `error` without touching the network for
+`<config>_breaker_reset_seconds`. half-open: one probe call goes through; its
+success closes the breaker, its failure opens it again.
+
+Callers bracket each call with `acquire()` and one of `success()`,
+`failure(exc)` or `release()` (neither: cancelled, or an outcome that says
+nothing about the dependency's health).
+"""
+
+import logging
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, error: type[Exception], config: str | None = None):
+        self.name = name
+        # Settings prefix, when breakers of several instances share their thresholds
+        self.config = config or name
+        self.error = error
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        # Counters since process start, for /health
+        self.trips = 0
+        self.failures = 0
+        self.rejected = 0
+        self.last_error: str | None = None
+
+    @property
+    def reset_seconds(self) -> float:
+        return getattr(settings, f"{self.config}_breaker_reset_seconds")
+
+    def allows(self) -> bool:
+        """Whether `acquire()` would let a call through right now."""
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_seconds
+        return not (self.state == HALF_OPEN and self._probing)
+
+    def acquire(self) -> None:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                self.rejected += 1
+                raise self.error(f"{self.name} circuit open")
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            # One probe at a time; everything else keeps failing fast until it returns
+            if self._probing:
+                self.rejected += 1
+                raise self.error(f"{self.name} circuit half-open")
+            self._probing = True
+
+    def success(self) -> None:
+        if self.state != CLOSED:
+            logger.info("%s circuit closed", self.name)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def failure(self, exc: BaseException) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = (str(exc) or type(exc).__name__)[:200]
+        self._probing = False
+        threshold = getattr(settings, f"{self.config}_breaker_failures")
+        if self.state == HALF_OPEN or self.consecutive_failures >= threshold:
+            if self.state != OPEN:
+                self.trips += 1
+                logger.warning("%s circuit open: %s", self.name, self.last_error)
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        self._probing = False
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "trips": self.trips,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+        }
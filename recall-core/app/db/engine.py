@@ -1,6 +1,149 @@
+import asyncio
+import itertools
+import time
+
+from sqlalchemy import exc as sa_exc
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.config import settings
+from app.db import slowlog
+
+# An HNSW scan returns at most hnsw.ef_search rows, so it bounds every candidate list
+_CONNECT_ARGS = {"server_settings": {"hnsw.ef_search": str(settings.hnsw_ef_search)}}
+
+slowlog.install()
+
+
+class TimedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long checkouts wait for a connection (free or new)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.timeouts = 0
+
+    def connect(self):
+        t0 = time.perf_counter()
+        try:
+            conn = super().connect()
+        except sa_exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        ms = (time.perf_counter() - t0) * 1000
+        self.checkouts += 1
+        self.wait_ms_total += ms
+        self.wait_ms_max = max(self.wait_ms_max, ms)
+        # Under a millisecond is a connection that was sitting idle in the pool
+        if ms >= 1:
+            self.waits += 1
+        return conn
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "overflow": max(0, self.overflow()),
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "wait_ms_avg": round(self.wait_ms_total / self.checkouts, 3) if self.checkouts else 0.0,
+            "wait_ms_max": round(self.wait_ms_max, 3),
+            "timeouts": self.timeouts,
+        }
+
+
+def _stats(pool) -> dict:
+    return pool.stats() if isinstance(pool, TimedPool) else {"status": pool.status()}
+
+
+def pool_stats() -> dict:
+    """Checkout wait metrics of the primary and replica pools, for /health."""
+    return {
+        "primary": _stats(engine.pool),
+        "replicas": [_stats(e.pool) for e in read_router.engines],
+    }
+
+
+async def release(session: AsyncSession) -> None:
+    """Hand the session's pooled connection back before awaiting something slow (network, provider).
 
-engine = create_async_engine(settings.database_url, pool_size=10, max_overflow=5)
+    Ends the open transaction; the next statement checks a connection out again. Loaded
+    objects stay usable since sessions don't expire on commit.
+    """
+    if session.in_transaction():
+        await session.commit()
+
+
+engine = create_async_engine(
+    settings.database_url, pool_size=10, max_overflow=5, poolclass=TimedPool, connect_args=_CONNECT_ARGS
+)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+# Replay lag in seconds; 0 when the replica has replayed everything it received
+# (an idle primary would otherwise look infinitely behind).
+_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class ReplicaRouter:
+    """Round-robin over healthy read replicas, falling back to the primary.
+
+    Health is refreshed by `check()`: a replica is usable while it answers
+    within `read_replica_check_timeout` and lags by at most `read_replica_max_lag`.
+    """
+
+    def __init__(self, urls: list[str]):
+        self.engines = [
+            create_async_engine(
+                url,
+                pool_size=settings.read_pool_size,
+                max_overflow=settings.read_max_overflow,
+                pool_pre_ping=True,
+                poolclass=TimedPool,
+                connect_args=_CONNECT_ARGS,
+            )
+            for url in urls
+        ]
+        self._sessions = [
+            async_sessionmaker(e, class_=AsyncSession, expire_on_commit=False) for e in self.engines
+        ]
+        self.healthy = [True] * len(urls)
+        self._rr = itertools.count()
+
+    def session(self) -> AsyncSession:
+        n = len(self._sessions)
+        for _ in range(n):
+            i = next(self._rr) % n
+            if self.healthy[i]:
+                return self._sessions[i]()
+        return async_session()
+
+    async def _probe(self, i: int) -> bool:
+        try:
+            async with asyncio.timeout(settings.read_replica_check_timeout):
+                async with self.engines[i].connect() as conn:
+                    lag = await conn.scalar(_LAG_SQL)
+        except Exception:
+            return False
+        return lag is None or float(lag) <= settings.read_replica_max_lag
+
+    async def check(self) -> None:
+        self.healthy = list(await asyncio.gather(*(self._probe(i) for i in range(len(self.engines)))))
+
+    async def monitor(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(settings.read_replica_check_interval)
+
+    async def dispose(self) -> None:
+        for e in self.engines:
+            await e.dispose()
+
+
+read_router = ReplicaRouter(settings.read_database_urls)
@@ -3,15 +3,19 @@ from datetime import datetime, timezone
 
 from pgvector.sqlalchemy import Vector
 from sqlalchemy import (
+    BigInteger,
     Boolean,
+    Computed,
     DateTime,
     ForeignKey,
+    Identity,
     Index,
+    Integer,
     SmallInteger,
     Text,
     text,
 )
-from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR, UUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 from app.config import settings
@@ -33,6 +37,12 @@ class Agent(Base):
     disabled_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     trust_level: Mapped[int] = mapped_column(SmallInteger, nullable=False, default=0)
     notes: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Maintained by app.jobs.maintenance / quarantine; read by trust promotion.
+    # retrieved_memories: own memories retrieved by at least one other agent
+    retrieved_memories: Mapped[int] = mapped_column(
+        Integer, nullable=False, server_default=text("0")
+    )
+    quarantine_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
 
     __table_args__ = (Index("ix_agents_name", "name"),)
 
@@ -46,23 +56,37 @@ class Memory(Base):
         UUID(as_uuid=True), ForeignKey("agents.id"), nullable=False
     )
     content: Mapped[str] = mapped_column(Text, nullable=False)
+    content_hash: Mapped[str] = mapped_column(Text, nullable=False)
+    simhash: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    simhash_bands: Mapped[list[int] | None] = mapped_column(ARRAY(Integer), nullable=True)
     tags: Mapped[list[str]] = mapped_column(ARRAY(Text), nullable=False, server_default=text("'{}'"))
     source_url: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), nullable=False, server_default=text("now()")
     )
     embedding = mapped_column(Vector(settings.embedding_dim), nullable=False)
+    content_tsv = mapped_column(
+        TSVECTOR, Computed("to_tsvector('english', content)", persisted=True)
+    )
     embedding_model: Mapped[str] = mapped_column(Text, nullable=False)
     quality: Mapped[int] = mapped_column(SmallInteger, nullable=False, default=0)
+    # Retrieval events folded in by app.jobs.maintenance (lags retrieval_events slightly)
+    retrieval_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
     duplicate_of: Mapped[uuid.UUID | None] = mapped_column(
         UUID(as_uuid=True), ForeignKey("memories.id"), nullable=True
     )
+    # Duplicate cluster label: id of the cluster's oldest memory (own id when alone)
+    cluster_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
 
     __table_args__ = (
         Index("ix_memories_tags", "tags", postgresql_using="gin"),
         Index("ix_memories_created_at", "created_at"),
         Index("ix_memories_agent_id", "agent_id"),
         Index("ix_memories_quality", "quality"),
+        Index("ix_memories_content_tsv", "content_tsv", postgresql_using="gin"),
+        Index("ix_memories_content_hash", "content_hash"),
+        Index("ix_memories_simhash_bands", "simhash_bands", postgresql_using="gin"),
+        Index("ix_memories_cluster_id", "cluster_id"),
     )
 
 
@@ -113,9 +137,12 @@ class RetrievalEvent(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), nullable=False, server_default=text("now()")
     )
+    # Insert order, for watermark-based incremental processing
+    seq: Mapped[int] = mapped_column(BigInteger, Identity(always=True), nullable=False)
 
     __table_args__ = (
         Index("ix_retrieval_events_memory_id", "memory_id"),
+        Index("ix_retrieval_events_seq", "seq", unique=True),
         Index("ix_retrieval_events_agent_id", "agent_id"),
         Index("ix_retrieval_events_created_at", "created_at"),
     )
@@ -0,0 +1,78 @@
+"""Per-partition ANN fan-out for a hash-partitioned memories table (app.jobs.partition).
+
+On a partitioned table, one ORDER BY embedding <=> q LIMIT k walks the HNSW
+index of every partition in turn inside a single backend. The fan-out runs
+each partition's top-k concurrently instead, every query on its own pooled
+connection of the session's engine (primary or replica), and merges them by
+similarity. The session's own connection goes back to the pool first, and
+no more queries run at once than the pool holds, so a search never waits
+on checkouts it is itself blocking. Partition names are cached per engine for PARTITION_CACHE_TTL
+seconds, so a conversion is picked up without a restart.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.engine import release
+
+PARTITION_CACHE_TTL = 60.0
+# pgvector's default; fewer candidates per graph walk costs recall for little speed
+MIN_EF_SEARCH = 40
+
+_cache: dict[str, tuple[float, list[str]]] = {}
+
+
+def clear_partition_cache() -> None:
+    _cache.clear()
+
+
+async def partition_names(db: AsyncSession) -> list[str]:
+    """Leaf partitions of memories, [] while it is a plain table."""
+    key = str(db.bind.url)
+    cached = _cache.get(key)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    rows = await db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+        " WHERE i.inhparent = to_regclass('memories') ORDER BY c.relname"
+    ))
+    names = [r[0] for r in rows]
+    _cache[key] = (time.monotonic() + PARTITION_CACHE_TTL, names)
+    return names
+
+
+async def fanout_ann(db: AsyncSession, names: list[str], vec_literal: str, limit: int) -> tuple[list, list]:
+    """Nearest `limit` live memories over all partitions: (ids, similarities), best first.
+
+    Rows are spread evenly by the id hash, so each partition is asked for its
+    share of `limit` times partition_fanout_overfetch, with hnsw.ef_search
+    lowered to match: the per-partition scans stay as cheap as the share.
+    """
+    share = min(limit, math.ceil(limit * settings.partition_fanout_overfetch / len(names)))
+    ef_search = max(share, MIN_EF_SEARCH)
+    size = getattr(db.bind.pool, "size", None)
+    concurrency = settings.partition_fanout_concurrency
+    limiter = asyncio.Semaphore(min(concurrency, size()) if callable(size) else concurrency)
+    # The catalog lookup is done: don't sit on a connection the fan-out may need
+    await release(db)
+
+    async def top(name: str):
+        async with limiter, db.bind.connect() as conn:
+            await conn.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"))
+            rows = await conn.execute(text(
+                f"SELECT id, 1 - (embedding <=> CAST(:vec AS vector)) AS similarity FROM {name}"
+                " WHERE quality > -2"
+                " ORDER BY embedding <=> CAST(:vec AS vector) LIMIT :k"
+            ).bindparams(vec=vec_literal, k=share))
+            return rows.fetchall()
+
+    results = await asyncio.gather(*(top(name) for name in names))
+    best = heapq.nlargest(limit, itertools.chain.from_iterable(results), key=lambda r: r.similarity)
+    return [r.id for r in best], [float(r.similarity) for r in best]
@@ -1,8 +1,11 @@
+import json
 import uuid
 
+from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.models import MemoryLink
+from app.cache import invalidate_memories
+from app.db.models import Memory, MemoryLink
 
 
 async def create_link(
@@ -21,4 +24,80 @@ async def create_link(
     )
     db.add(link)
     await db.commit()
+    short_id = await db.scalar(select(Memory.short_id).where(Memory.id == memory_id))
+    await invalidate_memories([memory_id, short_id] if short_id else [memory_id], defer=True)
     return link
+
+
+async def get_memory_graph(
+    db: AsyncSession,
+    id_or_short: str,
+    *,
+    depth: int,
+    max_nodes: int,
+    min_similarity: float,
+    timeout_ms: int,
+) -> dict | None:
+    """Walk memory_links both ways from a memory, up to `depth` hops, in one statement.
+
+    Each hop is two index lookups (ix_memory_links_memory_id for outgoing,
+    ix_memory_links_related_id for incoming); links below `min_similarity`
+    and quarantined memories are not followed. The walk dedups on
+    (id, depth), so a level never holds more rows than distinct memories.
+    The closest `max_nodes` memories are kept, with every qualifying link
+    among them. Bounded by a transaction-local statement_timeout.
+    """
+    try:
+        val = uuid.UUID(id_or_short)
+        where = "id = :val"
+    except ValueError:
+        val = id_or_short
+        where = "short_id = :val"
+
+    await db.execute(
+        text("SELECT set_config('statement_timeout', :ms, true)").bindparams(ms=str(timeout_ms))
+    )
+    stmt = text(
+        "WITH RECURSIVE walk(id, depth) AS ("
+        f"  SELECT id, 0 FROM memories WHERE {where} AND quality > -2"
+        "  UNION"
+        "  SELECT n.id, w.depth + 1 FROM walk w"
+        "  CROSS JOIN LATERAL ("
+        "    SELECT related_id AS id FROM memory_links"
+        "    WHERE memory_id = w.id AND similarity >= :min_sim"
+        "    UNION"
+        "    SELECT memory_id FROM memory_links"
+        "    WHERE related_id = w.id AND similarity >= :min_sim"
+        "  ) n"
+        "  JOIN memories m ON m.id = n.id AND m.quality > -2"
+        "  WHERE w.depth < :depth"
+        "), reached AS ("
+        "  SELECT id, min(depth) AS depth FROM walk GROUP BY id"
+        "), nodes AS ("
+        "  SELECT id, depth FROM reached ORDER BY depth, id LIMIT :max_nodes"
+        ")"
+        " SELECT"
+        " (SELECT count(*) FROM reached) AS reached,"
+        " (SELECT coalesce(json_agg(json_build_object("
+        "     'id', m.id, 'short_id', m.short_id, 'content', m.content,"
+        "     'tags', m.tags, 'depth', n.depth) ORDER BY n.depth, m.created_at), '[]'::json)"
+        "  FROM nodes n JOIN memories m ON m.id = n.id) AS nodes,"
+        " (SELECT coalesce(json_agg(json_build_object("
+        "     'source', ml.memory_id, 'target', ml.related_id,"
+        "     'relation', ml.relation, 'similarity', ml.similarity)), '[]'::json)"
+        "  FROM memory_links ml"
+        "  WHERE ml.memory_id IN (SELECT id FROM nodes)"
+        "  AND ml.related_id IN (SELECT id FROM nodes)"
+        "  AND ml.similarity >= :min_sim) AS edges"
+    ).bindparams(val=val, depth=depth, max_nodes=max_nodes, min_sim=min_similarity)
+    row = (await db.execute(stmt)).fetchone()
+    if not row.reached:
+        return None
+
+    nodes = json.loads(row.nodes) if isinstance(row.nodes, str) else row.nodes
+    edges = json.loads(row.edges) if isinstance(row.edges, str) else row.edges
+    return {
+        "nodes": nodes,
+        "edges": [{**e, "similarity": round(float(e["similarity"]), 4)} for e in edges],
+        "truncated": row.reached > len(nodes),
+    }
@@ -1,13 +1,100 @@
+import json
+import math
 import uuid
 
-from sqlalchemy import func, select, text
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import bindparam, cast, func, select, text
+from sqlalchemy.dialects.postgresql import BIT
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.db.models import Agent, Memory, MemoryLink, RetrievalEvent
+from app.dedup import content_hash, simhash, simhash_bands
+from app.db.models import Agent, Memory, RetrievalEvent
+from app.db.partitions import fanout_ann, partition_names
 from app.shortid import generate_short_id
 
 
+def _vec_literal(embedding: list[float]) -> str:
+    return "[" + ",".join(str(v) for v in embedding) + "]"
+
+
+async def find_exact_duplicate(db: AsyncSession, content: str):
+    """Oldest live memory with the same normalized content: (id, short_id, embedding, embedding_model) or None."""
+    result = await db.execute(
+        select(Memory.id, Memory.short_id, Memory.embedding, Memory.embedding_model)
+        .where(Memory.content_hash == content_hash(content), Memory.quality > -2)
+        .order_by(Memory.created_at)
+        .limit(1)
+    )
+    return result.first()
+
+
+async def find_near_duplicate(db: AsyncSession, content: str):
+    """Closest SimHash match within near_duplicate_max_distance bits: (id, short_id) or None.
+
+    Candidates share at least one 16-bit band (GIN overlap on simhash_bands);
+    the exact Hamming distance is computed and ranked in SQL, so a busy band
+    can't crowd out the real match. Ties go to the oldest memory.
+    """
+    value = simhash(content)
+    distance = func.bit_count(cast(Memory.simhash.op("#")(value), BIT(64)))
+    result = await db.execute(
+        select(Memory.id, Memory.short_id)
+        .where(
+            Memory.simhash_bands.overlap(simhash_bands(value)),
+            Memory.quality > -2,
+            distance <= settings.near_duplicate_max_distance,
+        )
+        .order_by(distance, Memory.created_at)
+        .limit(1)
+    )
+    return result.first()
+
+
+# The whole write in one statement. Sub-statements share one snapshot, so `nearest`
+# can't see the new row, and the new row's cluster label is computed up front rather
+# than relabelled: clusters are unioned under their oldest root (labels stay flat,
+# every member points at the root) and the new memory, the newest, never wins.
+_INSERT_SQL = (
+    "WITH nearest AS ("
+    "  SELECT id, short_id, 1 - (embedding <=> CAST(:vec AS vector)) AS similarity"
+    "  FROM memories WHERE quality > -2"
+    "  ORDER BY embedding <=> CAST(:vec AS vector) LIMIT 10"
+    "), linked AS ("
+    "  SELECT id, short_id, similarity,"
+    "    CASE WHEN similarity >= :duplicate_threshold THEN 'duplicate_candidate' ELSE 'similar' END AS relation"
+    "  FROM nearest WHERE similarity >= :min_similarity"
+    "), dup AS ("
+    "  SELECT COALESCE("
+    "    CAST(:duplicate_of AS uuid),"
+    "    (SELECT id FROM linked WHERE similarity >= :auto_duplicate_threshold ORDER BY similarity DESC LIMIT 1)"
+    "  ) AS id"
+    "), roots AS ("
+    "  SELECT r.id, r.created_at FROM memories m JOIN memories r ON r.id = m.cluster_id"
+    "  WHERE m.id IN (SELECT id FROM linked WHERE relation = 'duplicate_candidate' UNION SELECT id FROM dup)"
+    "  UNION SELECT CAST(:id AS uuid), now()"
+    "), root AS (SELECT id FROM roots ORDER BY created_at, id LIMIT 1"
+    "), ins AS ("
+    "  INSERT INTO memories (id, cluster_id, agent_id, short_id, content, content_hash, simhash,"
+    "    simhash_bands, tags, source_url, embedding, embedding_model, quality, duplicate_of)"
+    "  VALUES (CAST(:id AS uuid), (SELECT id FROM root), CAST(:agent_id AS uuid), :short_id, :content,"
+    "    :content_hash, :simhash, :simhash_bands, :tags, :source_url, CAST(:vec AS vector),"
+    "    :embedding_model, :quality, (SELECT id FROM dup))"
+    "  RETURNING id, cluster_id, duplicate_of, created_at"
+    "), links AS ("
+    "  INSERT INTO memory_links (id, memory_id, related_id, relation, similarity)"
+    "  SELECT gen_random_uuid(), ins.id, linked.id, linked.relation, linked.similarity FROM ins, linked"
+    "), merged AS ("
+    "  UPDATE memories SET cluster_id = (SELECT id FROM root)"
+    "  WHERE cluster_id IN (SELECT id FROM roots) AND cluster_id <> (SELECT id FROM root)"
+    ")"
+    " SELECT ins.cluster_id, ins.duplicate_of, ins.created_at,"
+    "  linked.id AS similar_id, linked.short_id, linked.similarity, linked.relation"
+    " FROM ins LEFT JOIN linked ON true"
+    " ORDER BY linked.similarity DESC"
+)
+
+
 async def insert_memory(
     db: AsyncSession,
     *,
@@ -18,91 +105,337 @@ async def insert_memory(
     embedding: list[float],
     embedding_model: str,
     quality: int = 0,
+    duplicate_of: uuid.UUID | None = None,
 ) -> tuple[Memory, list[dict]]:
-    """Insert memory, run dedup check, create links. Returns (memory, similar_list)."""
+    """Insert memory, run dedup check, create links. Returns (memory, similar_list).
+
+    One statement (_INSERT_SQL) and the commit; the returned Memory is detached.
+    """
     short_id = generate_short_id()
+    fingerprint = simhash(content)
+    digest = content_hash(content)
+    memory_id = uuid.uuid4()
 
+    # Reset at the commit below; hnsw_ef_search is sized for deep search candidate lists
+    await db.execute(text(f"SET LOCAL hnsw.ef_search = {int(settings.dedup_ef_search)}"))
+    rows = (await db.execute(text(_INSERT_SQL).bindparams(
+        # Typed as vector, not text: a generic plan would re-parse a text literal per scanned row
+        bindparam("vec", embedding, type_=Vector()),
+        id=memory_id,
+        agent_id=agent_id,
+        short_id=short_id,
+        content=content,
+        content_hash=digest,
+        simhash=fingerprint,
+        simhash_bands=simhash_bands(fingerprint),
+        tags=tags,
+        source_url=source_url,
+        embedding_model=embedding_model,
+        quality=quality,
+        duplicate_of=duplicate_of,
+        min_similarity=settings.min_similarity,
+        duplicate_threshold=settings.duplicate_threshold,
+        auto_duplicate_threshold=settings.auto_duplicate_threshold,
+    ))).fetchall()
+    await db.commit()
+
+    first = rows[0]
     memory = Memory(
+        id=memory_id,
+        cluster_id=first.cluster_id,
         agent_id=agent_id,
         short_id=short_id,
         content=content,
+        content_hash=digest,
+        simhash=fingerprint,
+        simhash_bands=simhash_bands(fingerprint),
         tags=tags,
         source_url=source_url,
         embedding=embedding,
         embedding_model=embedding_model,
         quality=quality,
+        duplicate_of=first.duplicate_of,
+        created_at=first.created_at,
+    )
+    similar = [
+        {
+            "id": row.similar_id,
+            "short_id": row.short_id,
+            "similarity": round(float(row.similarity), 4),
+            "relation": row.relation,
+        }
+        for row in rows
+        if row.similar_id is not None
+    ]
+    return memory, similar
+
+
+# Shared ranking boosts: log1p(retrieval_count) (secondary) + source_url boost.
+# Weights kept small so the primary relevance score dominates.
+_RETRIEVAL_COUNT_SQL = "(SELECT count(*) FROM retrieval_events re WHERE re.memory_id = m.id)"
+_BOOST_SQL = (
+    f" + 0.02 * ln(1 + {_RETRIEVAL_COUNT_SQL})"
+    " + CASE WHEN m.source_url IS NOT NULL THEN 0.01 ELSE 0 END"
+)
+
+
+def rank_boost(retrieval_count: int, has_source_url: bool) -> float:
+    """_BOOST_SQL for rankings computed outside Postgres (app.search_node)."""
+    return 0.02 * math.log1p(retrieval_count) + (0.01 if has_source_url else 0.0)
+
+
+def _search_rows(rows) -> list[dict]:
+    return [
+        {
+            "id": r.id,
+            "short_id": r.short_id,
+            "content": r.content,
+            "tags": r.tags,
+            "source_url": r.source_url,
+            "created_at": r.created_at,
+            "author_name": r.author_name,
+            "similarity": round(float(r.similarity), 4),
+            "retrieval_count": r.retrieval_count,
+            **({"cluster_size": r.cluster_size} if "cluster_size" in r._fields else {}),
+        }
+        for r in rows
+    ]
+
+
+def _collapsed(ranked_sql: str, collapse: bool, limit: int) -> tuple[str, dict]:
+    """Optionally keep only the best-ranked row per duplicate cluster.
+
+    `ranked_sql` must select m.cluster_id and rank_score and end in
+    ORDER BY rank_score DESC LIMIT :lim. With collapse it becomes the
+    candidate set (collapse_candidates deep) for a DISTINCT ON (cluster_id)
+    pass, and each survivor carries its cluster's live size.
+    """
+    if not collapse:
+        return ranked_sql, {"lim": limit}
+    sql = (
+        f"WITH cand AS ({ranked_sql}),"
+        " best AS ("
+        "  SELECT DISTINCT ON (cluster_id) * FROM cand ORDER BY cluster_id, rank_score DESC"
+        ")"
+        " SELECT best.*,"
+        " (SELECT count(*) FROM memories c WHERE c.cluster_id = best.cluster_id AND c.quality > -2)"
+        " AS cluster_size"
+        " FROM best ORDER BY rank_score DESC LIMIT :out_lim"
+    )
+    return sql, {"lim": max(limit, settings.collapse_candidates), "out_lim": limit}
+
+
+async def vector_search(
+    db: AsyncSession,
+    *,
+    embedding: list[float],
+    limit: int = 10,
+    collapse: bool = False,
+) -> list[dict]:
+    """Semantic search. Returns list of dicts with memory fields + similarity + retrieval_count.
+
+    The nearest `vector_candidates` live memories come from the partial HNSW
+    index (its predicate is quality > -2); only those are re-ranked by the
+    boosts, so the scan never has to score the whole table. On a partitioned
+    table the candidates come from a concurrent per-partition fan-out.
+    """
+    vec_literal = _vec_literal(embedding)
+    names = await partition_names(db) if settings.partition_fanout else []
+    if names:
+        ann_sql = "SELECT * FROM unnest(CAST(:ann_ids AS uuid[]), CAST(:ann_sims AS float8[])) AS ann(id, similarity)"
+    else:
+        ann_sql = (
+            "SELECT id, 1 - (embedding <=> CAST(:vec AS vector)) AS similarity FROM memories"
+            " WHERE quality > -2"
+            " ORDER BY embedding <=> CAST(:vec AS vector) LIMIT :cand"
+        )
+    # Ranking: similarity (primary) + shared boosts
+    sql, params = _collapsed(
+        f"WITH ann AS ({ann_sql})"
+        " SELECT m.id, m.short_id, m.content, m.tags, m.source_url, m.created_at, m.cluster_id,"
+        " a.name AS author_name,"
+        " ann.similarity,"
+        f" {_RETRIEVAL_COUNT_SQL} AS retrieval_count,"
+        f" ann.similarity{_BOOST_SQL} AS rank_score"
+        " FROM ann"
+        " JOIN memories m ON m.id = ann.id"
+        " JOIN agents a ON a.id = m.agent_id"
+        " WHERE ann.similarity >= :min_sim"
+        " ORDER BY rank_score DESC"
+        " LIMIT :lim",
+        collapse,
+        limit,
     )
-    db.add(memory)
-    await db.flush()
+    cand = max(params["lim"], settings.vector_candidates)
+    if names:
+        ids, sims = await fanout_ann(db, names, vec_literal, cand)
+        params.update(ann_ids=ids, ann_sims=sims)
+    else:
+        params.update(vec=vec_literal, cand=cand)
+    stmt = text(sql).bindparams(min_sim=settings.min_similarity, **params)
+    rows = (await db.execute(stmt)).fetchall()
+    return _search_rows(rows)
+
 
-    vec_literal = "[" + ",".join(str(v) for v in embedding) + "]"
+async def vector_search_batch(
+    db: AsyncSession,
+    *,
+    embeddings: list[list[float]],
+    limit: int = 10,
+) -> list[list[dict]]:
+    """vector_search for several query vectors in one statement.
+
+    Each vector becomes a row of a VALUES list and is joined LATERAL to its own
+    top-`limit` ranking over its own HNSW candidates, as in vector_search.
+    Returns one result list per input vector, in input order.
+    """
+    if not embeddings:
+        return []
+    values = ", ".join(f"({i}, CAST(:v{i} AS vector))" for i in range(len(embeddings)))
     stmt = text(
-        "SELECT id, short_id, 1 - (embedding <=> CAST(:vec AS vector)) AS similarity"
-        " FROM memories"
-        " WHERE id != :mid AND quality > -2"
-        " ORDER BY embedding <=> CAST(:vec AS vector)"
-        " LIMIT 10"
-    ).bindparams(vec=vec_literal, mid=memory.id)
+        "SELECT q.qi, r.* FROM"
+        f" (VALUES {values}) AS q(qi, vec)"
+        " CROSS JOIN LATERAL ("
+        "  SELECT m.id, m.short_id, m.content, m.tags, m.source_url, m.created_at,"
+        "  a.name AS author_name,"
+        "  ann.similarity,"
+        f"  {_RETRIEVAL_COUNT_SQL} AS retrieval_count,"
+        f"  ann.similarity{_BOOST_SQL} AS rank_score"
+        "  FROM ("
+        "   SELECT id, 1 - (embedding <=> q.vec) AS similarity FROM memories"
+        "   WHERE quality > -2"
+        "   ORDER BY embedding <=> q.vec LIMIT :cand"
+        "  ) ann"
+        "  JOIN memories m ON m.id = ann.id"
+        "  JOIN agents a ON a.id = m.agent_id"
+        "  WHERE ann.similarity >= :min_sim"
+        "  ORDER BY rank_score DESC"
+        "  LIMIT :lim"
+        " ) r"
+        " ORDER BY q.qi, r.rank_score DESC"
+    ).bindparams(
+        min_sim=settings.min_similarity,
+        lim=limit,
+        cand=max(limit, settings.vector_candidates),
+        **{f"v{i}": _vec_literal(e) for i, e in enumerate(embeddings)},
+    )
     rows = (await db.execute(stmt)).fetchall()
+    grouped: list[list] = [[] for _ in embeddings]
+    for r in rows:
+        grouped[r.qi].append(r)
+    return [_search_rows(g) for g in grouped]
 
-    similar: list[dict] = []
-    for row in rows:
-        sim = float(row.similarity)
-        if sim < settings.min_similarity:
-            continue
-        relation = "similar"
-        if sim >= settings.duplicate_threshold:
-            relation = "duplicate_candidate"
-        if sim >= settings.auto_duplicate_threshold and memory.duplicate_of is None:
-            memory.duplicate_of = row.id
-        link = MemoryLink(
-            memory_id=memory.id,
-            related_id=row.id,
-            relation=relation,
-            similarity=sim,
-        )
-        db.add(link)
-        similar.append({
-            "id": row.id,
-            "short_id": row.short_id,
-            "similarity": round(sim, 4),
-            "relation": relation,
-        })
 
-    await db.commit()
-    await db.refresh(memory)
-    return memory, similar
+async def lexical_search(
+    db: AsyncSession,
+    *,
+    query: str,
+    limit: int = 10,
+    collapse: bool = False,
+) -> list[dict]:
+    """Full-text search on content_tsv, no embedding needed.
+
+    `similarity` carries the normalized ts_rank_cd score (0..1) since there is
+    no query vector to compare against.
+    """
+    sql, params = _collapsed(
+        "SELECT m.id, m.short_id, m.content, m.tags, m.source_url, m.created_at, m.cluster_id,"
+        " a.name AS author_name,"
+        " ts_rank_cd(m.content_tsv, tsq, 32) AS similarity,"
+        f" {_RETRIEVAL_COUNT_SQL} AS retrieval_count,"
+        f" ts_rank_cd(m.content_tsv, tsq, 32){_BOOST_SQL} AS rank_score"
+        " FROM memories m"
+        " JOIN agents a ON a.id = m.agent_id,"
+        " websearch_to_tsquery('english', :q) tsq"
+        " WHERE m.content_tsv @@ tsq AND m.quality > -2"
+        " ORDER BY rank_score DESC"
+        " LIMIT :lim",
+        collapse,
+        limit,
+    )
+    stmt = text(sql).bindparams(q=query, **params)
+    rows = (await db.execute(stmt)).fetchall()
+    return _search_rows(rows)
 
 
-async def vector_search(
+async def hybrid_search(
     db: AsyncSession,
     *,
+    query: str,
     embedding: list[float],
     limit: int = 10,
+    collapse: bool = False,
 ) -> list[dict]:
-    """Semantic search. Returns list of dicts with memory fields + similarity + retrieval_count."""
-    vec_literal = "[" + ",".join(str(v) for v in embedding) + "]"
-    # Ranking: similarity (primary) + log1p(retrieval_count) (secondary) + source_url boost
-    # Weights kept small so similarity dominates
+    """Lexical + ANN candidates merged by reciprocal rank fusion, then boosted.
+
+    Both candidate legs are CTEs of one statement, so Postgres plans and runs
+    them together in a single round trip. The fused score is scaled to 0..1
+    (1.0 = ranked first by both legs) before the usual boosts are added.
+    """
+    vec_literal = _vec_literal(embedding)
+    sql, params = _collapsed(
+        "WITH ann AS ("
+        "  SELECT id, row_number() OVER (ORDER BY dist) AS rnk FROM ("
+        "    SELECT id, embedding <=> CAST(:vec AS vector) AS dist FROM memories"
+        "    WHERE quality > -2"
+        "    ORDER BY embedding <=> CAST(:vec AS vector) LIMIT :k"
+        "  ) s WHERE 1 - dist >= :min_sim"
+        "), lex AS ("
+        "  SELECT id, row_number() OVER (ORDER BY lrank DESC) AS rnk FROM ("
+        "    SELECT id, ts_rank_cd(content_tsv, tsq) AS lrank"
+        "    FROM memories, websearch_to_tsquery('english', :q) tsq"
+        "    WHERE content_tsv @@ tsq AND quality > -2"
+        "    ORDER BY lrank DESC LIMIT :k"
+        "  ) s"
+        "), fused AS ("
+        "  SELECT id, sum(1.0 / (:rrf_k + rnk)) AS rrf"
+        "  FROM (SELECT * FROM ann UNION ALL SELECT * FROM lex) u"
+        "  GROUP BY id"
+        ")"
+        " SELECT m.id, m.short_id, m.content, m.tags, m.source_url, m.created_at, m.cluster_id,"
+        " a.name AS author_name,"
+        " 1 - (m.embedding <=> CAST(:vec AS vector)) AS similarity,"
+        f" {_RETRIEVAL_COUNT_SQL} AS retrieval_count,"
+        f" f.rrf * (:rrf_k + 1) / 2.0{_BOOST_SQL} AS rank_score"
+        " FROM fused f"
+        " JOIN memories m ON m.id = f.id"
+        " JOIN agents a ON a.id = m.agent_id"
+        " ORDER BY rank_score DESC"
+        " LIMIT :lim",
+        collapse,
+        limit,
+    )
+    stmt = text(sql).bindparams(
+        vec=vec_literal,
+        q=query,
+        k=settings.hybrid_candidates,
+        rrf_k=settings.rrf_k,
+        min_sim=settings.min_similarity,
+        **params,
+    )
+    rows = (await db.execute(stmt)).fetchall()
+    return _search_rows(rows)
+
+
+async def get_search_rows_by_ids(db: AsyncSession, ids: list[uuid.UUID]) -> dict[uuid.UUID, dict]:
+    """Primary-key fetch of search-result fields for already-ranked ids.
+
+    `similarity` is not computed here; the caller supplies it from the ranking.
+    Quarantined memories are dropped.
+    """
+    if not ids:
+        return {}
     stmt = text(
         "SELECT m.id, m.short_id, m.content, m.tags, m.source_url, m.created_at,"
         " a.name AS author_name,"
-        " 1 - (m.embedding <=> CAST(:vec AS vector)) AS similarity,"
-        " (SELECT count(*) FROM retrieval_events re WHERE re.memory_id = m.id) AS retrieval_count,"
-        " (1 - (m.embedding <=> CAST(:vec AS vector)))"
-        "   + 0.02 * ln(1 + (SELECT count(*) FROM retrieval_events re WHERE re.memory_id = m.id))"
-        "   + CASE WHEN m.source_url IS NOT NULL THEN 0.01 ELSE 0 END"
-        "   AS rank_score"
+        f" {_RETRIEVAL_COUNT_SQL} AS retrieval_count"
         " FROM memories m"
         " JOIN agents a ON a.id = m.agent_id"
-        " WHERE m.quality > -2"
-        " AND 1 - (m.embedding <=> CAST(:vec AS vector)) >= :min_sim"
-        " ORDER BY rank_score DESC"
-        " LIMIT :lim"
-    ).bindparams(vec=vec_literal, min_sim=settings.min_similarity, lim=limit)
+        " WHERE m.id = ANY(:ids) AND m.quality > -2"
+    ).bindparams(ids=ids)
     rows = (await db.execute(stmt)).fetchall()
-    return [
-        {
+    return {
+        r.id: {
             "id": r.id,
             "short_id": r.short_id,
             "content": r.content,
@@ -110,15 +443,14 @@ async def vector_search(
             "source_url": r.source_url,
             "created_at": r.created_at,
             "author_name": r.author_name,
-            "similarity": round(float(r.similarity), 4),
             "retrieval_count": r.retrieval_count,
         }
         for r in rows
-    ]
+    }
 
 
 async def get_memory_by_id_or_short(db: AsyncSession, id_or_short: str) -> dict | None:
-    """Get memory by UUID or short_id."""
+    """Get memory by UUID or short_id, with its outgoing links, in one query."""
     try:
         uid = uuid.UUID(id_or_short)
         where = "m.id = :val"
@@ -129,7 +461,13 @@ async def get_memory_by_id_or_short(db: AsyncSession, id_or_short: str) -> dict
 
     stmt = text(
         "SELECT m.id, m.short_id, m.content, m.tags, m.source_url, m.created_at,"
-        " a.name AS author_name"
+        " a.name AS author_name,"
+        " (SELECT coalesce(json_agg(json_build_object("
+        "     'id', ml.related_id, 'short_id', m2.short_id,"
+        "     'relation', ml.relation, 'similarity', ml.similarity)), '[]'::json)"
+        "  FROM memory_links ml"
+        "  JOIN memories m2 ON m2.id = ml.related_id"
+        "  WHERE ml.memory_id = m.id) AS related"
         " FROM memories m"
         " JOIN agents a ON a.id = m.agent_id"
         f" WHERE {where}"
@@ -138,14 +476,7 @@ async def get_memory_by_id_or_short(db: AsyncSession, id_or_short: str) -> dict
     if row is None:
         return None
 
-    links_stmt = text(
-        "SELECT ml.related_id, m2.short_id, ml.relation, ml.similarity"
-        " FROM memory_links ml"
-        " JOIN memories m2 ON m2.id = ml.related_id"
-        " WHERE ml.memory_id = :mid"
-    ).bindparams(mid=row.id)
-    links = (await db.execute(links_stmt)).fetchall()
-
+    links = json.loads(row.related) if isinstance(row.related, str) else row.related
     return {
         "id": row.id,
         "short_id": row.short_id,
@@ -156,10 +487,10 @@ async def get_memory_by_id_or_short(db: AsyncSession, id_or_short: str) -> dict
         "author_name": row.author_name,
         "related": [
             {
-                "id": l.related_id,
-                "short_id": l.short_id,
-                "relation": l.relation,
-                "similarity": round(float(l.similarity), 4) if l.similarity else 0,
+                "id": l["id"],
+                "short_id": l["short_id"],
+                "relation": l["relation"],
+                "similarity": round(float(l["similarity"]), 4) if l["similarity"] else 0,
             }
             for l in links
         ],
@@ -1,5 +1,6 @@
 import uuid
 
+from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.models import RetrievalEvent
@@ -21,3 +22,14 @@ async def log_retrieval(
     )
     db.add(event)
     await db.commit()
+
+
+async def log_retrievals(db: AsyncSession, *, agent_id: uuid.UUID, events: list[dict]) -> None:
+    """Bulk variant of log_retrieval: one multi-row INSERT for `{memory_id, query, similarity}` dicts."""
+    if not events:
+        return
+    await db.execute(
+        insert(RetrievalEvent),
+        [{"id": uuid.uuid4(), "agent_id": agent_id, **e} for e in events],
+    )
+    await db.commit()
@@ -0,0 +1,155 @@
+"""Slow-query log: every statement on every engine is timed through SQLAlchemy
+cursor events.
+
+Statements slower than `slow_query_ms` are logged, and a `slow_query_sample`
+share of them is captured with its plan into a ring buffer of the last
+`slow_query_log_size` entries (GET /admin/slow-queries). Read-only statements
+get `EXPLAIN (ANALYZE, BUFFERS)`, which runs them a second time; anything that
+writes only gets a plain EXPLAIN, DDL and utility statements none. The EXPLAIN
+runs on the same connection, in the same transaction and behind a savepoint,
+so it sees what the statement saw and its failure can't abort the caller's
+transaction.
+
+Bound parameters are stored with vectors replaced by a placeholder. Inside
+`capture()` (explain=true searches) every statement is explained regardless of
+the threshold and collected into the returned list.
+"""
+
+import contextvars
+import logging
+import random
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import orjson
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|VALUES)\b", re.IGNORECASE)
+_READ_ONLY = re.compile(r"^\s*(SELECT|WITH|VALUES)\b", re.IGNORECASE)
+_WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE)
+
+entries: deque[dict] = deque(maxlen=settings.slow_query_log_size)
+counters = {"statements": 0, "slow": 0, "explained": 0}
+_capture: contextvars.ContextVar[list | None] = contextvars.ContextVar("slowlog_capture", default=None)
+
+
+@contextmanager
+def capture():
+    """Explain every statement run by this task inside the block, into the yielded list."""
+    captured: list[dict] = []
+    token = _capture.set(captured)
+    try:
+        yield captured
+    finally:
+        _capture.reset(token)
+
+
+def _scrub(value):
+    # Vectors travel as '[x,y,...]' literals or float arrays: keep their size, not their values
+    if isinstance(value, str) and value.startswith("[") and len(value) > 100:
+        return f"<vector {value.count(',') + 1}d>"
+    if isinstance(value, (list, tuple)) and len(value) > 32 and all(isinstance(v, float) for v in value[:32]):
+        return f"<{len(value)} floats>"
+    if isinstance(value, (list, tuple)):
+        return [_scrub(v) for v in value]
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return str(value)[:200]
+
+
+def _params(parameters) -> list | dict:
+    if isinstance(parameters, dict):
+        return {k: _scrub(v) for k, v in parameters.items()}
+    return [_scrub(v) for v in parameters or ()]
+
+
+def _explain(conn, statement: str, parameters) -> tuple[list | None, bool, str | None]:
+    """(plan JSON, analyzed, error) for `statement`, run on the same DBAPI connection."""
+    if not _EXPLAINABLE.match(statement):
+        return None, False, "not explainable"
+    analyze = bool(_READ_ONLY.match(statement)) and not _WRITES.search(statement)
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    dbapi = conn.connection.dbapi_connection
+    savepoint = not getattr(dbapi, "autocommit", False)
+    cursor = dbapi.cursor()
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT slowlog_explain")
+        try:
+            cursor.execute(f"EXPLAIN ({options}) {statement}", parameters)
+            plan = cursor.fetchall()[0][0]
+            if savepoint:
+                cursor.execute("RELEASE SAVEPOINT slowlog_explain")
+        except Exception as exc:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT slowlog_explain")
+            return None, analyze, (str(exc).splitlines() or [type(exc).__name__])[0][:200]
+    finally:
+        cursor.close()
+    return (orjson.loads(plan) if isinstance(plan, str) else plan), analyze, None
+
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    context._slowlog_t0 = time.perf_counter()
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    t0 = getattr(context, "_slowlog_t0", None)
+    if t0 is None:
+        return
+    ms = (time.perf_counter() - t0) * 1000
+    counters["statements"] += 1
+    captured = _capture.get()
+    slow = settings.slow_query_ms > 0 and ms >= settings.slow_query_ms
+    if slow:
+        counters["slow"] += 1
+        logger.warning("slow query %.0fms: %s", ms, " ".join(statement.split())[:200])
+    if executemany or not (captured is not None or (slow and random.random() < settings.slow_query_sample)):
+        return
+
+    t1 = time.perf_counter()
+    plan, analyzed, error = _explain(conn, statement, parameters)
+    counters["explained"] += 1
+    entry = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "ms": round(ms, 2),
+        "explain_ms": round((time.perf_counter() - t1) * 1000, 2),
+        "statement": statement[:4000],
+        "params": _params(parameters),
+        "analyzed": analyzed,
+        "plan": plan,
+        "error": error,
+    }
+    if captured is not None:
+        captured.append(entry)
+    if slow:
+        entries.append(entry)
+
+
+def install() -> None:
+    """Time statements on every engine, present and future."""
+    if not event.contains(Engine, "before_cursor_execute", _before):
+        event.listen(Engine, "before_cursor_execute", _before)
+        event.listen(Engine, "after_cursor_execute", _after)
+
+
+def status(limit: int | None = None) -> dict:
+    recent = list(entries)[::-1]
+    return {
+        **counters,
+        "threshold_ms": settings.slow_query_ms,
+        "sample": settings.slow_query_sample,
+        "entries": recent[:limit] if limit else recent,
+    }
+
+
+def clear() -> None:
+    entries.clear()
@@ -0,0 +1,49 @@
+import hashlib
+import re
+
+# Same whitespace class as Postgres' \s, so migration backfills hash identically
+_WS = re.compile(r"[ \t\n\r\f\v]+")
+
+
+def normalize_content(content: str) -> str:
+    return _WS.sub(" ", content).strip(" ")
+
+
+def content_hash(content: str) -> str:
+    """sha256 of whitespace-normalized content; equal for byte-identical and whitespace variants."""
+    return hashlib.sha256(normalize_content(content).encode()).hexdigest()
+
+
+# SimHash near-duplicate fingerprint: 64 bits split into 4 bands of 16. Two
+# fingerprints within Hamming distance 3 share at least one band exactly
+# (pigeonhole), so a band-equality lookup finds every such candidate.
+SIMHASH_BANDS = 4
+_BAND_BITS = 64 // SIMHASH_BANDS
+_WORD = re.compile(r"\w+")
+
+
+def _features(content: str) -> list[str]:
+    words = _WORD.findall(normalize_content(content).lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def simhash(content: str) -> int:
+    """64-bit SimHash over word unigrams and bigrams, as a signed int (fits BIGINT)."""
+    counts = [0] * 64
+    for feature in _features(content):
+        h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+        for i in range(64):
+            counts[i] += 1 if h >> i & 1 else -1
+    value = sum(1 << i for i in range(64) if counts[i] > 0)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def simhash_bands(value: int) -> list[int]:
+    """Band values tagged with their band index (band << 16 | bits), so one int[] holds all bands."""
+    value &= (1 << 64) - 1
+    mask = (1 << _BAND_BITS) - 1
+    return [i << _BAND_BITS | (value >> (i * _BAND_BITS)) & mask for i in range(SIMHASH_BANDS)]
+
+
+def hamming(a: int, b: int) -> int:
+    return ((a ^ b) & ((1 << 64) - 1)).bit_count()
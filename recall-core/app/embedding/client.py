@@ -1,29 +1,207 @@
+"""Embedding providers.
+
+`OpenAIEmbeddingClient` talks to an OpenAI-compatible /embeddings endpoint,
+and optionally to a secondary one serving the same model, under a latency
+budget per call site (`embedding_search_budget` for searches,
+`embedding_write_budget` for writes; jobs pass none and get
+`embedding_timeout`). Within the budget each provider:
+
+- hedges budgeted calls: once an attempt has run for the provider's recent
+  p95 latency, a second identical attempt starts and the first answer wins
+- retries connection errors, 429 and 5xx up to `embedding_retries` times with
+  jittered exponential backoff
+- sits behind a circuit breaker (app.circuit); while the primary's is open,
+  calls go straight to the secondary, or fail fast without one
+
+Anything that exhausts the budget, the retries or both providers raises
+`EmbeddingUnavailable`, which the API answers with 503.
+"""
+
+import asyncio
+import logging
+import random
+import time
 from abc import ABC, abstractmethod
+from collections import deque
 
 import httpx
 
+from app.circuit import CircuitBreaker
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingUnavailable(Exception):
+    """No provider answered within the budget, or every breaker is open."""
+
 
 class EmbeddingClient(ABC):
     @abstractmethod
-    async def embed(self, text: str) -> list[float]: ...
+    async def embed(self, text: str, budget: float | None = None) -> list[float]: ...
+
+    async def embed_many(self, texts: list[str], budget: float | None = None) -> list[list[float]]:
+        """Embed several texts. Providers with a batch API should override this."""
+        return [await self.embed(t, budget) for t in texts]
+
+    async def warm_up(self) -> None:
+        """Open the provider connection ahead of the first embed. No-op by default."""
+
+    def status(self) -> dict:
+        """Breaker and hedging counters per provider, for /health."""
+        return {}
+
+
+class _Retryable(Exception):
+    """A 429 or 5xx answer: worth another attempt."""
+
+
+# Successful attempt latencies kept per provider, and how many before p95 replaces hedge_delay
+_LATENCY_WINDOW = 200
+_MIN_SAMPLES = 20
+
+
+class _Provider:
+    def __init__(self, name: str, base_url: str, api_key: str):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.breaker = CircuitBreaker(f"embedding {name}", EmbeddingUnavailable, config="embedding")
+        self.latencies: deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.embedding_timeout, connect=settings.embedding_connect_timeout),
+            limits=httpx.Limits(
+                max_connections=settings.embedding_max_connections,
+                max_keepalive_connections=settings.embedding_max_keepalive,
+            ),
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < _MIN_SAMPLES:
+            return settings.embedding_hedge_delay
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95)]
+
+    async def warm_up(self) -> None:
+        # Any answer will do: the point is the pooled TLS connection, not the body
+        await self._client.get(f"{self.base_url}/models")
+
+    async def _attempt(self, payload: dict) -> dict:
+        t0 = time.perf_counter()
+        resp = await self._client.post(f"{self.base_url}/embeddings", json=payload)
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise _Retryable(f"{self.name} answered {resp.status_code}")
+        resp.raise_for_status()
+        self.latencies.append(time.perf_counter() - t0)
+        return resp.json()
+
+    async def _hedged(self, payload: dict) -> dict:
+        first = asyncio.create_task(self._attempt(payload))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if not done:
+                self.hedges += 1
+                tasks.add(asyncio.create_task(self._attempt(payload)))
+            # First success wins; a failed attempt waits for the other one, if any
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def request(self, payload: dict, hedge: bool, deadline: float) -> dict:
+        """Retried (and hedged) call, answering by `deadline` (time.monotonic()) or raising."""
+        self.breaker.acquire()
+        try:
+            async with asyncio.timeout(deadline - time.monotonic()):
+                for attempt in range(settings.embedding_retries + 1):
+                    try:
+                        result = await (self._hedged(payload) if hedge else self._attempt(payload))
+                        break
+                    except (httpx.TransportError, _Retryable):
+                        if attempt == settings.embedding_retries:
+                            raise
+                        self.retries += 1
+                        backoff = settings.embedding_retry_backoff * 2**attempt
+                        await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
+        except (httpx.TransportError, _Retryable, TimeoutError) as exc:
+            self.breaker.failure(exc)
+            raise EmbeddingUnavailable(f"{self.name}: {self.breaker.last_error}") from exc
+        except httpx.HTTPStatusError:
+            # A 4xx (bad key, bad input) proves the provider answers; retrying won't help
+            self.breaker.success()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.success()
+        return result
+
+    def status(self) -> dict:
+        return {
+            **self.breaker.status(),
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 1),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "retries": self.retries,
+        }
 
 
 class OpenAIEmbeddingClient(EmbeddingClient):
     def __init__(self):
         self.model = settings.embedding_model
-        self.api_key = settings.openai_api_key
-        self._client = httpx.AsyncClient(timeout=30)
-
-    async def embed(self, text: str) -> list[float]:
-        resp = await self._client.post(
-            "https://api.openai.com/v1/embeddings",
-            headers={"Authorization": f"Bearer {self.api_key}"},
-            json={"model": self.model, "input": text},
-        )
-        resp.raise_for_status()
-        return resp.json()["data"][0]["embedding"]
+        self.providers = [_Provider("primary", settings.embedding_base_url, settings.openai_api_key)]
+        if settings.embedding_fallback_base_url:
+            self.providers.append(_Provider(
+                "secondary",
+                settings.embedding_fallback_base_url,
+                settings.embedding_fallback_api_key or settings.openai_api_key,
+            ))
+
+    async def warm_up(self) -> None:
+        await self.providers[0].warm_up()
+
+    async def _embeddings(self, texts: str | list[str], budget: float | None) -> dict:
+        payload = {"model": self.model, "input": texts}
+        # Jobs have no latency budget and don't hedge their (large) batches
+        hedge = budget is not None and settings.embedding_hedge
+        deadline = time.monotonic() + (budget if budget is not None else settings.embedding_timeout)
+        error = None
+        for provider in self.providers:
+            if time.monotonic() >= deadline:
+                break
+            # An open primary is skipped for the secondary; the last provider fails fast itself
+            if not provider.breaker.allows() and provider is not self.providers[-1]:
+                continue
+            try:
+                return await provider.request(payload, hedge, deadline)
+            except EmbeddingUnavailable as exc:
+                error = exc
+                logger.warning("embedding provider failed: %s", exc)
+        raise error or EmbeddingUnavailable(f"embedding budget of {budget}s exhausted")
+
+    def status(self) -> dict:
+        return {p.name: p.status() for p in self.providers}
+
+    async def embed(self, text: str, budget: float | None = None) -> list[float]:
+        return (await self._embeddings(text, budget))["data"][0]["embedding"]
+
+    async def embed_many(self, texts: list[str], budget: float | None = None) -> list[list[float]]:
+        data = sorted((await self._embeddings(texts, budget))["data"], key=lambda d: d["index"])
+        return [d["embedding"] for d in data]
 
 
 embedding_client: EmbeddingClient = OpenAIEmbeddingClient()
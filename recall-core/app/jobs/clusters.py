@@ -0,0 +1,115 @@
+"""Full rebuild of duplicate clusters.
+
+Writes maintain clusters incrementally (see insert_memory); this job
+recomputes them from scratch with union-find over duplicate_of and
+duplicate_candidate links. Use it once after migration 006 and to repair
+drift from concurrent merges. Progress is kept as JSON in system_config
+under `cluster_rebuild_job`.
+"""
+
+import json
+import logging
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from app.db.engine import async_session
+from app.db.queries.system import get_config, set_config
+
+logger = logging.getLogger(__name__)
+
+JOB_KEY = "cluster_rebuild_job"
+BATCH = 5000
+
+
+async def get_job(db) -> dict | None:
+    raw = await get_config(db, JOB_KEY)
+    return json.loads(raw) if raw is not None else None
+
+
+def new_job() -> dict:
+    return {
+        "status": "running",
+        "clusters": 0,
+        "clustered_memories": 0,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "finished_at": None,
+        "error": None,
+    }
+
+
+def _components(edges: list[tuple[uuid.UUID, uuid.UUID]]) -> dict[uuid.UUID, uuid.UUID]:
+    """Union-find with path halving. Returns node -> representative."""
+    parent: dict[uuid.UUID, uuid.UUID] = {}
+
+    def find(x: uuid.UUID) -> uuid.UUID:
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in edges:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[ra] = rb
+    return {x: find(x) for x in parent}
+
+
+async def run_cluster_rebuild() -> None:
+    async with async_session() as db:
+        job = await get_job(db) or new_job()
+        try:
+            edges = (
+                await db.execute(
+                    text(
+                        "SELECT memory_id, related_id FROM memory_links"
+                        " WHERE relation = 'duplicate_candidate'"
+                        " UNION ALL"
+                        " SELECT id, duplicate_of FROM memories WHERE duplicate_of IS NOT NULL"
+                    )
+                )
+            ).fetchall()
+            rep = _components([(a, b) for a, b in edges])
+
+            # Label each component with its oldest member
+            created: dict[uuid.UUID, tuple] = {}
+            nodes = list(rep)
+            for i in range(0, len(nodes), BATCH):
+                rows = await db.execute(
+                    text("SELECT id, created_at FROM memories WHERE id = ANY(:ids)").bindparams(
+                        ids=nodes[i:i + BATCH]
+                    )
+                )
+                created.update({r.id: (r.created_at, r.id) for r in rows})
+            root: dict[uuid.UUID, uuid.UUID] = {}
+            for node, r in rep.items():
+                if node in created and (r not in root or created[node] < created[root[r]]):
+                    root[r] = node
+            labels = {node: root[r] for node, r in rep.items() if node in created}
+
+            # One transaction: reset every multi-member cluster, then apply the new labels
+            await db.execute(text("UPDATE memories SET cluster_id = id WHERE cluster_id <> id"))
+            members = [(node, label) for node, label in labels.items() if node != label]
+            for i in range(0, len(members), BATCH):
+                chunk = members[i:i + BATCH]
+                await db.execute(
+                    text(
+                        "UPDATE memories m SET cluster_id = v.label"
+                        " FROM unnest(CAST(:ids AS uuid[]), CAST(:labels AS uuid[])) AS v(id, label)"
+                        " WHERE m.id = v.id"
+                    ).bindparams(ids=[n for n, _ in chunk], labels=[l for _, l in chunk])
+                )
+            await db.commit()
+
+            job["clusters"] = len(set(labels.values()))
+            job["clustered_memories"] = len(labels)
+            job["status"] = "done"
+        except Exception as exc:
+            logger.exception("cluster rebuild failed")
+            await db.rollback()
+            job["status"] = "failed"
+            job["error"] = str(exc)
+        job["finished_at"] = datetime.now(timezone.utc).isoformat()
+        await set_config(db, JOB_KEY, json.dumps(job))
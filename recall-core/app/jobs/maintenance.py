@@ -0,0 +1,244 @@
+"""Counter-driven maintenance: retrieval counters, quality recompute, trust promotion.
+
+Every step is incremental and set-based:
+
+- counters: folds retrieval_events past the `retrieval_events_seq` watermark
+  into memories.retrieval_count and agents.retrieved_memories, one grouped
+  UPDATE per chunk of `maintenance_event_chunk` events. Low-signal (-1)
+  memories reaching `quality_promote_retrievals` are promoted to 0 in the
+  same UPDATE. retrieved_memories counts memories some other agent has
+  retrieved: an author searching up its own memories earns no trust.
+- quality: memories that crossed the `quality_stale_days` age since the last
+  run (`quality_stale_watermark`) and were never retrieved nor linked drop
+  to low-signal (-1). Quarantined (-2) memories are never touched.
+- trust: trust-0 agents with `trust_promotion_memories` retrieved memories,
+  no quarantines and an active key are promoted to trust 1 (Arch §4.8).
+
+Watermarks are advanced in the same transaction as the work they cover.
+Events newer than `maintenance_settle_seconds` are left for the next run so
+a late-committing insert can't slip under the watermark.
+
+Runs don't overlap: run_maintenance holds a session-level advisory lock
+(RUN_LOCK) for its whole run, and a second worker or admin POST skips or
+gets 409 meanwhile. Each counter chunk also takes COUNTERS_LOCK for its
+transaction and re-reads the watermark under it, so two folds can never
+count the same events.
+
+Run as a worker: python -m app.jobs.maintenance [--interval 300] [--steps counters,quality,trust]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.db.engine import async_session
+from app.db.queries.system import get_config, set_config
+
+logger = logging.getLogger(__name__)
+
+JOB_KEY = "maintenance_job"
+EVENTS_WATERMARK = "retrieval_events_seq"
+STALE_WATERMARK = "quality_stale_watermark"
+# Advisory lock keys ("RCL" + n)
+RUN_LOCK = 0x52434C01
+COUNTERS_LOCK = 0x52434C02
+STEPS = ("counters", "quality", "trust")
+
+_SET_WATERMARK_SQL = (
+    "INSERT INTO system_config (key, value, updated_at) VALUES (:key, :value, now())"
+    " ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at"
+)
+
+
+async def get_job(db) -> dict | None:
+    raw = await get_config(db, JOB_KEY)
+    return json.loads(raw) if raw is not None else None
+
+
+def new_job(steps: list[str]) -> dict:
+    return {
+        "steps": steps,
+        "status": "running",
+        "events": 0,
+        "memories_counted": 0,
+        "quality_promoted": 0,
+        "quality_demoted": 0,
+        "agents_promoted": 0,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "finished_at": None,
+        "error": None,
+    }
+
+
+async def refresh_counters(db) -> dict:
+    hi = await db.scalar(
+        text(
+            "SELECT seq FROM retrieval_events"
+            " WHERE created_at < now() - make_interval(secs => :settle)"
+            " ORDER BY seq DESC LIMIT 1"
+        ).bindparams(settle=settings.maintenance_settle_seconds)
+    )
+    stats = {"events": 0, "memories_counted": 0, "quality_promoted": 0}
+    await db.commit()
+    if hi is None:
+        return stats
+
+    while True:
+        # A concurrent fold waits here, then sees the watermark this one committed
+        await db.execute(text("SELECT pg_advisory_xact_lock(:k)").bindparams(k=COUNTERS_LOCK))
+        lo = int(await get_config(db, EVENTS_WATERMARK) or 0)
+        if lo >= hi:
+            await db.commit()
+            return stats
+        upper = min(lo + settings.maintenance_event_chunk, hi)
+        row = (
+            await db.execute(
+                text(
+                    "WITH cur AS ("
+                    "  SELECT e.memory_id, count(*) AS n, m.quality AS old_quality,"
+                    # First retrieval by anyone but the author: none in this chunk before, none earlier
+                    "    bool_or(e.agent_id <> m.agent_id) AND NOT EXISTS ("
+                    "      SELECT 1 FROM retrieval_events p"
+                    "      WHERE p.memory_id = e.memory_id AND p.seq <= :lo AND p.agent_id <> m.agent_id"
+                    "    ) AS first_hit"
+                    "  FROM retrieval_events e JOIN memories m ON m.id = e.memory_id"
+                    "  WHERE e.seq > :lo AND e.seq <= :hi GROUP BY e.memory_id, m.agent_id, m.quality"
+                    "), bumped AS ("
+                    "  UPDATE memories m SET"
+                    "    retrieval_count = m.retrieval_count + cur.n,"
+                    "    quality = CASE WHEN m.quality = -1 AND m.retrieval_count + cur.n >= :promote"
+                    "      THEN 0 ELSE m.quality END"
+                    "  FROM cur WHERE m.id = cur.memory_id"
+                    "  RETURNING m.agent_id, cur.first_hit,"
+                    "    cur.old_quality = -1 AND m.quality = 0 AS promoted, cur.n"
+                    "), agent_hits AS ("
+                    "  UPDATE agents a SET retrieved_memories = a.retrieved_memories + x.k"
+                    "  FROM (SELECT agent_id, count(*) AS k FROM bumped WHERE first_hit GROUP BY agent_id) x"
+                    "  WHERE a.id = x.agent_id"
+                    "  RETURNING a.id"
+                    ")"
+                    " SELECT coalesce(sum(n), 0) AS events, count(*) AS memories,"
+                    " count(*) FILTER (WHERE promoted) AS promoted,"
+                    " (SELECT count(*) FROM agent_hits) AS agents"
+                    " FROM bumped"
+                ).bindparams(lo=lo, hi=upper, promote=settings.quality_promote_retrievals)
+            )
+        ).one()
+        await db.execute(text(_SET_WATERMARK_SQL).bindparams(key=EVENTS_WATERMARK, value=str(upper)))
+        await db.commit()
+
+        stats["events"] += int(row.events)
+        stats["memories_counted"] += row.memories
+        stats["quality_promoted"] += row.promoted
+
+
+async def recompute_quality(db) -> dict:
+    if settings.quality_stale_days <= 0:
+        return {"quality_demoted": 0}
+    since = await get_config(db, STALE_WATERMARK)
+    until = datetime.now(timezone.utc) - timedelta(days=settings.quality_stale_days)
+    result = await db.execute(
+        text(
+            "UPDATE memories m SET quality = -1"
+            " WHERE m.created_at <= :until"
+            + (" AND m.created_at > :since" if since else "")
+            + " AND m.quality = 0 AND m.retrieval_count = 0"
+            " AND NOT EXISTS (SELECT 1 FROM memory_links l WHERE l.memory_id = m.id)"
+            " AND NOT EXISTS (SELECT 1 FROM memory_links l WHERE l.related_id = m.id)"
+        ).bindparams(until=until, **({"since": datetime.fromisoformat(since)} if since else {}))
+    )
+    await db.execute(text(_SET_WATERMARK_SQL).bindparams(key=STALE_WATERMARK, value=until.isoformat()))
+    await db.commit()
+    return {"quality_demoted": result.rowcount}
+
+
+async def promote_trust(db) -> dict:
+    result = await db.execute(
+        text(
+            "UPDATE agents SET trust_level = 1"
+            " WHERE trust_level = 0 AND disabled_at IS NULL AND quarantine_count = 0"
+            " AND retrieved_memories >= :n"
+            " RETURNING id"
+        ).bindparams(n=settings.trust_promotion_memories)
+    )
+    promoted = [str(r.id) for r in result]
+    await db.commit()
+    if promoted:
+        logger.info("promoted %d agents to trust 1: %s", len(promoted), ", ".join(promoted))
+    return {"agents_promoted": len(promoted)}
+
+
+_STEP_FUNCS = {"counters": refresh_counters, "quality": recompute_quality, "trust": promote_trust}
+
+
+async def is_running(db) -> bool:
+    """Whether some process holds RUN_LOCK, i.e. a maintenance run is in progress."""
+    return await db.scalar(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND granted"
+            " AND classid = 0 AND objid::bigint = :k AND objsubid = 1)"
+        ).bindparams(k=RUN_LOCK)
+    )
+
+
+async def run_maintenance(steps: list[str]) -> dict:
+    """Run `steps` in STEPS order; counters always come first so the others see fresh counts.
+
+    Returns the job, or one with status "skipped" when another run holds RUN_LOCK.
+    """
+    async with async_session() as db, db.bind.connect() as lock:
+        # Session-level, so it outlives the commits; released with the connection at worst
+        if not await lock.scalar(text("SELECT pg_try_advisory_lock(:k)").bindparams(k=RUN_LOCK)):
+            logger.warning("maintenance run skipped: another run is in progress")
+            return {**new_job(steps), "status": "skipped"}
+        await lock.commit()
+        try:
+            job = new_job(steps)
+            await set_config(db, JOB_KEY, json.dumps(job))
+            try:
+                for step in STEPS:
+                    if step in steps:
+                        job.update(await _STEP_FUNCS[step](db))
+                job["status"] = "done"
+            except Exception as exc:
+                logger.exception("maintenance job failed")
+                await db.rollback()
+                job["status"] = "failed"
+                job["error"] = str(exc)
+            job["finished_at"] = datetime.now(timezone.utc).isoformat()
+            await set_config(db, JOB_KEY, json.dumps(job))
+            return job
+        finally:
+            await lock.execute(text("SELECT pg_advisory_unlock(:k)").bindparams(k=RUN_LOCK))
+            await lock.commit()
+
+
+async def _worker(steps: list[str], interval: float) -> None:
+    while True:
+        job = await run_maintenance(steps)
+        logger.info("maintenance: %s", json.dumps(job))
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", default=",".join(STEPS), help="comma-separated subset of counters,quality,trust")
+    parser.add_argument("--interval", type=float, default=0, help="seconds between runs; 0 runs once")
+    args = parser.parse_args()
+    steps = [s for s in args.steps.split(",") if s]
+    unknown = set(steps) - set(STEPS)
+    if unknown:
+        parser.error(f"unknown steps: {', '.join(sorted(unknown))}")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_worker(steps, args.interval))
+
+
+if __name__ == "__main__":
+    main()
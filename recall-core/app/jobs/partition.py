@@ -0,0 +1,317 @@
+"""Convert memories to a hash-partitioned table, or back to a plain one.
+
+  python -m app.jobs.partition convert --partitions 8   # PARTITION BY HASH (id), memories_p0..p7
+  python -m app.jobs.partition convert --partitions 0   # one plain table again
+  python -m app.jobs.partition status
+
+Each partition carries its own copy of every index, so the HNSW graphs are
+N times smaller to build, vacuum and REINDEX, and vector_search fans out one
+top-K query per partition (app.db.partitions).
+
+The conversion builds the new table next to the old one: rows are copied in
+id order, `transfer_batch_size` per transaction, then the indexes of the
+current table are recreated on it. A final short transaction drops the old
+table, renames the new one in and re-adds the foreign keys that point at
+memories. Searches use the old table until that swap. API writes are
+switched off (global_write_enabled) for the duration and the previous value
+is restored afterwards, but that flag can be turned back on (heartbeat) and
+background jobs ignore it. So the swap, under its exclusive lock, first
+re-copies every row written since the copy began (xmin at or past the
+oldest transaction running when it started) and aborts if the two tables
+still differ in row count.
+
+short_id cannot stay UNIQUE on a table partitioned by id; while partitioned
+its uniqueness is enforced by memory_short_ids, kept by a trigger.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import re
+import time
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.db.engine import engine
+from app.db.partitions import clear_partition_cache
+
+logger = logging.getLogger(__name__)
+
+NEW = "memories_new"
+
+# Foreign keys of other tables that reference memories(id), dropped and re-added around the swap
+_REFERENCING_FKS = (
+    ("memory_links", "memory_links_memory_id_fkey", "memory_id"),
+    ("memory_links", "memory_links_related_id_fkey", "related_id"),
+    ("retrieval_events", "retrieval_events_memory_id_fkey", "memory_id"),
+)
+
+_SHORT_ID_TRIGGER_SQL = (
+    "CREATE OR REPLACE FUNCTION memory_short_ids_sync() RETURNS trigger AS $$"
+    " BEGIN"
+    "  IF TG_OP = 'INSERT' THEN"
+    "   INSERT INTO memory_short_ids (short_id, memory_id) VALUES (NEW.short_id, NEW.id);"
+    "  ELSE"
+    "   DELETE FROM memory_short_ids WHERE short_id = OLD.short_id;"
+    "  END IF;"
+    "  RETURN NULL;"
+    " END $$ LANGUAGE plpgsql"
+)
+
+# Unique and primary-key indexes are recreated as constraints, not copied
+_SKIP_INDEXES = {"memories_pkey", "memories_short_id_key", "ix_memories_short_id"}
+
+
+async def _copyable_columns(conn) -> list[str]:
+    rows = await conn.execute(text(
+        "SELECT column_name FROM information_schema.columns"
+        " WHERE table_name = 'memories' AND table_schema = current_schema() AND is_generated = 'NEVER'"
+        " ORDER BY ordinal_position"
+    ))
+    return [r[0] for r in rows]
+
+
+async def _index_definitions(conn) -> list[tuple[str, str]]:
+    rows = await conn.execute(text(
+        "SELECT indexname, indexdef FROM pg_indexes"
+        " WHERE tablename = 'memories' AND schemaname = current_schema()"
+    ))
+    return [(name, ddl) for name, ddl in rows if name not in _SKIP_INDEXES]
+
+
+def _retarget(name: str, ddl: str) -> str:
+    """The CREATE INDEX of the current table, named <name>_new and pointed at the new table."""
+    ddl = ddl.replace(f"INDEX {name} ON", f"INDEX {name}_new ON", 1)
+    return re.sub(r" ON (ONLY )?(\S+\.)?memories ", f" ON {NEW} ", ddl, count=1)
+
+
+async def _create_table(conn, partitions: int) -> None:
+    await conn.execute(text(f"DROP TABLE IF EXISTS {NEW} CASCADE"))
+    partition_by = " PARTITION BY HASH (id)" if partitions else ""
+    await conn.execute(text(
+        f"CREATE TABLE {NEW} (LIKE memories INCLUDING DEFAULTS INCLUDING GENERATED){partition_by}"
+    ))
+    for i in range(partitions):
+        await conn.execute(text(
+            f"CREATE TABLE {NEW}_p{i} PARTITION OF {NEW} FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i})"
+        ))
+
+
+async def _copy_rows(columns: list[str]) -> int:
+    cols = ", ".join(columns)
+    last, copied = None, 0
+    while True:
+        after, params = ("", {}) if last is None else ("WHERE id > :last", {"last": last})
+        async with engine.begin() as conn:
+            row = (await conn.execute(text(
+                f"WITH batch AS (SELECT {cols} FROM memories {after} ORDER BY id LIMIT :n),"
+                f" ins AS (INSERT INTO {NEW} ({cols}) SELECT {cols} FROM batch)"
+                # uuid has no max(); its text form sorts the same way
+                " SELECT max(id::text)::uuid AS last, count(*) AS n FROM batch"
+            ).bindparams(n=settings.transfer_batch_size, **params))).one()
+        if not row.n:
+            return copied
+        last, copied = row.last, copied + row.n
+
+
+async def _build_indexes(definitions: list[tuple[str, str]], partitions: int) -> None:
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"SET maintenance_work_mem = '{settings.vector_index_build_mem}'"))
+        await conn.execute(text(
+            f"SET max_parallel_maintenance_workers = {int(settings.vector_index_parallel_workers)}"
+        ))
+        try:
+            await conn.execute(text(f"ALTER TABLE {NEW} ADD PRIMARY KEY (id)"))
+            # The table's own foreign keys, checked here rather than under the swap lock
+            await conn.execute(text(
+                f"ALTER TABLE {NEW} ADD CONSTRAINT {NEW}_agent_id_fkey FOREIGN KEY (agent_id) REFERENCES agents(id)"
+            ))
+            await conn.execute(text(
+                f"ALTER TABLE {NEW} ADD CONSTRAINT {NEW}_duplicate_of_fkey"
+                f" FOREIGN KEY (duplicate_of) REFERENCES {NEW}(id)"
+            ))
+            if partitions:
+                await conn.execute(text(f"CREATE INDEX ix_memories_short_id_new ON {NEW} (short_id)"))
+            for name, ddl in definitions:
+                t0 = time.perf_counter()
+                await conn.execute(text(_retarget(name, ddl)))
+                logger.info("built %s in %.1fs", name, time.perf_counter() - t0)
+        finally:
+            await conn.execute(text("RESET maintenance_work_mem"))
+            await conn.execute(text("RESET max_parallel_maintenance_workers"))
+
+
+async def _copy_start() -> str:
+    """Oldest transaction still running: any row written after the copy starts has an xmin at or past it."""
+    async with engine.connect() as conn:
+        return (await conn.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text"))).scalar()
+
+
+async def _catch_up(conn, columns: list[str], since: str) -> int:
+    """Upsert rows inserted or updated since `since` into the new table. Returns rows upserted."""
+    cols = ", ".join(columns)
+    updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != "id")
+    # xid is 32-bit and wraps; age() compares both against the current one instead
+    result = await conn.execute(text(
+        f"INSERT INTO {NEW} ({cols}) SELECT {cols} FROM memories"
+        " WHERE age(xmin) <= age(CAST(:since AS xid))"
+        f" ON CONFLICT (id) DO UPDATE SET {updates}"
+    ).bindparams(since=str(int(since) % 2**32)))
+    return result.rowcount
+
+
+async def _swap(definitions: list[tuple[str, str]], partitions: int, columns: list[str], since: str) -> int:
+    """Swap the new table in; returns the rows caught up under the lock."""
+    async with engine.begin() as conn:
+        await conn.execute(text("LOCK TABLE memories IN ACCESS EXCLUSIVE MODE"))
+        caught_up = await _catch_up(conn, columns, since)
+        old_rows, new_rows = (await conn.execute(text(
+            f"SELECT (SELECT count(*) FROM memories), (SELECT count(*) FROM {NEW})"
+        ))).one()
+        if old_rows != new_rows:
+            # Rows were deleted meanwhile; nothing is dropped, the conversion can simply be rerun
+            raise RuntimeError(f"memories has {old_rows} rows but {NEW} has {new_rows}; swap aborted")
+        for table, name, _ in _REFERENCING_FKS:
+            await conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}"))
+        await conn.execute(text("DROP TABLE memories"))
+        await conn.execute(text("DROP TABLE IF EXISTS memory_short_ids"))
+        await conn.execute(text(f"ALTER TABLE {NEW} RENAME TO memories"))
+        await conn.execute(text(f"ALTER INDEX {NEW}_pkey RENAME TO memories_pkey"))
+        for fk in ("agent_id_fkey", "duplicate_of_fkey"):
+            await conn.execute(text(f"ALTER TABLE memories RENAME CONSTRAINT {NEW}_{fk} TO memories_{fk}"))
+        for i in range(partitions):
+            await conn.execute(text(f"ALTER TABLE {NEW}_p{i} RENAME TO memories_p{i}"))
+        children = await conn.execute(text(
+            "SELECT c.relname FROM pg_inherits h"
+            " JOIN pg_index i ON i.indrelid = h.inhrelid JOIN pg_class c ON c.oid = i.indexrelid"
+            f" WHERE h.inhparent = 'memories'::regclass AND c.relname LIKE '{NEW}_%'"
+        ))
+        for (child,) in children.fetchall():
+            await conn.execute(text(f"ALTER INDEX {child} RENAME TO memories_{child[len(NEW) + 1:]}"))
+        names = [name for name, _ in definitions] + (["ix_memories_short_id"] if partitions else [])
+        for name in names:
+            await conn.execute(text(f"ALTER INDEX {name}_new RENAME TO {name}"))
+
+        if partitions:
+            await conn.execute(text(
+                "CREATE TABLE memory_short_ids (short_id text PRIMARY KEY, memory_id uuid NOT NULL)"
+            ))
+            await conn.execute(text(
+                "INSERT INTO memory_short_ids (short_id, memory_id) SELECT short_id, id FROM memories"
+            ))
+            await conn.execute(text(_SHORT_ID_TRIGGER_SQL))
+            await conn.execute(text(
+                "CREATE TRIGGER memories_short_id_sync AFTER INSERT OR DELETE ON memories"
+                " FOR EACH ROW EXECUTE FUNCTION memory_short_ids_sync()"
+            ))
+        else:
+            await conn.execute(text(
+                "ALTER TABLE memories ADD CONSTRAINT memories_short_id_key UNIQUE (short_id)"
+            ))
+            await conn.execute(text("DROP FUNCTION IF EXISTS memory_short_ids_sync()"))
+
+        for table, name, column in _REFERENCING_FKS:
+            # Rows were copied, not changed: NOT VALID skips the full recheck under the lock
+            await conn.execute(text(
+                f"ALTER TABLE {table} ADD CONSTRAINT {name}"
+                f" FOREIGN KEY ({column}) REFERENCES memories(id) NOT VALID"
+            ))
+    return caught_up
+
+
+async def _validate_fks() -> None:
+    async with engine.begin() as conn:
+        for table, name, _ in _REFERENCING_FKS:
+            await conn.execute(text(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}"))
+
+
+async def _set_writes(value: str | None) -> str | None:
+    """Set global_write_enabled (None leaves it unset); returns the previous value."""
+    async with engine.begin() as conn:
+        previous = (await conn.execute(text(
+            "SELECT value FROM system_config WHERE key = 'global_write_enabled'"
+        ))).scalar()
+        if value is None:
+            await conn.execute(text("DELETE FROM system_config WHERE key = 'global_write_enabled'"))
+        else:
+            await conn.execute(text(
+                "INSERT INTO system_config (key, value, updated_at) VALUES ('global_write_enabled', :v, now())"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at"
+            ).bindparams(v=value))
+    return previous
+
+
+async def convert(partitions: int) -> dict:
+    """Rebuild memories with `partitions` hash partitions (0 = plain table). Returns timings."""
+    if partitions == 1 or partitions < 0:
+        raise ValueError("partitions must be 0 (plain table) or at least 2")
+    stats: dict = {"partitions": partitions}
+    t0 = time.perf_counter()
+    previous = await _set_writes("false")
+    try:
+        async with engine.begin() as conn:
+            columns = await _copyable_columns(conn)
+            definitions = await _index_definitions(conn)
+            await _create_table(conn, partitions)
+        since = await _copy_start()
+        stats["rows"] = await _copy_rows(columns)
+        stats["copy_seconds"] = round(time.perf_counter() - t0, 2)
+
+        t1 = time.perf_counter()
+        await _build_indexes(definitions, partitions)
+        stats["index_seconds"] = round(time.perf_counter() - t1, 2)
+
+        stats["caught_up"] = await _swap(definitions, partitions, columns, since)
+        await _validate_fks()
+    except BaseException:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP TABLE IF EXISTS {NEW} CASCADE"))
+        raise
+    finally:
+        await _set_writes(previous)
+        clear_partition_cache()
+    stats["seconds"] = round(time.perf_counter() - t0, 2)
+    return stats
+
+
+async def status() -> dict:
+    async with engine.connect() as conn:
+        rows = (await conn.execute(text(
+            "SELECT c.relname AS name, c.reltuples AS rows,"
+            "  pg_total_relation_size(c.oid) AS total_bytes"
+            " FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+            " WHERE i.inhparent = to_regclass('memories')"
+            " ORDER BY c.relname"
+        ))).fetchall()
+    return {
+        "partitioned": bool(rows),
+        "partitions": [
+            {"name": r.name, "rows": max(int(r.rows), 0), "total_bytes": r.total_bytes} for r in rows
+        ],
+    }
+
+
+async def _run(args) -> None:
+    try:
+        result = await convert(args.partitions) if args.command == "convert" else await status()
+        print(json.dumps(result), flush=True)
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    conv = sub.add_parser("convert", help="rebuild memories with N hash partitions (0 = plain table)")
+    conv.add_argument("--partitions", type=int, required=True)
+    sub.add_parser("status", help="list partitions with row estimates and sizes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Chunked (un)quarantine of an agent's memories.
+
+Memories are updated in keyset-ordered batches of `quarantine_batch_size`,
+each in its own short transaction, with `quarantine_batch_pause` seconds
+between batches so row locks and index churn stay bounded. Cached searches
+are purged every `quarantine_purge_batches` batches and at the end: each
+purge scans the whole search cache. Progress is kept as JSON in
+system_config under `quarantine_job:<agent_id>`.
+
+A job lives in a background task, so a restart kills it mid-way. Running
+jobs that stopped saving progress for `quarantine_stale_seconds` are marked
+failed at startup (fail_stale_jobs); POSTing the same action again resumes
+a failed or stale job from its `last_id`. While one action's job is live,
+POSTing the other one is refused (409).
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import select, text
+
+from app.cache import invalidate_memories, purge_search_cache
+from app.config import settings
+from app.db.engine import async_session
+from app.db.models import SystemConfig
+from app.db.queries.system import get_config, set_config
+
+logger = logging.getLogger(__name__)
+
+QUARANTINED = -2
+
+
+def job_key(agent_id: uuid.UUID) -> str:
+    return f"quarantine_job:{agent_id}"
+
+
+async def get_job(db, agent_id: uuid.UUID) -> dict | None:
+    raw = await get_config(db, job_key(agent_id))
+    return json.loads(raw) if raw is not None else None
+
+
+async def _save(db, agent_id: uuid.UUID, job: dict) -> None:
+    job["updated_at"] = datetime.now(timezone.utc).isoformat()
+    await set_config(db, job_key(agent_id), json.dumps(job))
+
+
+def new_job(action: str) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "action": action,
+        "status": "running",
+        "processed": 0,
+        "last_id": None,
+        "started_at": now,
+        "updated_at": now,
+        "finished_at": None,
+        "error": None,
+    }
+
+
+def is_stale(job: dict) -> bool:
+    """Running, but no progress saved for quarantine_stale_seconds: its task is gone."""
+    if job["status"] != "running":
+        return False
+    updated = datetime.fromisoformat(job.get("updated_at") or job["started_at"])
+    return (datetime.now(timezone.utc) - updated).total_seconds() > settings.quarantine_stale_seconds
+
+
+def is_live(job: dict | None) -> bool:
+    return job is not None and job["status"] == "running" and not is_stale(job)
+
+
+async def conflicting_job(db, agent_id: uuid.UUID, action: str) -> dict | None:
+    """The other action's job while it is still live: the two would fight over the same rows."""
+    job = await get_job(db, agent_id)
+    return job if is_live(job) and job["action"] != action else None
+
+
+async def start_job(db, agent_id: uuid.UUID, action: str) -> tuple[dict, bool]:
+    """Job for a (re-)POSTed action and whether a task must be started for it.
+
+    A failed or stale job of the same action resumes from its last_id; a live
+    one is returned as is, so a repeated POST doesn't start a second task.
+    """
+    job = await get_job(db, agent_id)
+    if is_live(job) and job["action"] == action:
+        return job, False
+    if job is not None and job["action"] == action and (job["status"] == "failed" or is_stale(job)):
+        job.update(status="running", finished_at=None, error=None)
+    else:
+        job = new_job(action)
+    await _save(db, agent_id, job)
+    return job, True
+
+
+async def fail_stale_jobs() -> int:
+    """Mark running jobs whose task died with a previous process as failed. Returns jobs marked."""
+    async with async_session() as db:
+        rows = (
+            await db.execute(
+                select(SystemConfig.key, SystemConfig.value).where(SystemConfig.key.like("quarantine_job:%"))
+            )
+        ).fetchall()
+        marked = 0
+        for key, value in rows:
+            job = json.loads(value)
+            if is_stale(job):
+                job.update(status="failed", error="interrupted", finished_at=datetime.now(timezone.utc).isoformat())
+                await set_config(db, key, json.dumps(job))
+                marked += 1
+        if marked:
+            logger.warning("marked %d interrupted quarantine jobs as failed; POST again to resume", marked)
+        return marked
+
+
+async def run_quarantine_job(agent_id: uuid.UUID, action: str, restore_quality: int = 0) -> None:
+    """Quarantine (quality=-2) or restore (quality=restore_quality) all memories of an agent."""
+    target = QUARANTINED if action == "quarantine" else restore_quality
+    async with async_session() as db:
+        job = await get_job(db, agent_id) or new_job(action)
+        after = uuid.UUID(job["last_id"]) if job["last_id"] else uuid.UUID(int=0)
+        pending: list[str] = []
+        batches = 0
+        try:
+            while True:
+                # Only touch rows that still need the change; keyset on id keeps each batch an index range scan
+                result = await db.execute(
+                    text(
+                        "WITH batch AS ("
+                        "  SELECT id FROM memories"
+                        "  WHERE agent_id = :aid AND id > :after AND "
+                        + ("quality <> -2" if action == "quarantine" else "quality = -2")
+                        + "  ORDER BY id LIMIT :n"
+                        ")"
+                        " UPDATE memories m SET quality = :q FROM batch"
+                        " WHERE m.id = batch.id"
+                        " RETURNING m.id, m.short_id"
+                    ).bindparams(aid=agent_id, after=after, n=settings.quarantine_batch_size, q=target)
+                )
+                rows = result.fetchall()
+                await db.commit()
+                if not rows:
+                    break
+
+                after = max(row.id for row in rows)
+                ids = [str(row.id) for row in rows]
+                await invalidate_memories(ids + [row.short_id for row in rows])
+                pending.extend(ids)
+                batches += 1
+                if batches % settings.quarantine_purge_batches == 0:
+                    await purge_search_cache(pending)
+                    pending = []
+
+                job["processed"] += len(rows)
+                job["last_id"] = str(after)
+                await _save(db, agent_id, job)
+                await asyncio.sleep(settings.quarantine_batch_pause)
+
+            await purge_search_cache(pending)
+            job["status"] = "done"
+        except Exception as exc:
+            logger.exception("%s job for agent %s failed", action, agent_id)
+            await db.rollback()
+            job["status"] = "failed"
+            job["error"] = str(exc)
+            # A resumed job starts past these rows, so their cached searches go now or never
+            try:
+                await purge_search_cache(pending)
+            except Exception:
+                logger.exception("search cache purge after failed %s job", action)
+        job["finished_at"] = datetime.now(timezone.utc).isoformat()
+        await _save(db, agent_id, job)
@@ -0,0 +1,441 @@
+"""Bulk export and import of the corpus as NDJSON.
+
+Export streams one JSON object per line from a single repeatable-read
+snapshot through server-side cursors, so memory use is constant:
+
+  {"type": "header", "format": 1, "embedding_model": ..., "embedding_dim": ...}
+  {"type": "agent", ...}      (unless agents are excluded)
+  {"type": "memory", ...}
+  {"type": "link", ...}
+
+`embedding` is base64 of the pgvector binary form (uint16 dim, uint16 0,
+dim x float32 big-endian), passed through from the database untouched.
+
+Import COPYs records into session temp tables in batches of
+`transfer_batch_size` (asyncpg copy_records_to_table) and moves them over
+with INSERT ... ON CONFLICT DO NOTHING, so re-importing is harmless.
+Stored embeddings are reused when `embedding_model` and dimension match;
+other memories (or ones without an embedding, e.g. hand-written seed files
+with just content and tags) are embedded with embed_many and get their
+similar/duplicate_candidate links computed in bulk at the end. Exported
+links and duplicate_of are applied after all memories, dropping any that
+point at memories not in the target.
+
+CLI: python -m app.jobs.transfer export [-o corpus.ndjson] [--no-agents]
+     python -m app.jobs.transfer import corpus.ndjson [--agent-id UUID] [--rebuild-index]
+"""
+
+import argparse
+import asyncio
+import base64
+import logging
+import struct
+import sys
+import time
+import uuid
+from collections.abc import AsyncIterable, AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import orjson
+
+from app.config import settings
+from app.db.engine import engine
+from app.dedup import content_hash, simhash, simhash_bands
+from app.embedding.client import embedding_client
+from app.jobs.vector_index import index_sql
+from app.shortid import generate_short_id
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+EMBED_BATCH = 256
+# Memories per nearest-neighbour pass when linking re-embedded imports
+RELINK_BATCH = 500
+
+AGENT_COLUMNS = (
+    "id", "name", "api_key_hash", "created_at", "disabled_at", "trust_level", "notes",
+    "retrieved_memories", "quarantine_count",
+)
+MEMORY_COLUMNS = (
+    "id", "short_id", "agent_id", "content", "content_hash", "simhash", "simhash_bands", "tags",
+    "source_url", "created_at", "embedding", "embedding_model", "quality", "retrieval_count",
+    "cluster_id",
+)
+LINK_COLUMNS = ("id", "memory_id", "related_id", "relation", "similarity", "created_at")
+_TIMESTAMPS = {"created_at", "disabled_at"}
+# As created by migration 008
+HNSW_INDEX_SQL = index_sql()
+
+# duplicate_of is exported with memories but applied after all of them are in
+_EXPORTS = (
+    ("agent", "agents", AGENT_COLUMNS),
+    ("memory", "memories", MEMORY_COLUMNS + ("duplicate_of",)),
+    ("link", "memory_links", LINK_COLUMNS),
+)
+
+
+def current_model() -> str:
+    return f"openai/{settings.embedding_model}"
+
+
+def pack_vector(values: list[float]) -> bytes:
+    return struct.pack(f">HH{len(values)}f", len(values), 0, *values)
+
+
+def vector_dim(packed: bytes) -> int:
+    return struct.unpack_from(">H", packed)[0]
+
+
+@asynccontextmanager
+async def raw_connection():
+    """A dedicated asyncpg connection with vectors as raw pgvector binary (bytes in, bytes out)."""
+    async with engine.connect() as sa_conn:
+        conn = (await sa_conn.get_raw_connection()).driver_connection
+        await conn.set_type_codec("vector", encoder=bytes, decoder=bytes, format="binary")
+        try:
+            yield conn
+        finally:
+            # The codec would confuse pooled users of this connection: don't give it back
+            await sa_conn.invalidate()
+
+
+def _encode(kind: str, record) -> bytes:
+    row = dict(record)
+    if row.get("embedding") is not None:
+        row["embedding"] = base64.b64encode(row["embedding"]).decode()
+    # asyncpg's UUID type isn't one orjson knows; str() is its canonical form
+    return orjson.dumps({"type": kind, **row}, default=str)
+
+
+async def export_ndjson(conn, *, agents: bool = True) -> AsyncIterator[bytes]:
+    """Yield NDJSON in chunks of up to `transfer_batch_size` lines."""
+    yield orjson.dumps({
+        "type": "header",
+        "format": FORMAT_VERSION,
+        "embedding_model": current_model(),
+        "embedding_dim": settings.embedding_dim,
+    }) + b"\n"
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        for kind, table, columns in _EXPORTS:
+            if kind == "agent" and not agents:
+                continue
+            lines: list[bytes] = []
+            sql = f"SELECT {', '.join(columns)} FROM {table}"
+            async for record in conn.cursor(sql, prefetch=settings.transfer_batch_size):
+                lines.append(_encode(kind, record))
+                if len(lines) >= settings.transfer_batch_size:
+                    yield b"\n".join(lines) + b"\n"
+                    lines = []
+            if lines:
+                yield b"\n".join(lines) + b"\n"
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into non-empty lines."""
+    tail = b""
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if tail.strip():
+        yield tail
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _row(obj: dict, columns: tuple[str, ...]) -> tuple:
+    # Hand-written seed lines may leave out ids and timestamps
+    row = {c: _parse_time(obj.get(c)) if c in _TIMESTAMPS else obj.get(c) for c in columns}
+    row["id"] = row["id"] or uuid.uuid4()
+    row["created_at"] = row["created_at"] or datetime.now(timezone.utc)
+    return tuple(row[c] for c in columns)
+
+
+def _memory_row(obj: dict, agent_id: uuid.UUID | None) -> tuple:
+    memory_id = uuid.UUID(str(obj["id"])) if obj.get("id") else uuid.uuid4()
+    content = obj["content"]
+    fingerprint = obj.get("simhash")
+    if fingerprint is None:
+        fingerprint = simhash(content)
+    row = {
+        "id": memory_id,
+        "short_id": obj.get("short_id") or generate_short_id(),
+        "agent_id": agent_id or uuid.UUID(str(obj["agent_id"])),
+        "content": content,
+        "content_hash": content_hash(content),
+        "simhash": fingerprint,
+        "simhash_bands": obj.get("simhash_bands") or simhash_bands(fingerprint),
+        "tags": obj.get("tags") or [],
+        "source_url": obj.get("source_url"),
+        "created_at": _parse_time(obj.get("created_at")) or datetime.now(timezone.utc),
+        "embedding": base64.b64decode(obj["embedding"]) if obj.get("embedding") else None,
+        "embedding_model": obj.get("embedding_model"),
+        "quality": obj.get("quality", 0),
+        "retrieval_count": obj.get("retrieval_count", 0),
+        "cluster_id": uuid.UUID(str(obj["cluster_id"])) if obj.get("cluster_id") else memory_id,
+    }
+    return tuple(row[c] for c in MEMORY_COLUMNS)
+
+
+class Importer:
+    def __init__(self, conn, *, agent_id: uuid.UUID | None = None):
+        self.conn = conn
+        self.agent_id = agent_id
+        self.stats = {
+            "agents": 0,
+            "memories": 0,
+            "memories_skipped": 0,
+            "embedded": 0,
+            "links": 0,
+            "relinked": 0,
+        }
+        self._agents: list[tuple] = []
+        self._memories: list[tuple] = []
+        self._duplicates: list[tuple] = []
+        self._links: list[tuple] = []
+
+    async def setup(self) -> None:
+        # Staging tables live for this connection only; import_relink/duplicates/links
+        # accumulate across batches and are applied once every memory is in
+        await self.conn.execute(
+            "CREATE TEMP TABLE import_agents (LIKE agents INCLUDING DEFAULTS);"
+            " CREATE TEMP TABLE import_memories (LIKE memories INCLUDING DEFAULTS);"
+            " CREATE TEMP TABLE import_duplicates (id uuid, duplicate_of uuid);"
+            " CREATE TEMP TABLE import_links (LIKE memory_links INCLUDING DEFAULTS);"
+            " CREATE TEMP TABLE import_relink (id uuid PRIMARY KEY)"
+        )
+
+    async def add(self, obj: dict) -> None:
+        kind = obj.get("type", "memory")
+        if kind == "header":
+            if obj.get("format", FORMAT_VERSION) != FORMAT_VERSION:
+                raise ValueError(f"Unsupported export format {obj.get('format')}")
+        elif kind == "agent":
+            if self.agent_id is None:
+                self._agents.append(_row(obj, AGENT_COLUMNS))
+                if len(self._agents) >= settings.transfer_batch_size:
+                    await self._flush_agents()
+        elif kind == "memory":
+            await self._flush_agents()
+            if not obj.get("content") or not (self.agent_id or obj.get("agent_id")):
+                raise ValueError("memory lines need content and agent_id (or an agent_id override)")
+            row = _memory_row(obj, self.agent_id)
+            self._memories.append(row)
+            if obj.get("duplicate_of"):
+                self._duplicates.append((row[0], uuid.UUID(str(obj["duplicate_of"]))))
+            if len(self._memories) >= settings.transfer_batch_size:
+                await self._flush_memories()
+        elif kind == "link":
+            self._links.append(_row(obj, LINK_COLUMNS))
+            if len(self._links) >= settings.transfer_batch_size:
+                await self._stage_links()
+        else:
+            raise ValueError(f"Unknown record type {kind!r}")
+
+    async def _flush_agents(self) -> None:
+        if not self._agents:
+            return
+        async with self.conn.transaction():
+            await self.conn.copy_records_to_table("import_agents", records=self._agents, columns=AGENT_COLUMNS)
+            inserted = await self.conn.fetchval(
+                f"WITH ins AS (INSERT INTO agents ({', '.join(AGENT_COLUMNS)})"
+                f" SELECT {', '.join(AGENT_COLUMNS)} FROM import_agents"
+                " ON CONFLICT DO NOTHING RETURNING 1)"
+                " SELECT count(*) FROM ins"
+            )
+            await self.conn.execute("TRUNCATE import_agents")
+        self.stats["agents"] += inserted
+        self._agents = []
+
+    async def _embed_missing(self, rows: list[tuple]) -> tuple[list[tuple], list[uuid.UUID]]:
+        """Re-embed rows whose stored vector can't be reused. Returns (rows, re-embedded ids)."""
+        e, m = MEMORY_COLUMNS.index("embedding"), MEMORY_COLUMNS.index("embedding_model")
+        model = current_model()
+        stale = [
+            i for i, r in enumerate(rows)
+            if r[e] is None or r[m] != model or vector_dim(r[e]) != settings.embedding_dim
+        ]
+        rows = list(rows)
+        for start in range(0, len(stale), EMBED_BATCH):
+            chunk = stale[start:start + EMBED_BATCH]
+            vectors = await embedding_client.embed_many([rows[i][MEMORY_COLUMNS.index("content")] for i in chunk])
+            for i, vector in zip(chunk, vectors):
+                row = list(rows[i])
+                row[e], row[m] = pack_vector(vector), model
+                rows[i] = tuple(row)
+        return rows, [rows[i][0] for i in stale]
+
+    async def _flush_memories(self) -> None:
+        if not self._memories:
+            return
+        # Rows already in the target would be dropped by ON CONFLICT anyway; don't pay to embed them
+        present = {
+            r["id"] for r in await self.conn.fetch(
+                "SELECT id FROM memories WHERE id = ANY($1::uuid[])", [r[0] for r in self._memories]
+            )
+        }
+        rows, embedded = await self._embed_missing([r for r in self._memories if r[0] not in present])
+        cols = ", ".join(MEMORY_COLUMNS)
+        async with self.conn.transaction():
+            await self.conn.copy_records_to_table("import_memories", records=rows, columns=MEMORY_COLUMNS)
+            # Memories of agents missing from the target are skipped, not fatal
+            inserted = await self.conn.fetch(
+                f"INSERT INTO memories ({cols}) SELECT {cols} FROM import_memories s"
+                " WHERE EXISTS (SELECT 1 FROM agents a WHERE a.id = s.agent_id)"
+                " ON CONFLICT DO NOTHING RETURNING id"
+            )
+            await self.conn.execute("TRUNCATE import_memories")
+            if embedded:
+                await self.conn.execute(
+                    "INSERT INTO import_relink SELECT unnest($1::uuid[]) ON CONFLICT DO NOTHING",
+                    list({r["id"] for r in inserted} & set(embedded)),
+                )
+            if self._duplicates:
+                await self.conn.copy_records_to_table("import_duplicates", records=self._duplicates)
+        self.stats["memories"] += len(inserted)
+        self.stats["memories_skipped"] += len(self._memories) - len(inserted)
+        self.stats["embedded"] += len(embedded)
+        self._memories = []
+        self._duplicates = []
+
+    async def _stage_links(self) -> None:
+        if self._links:
+            await self.conn.copy_records_to_table("import_links", records=self._links, columns=LINK_COLUMNS)
+            self._links = []
+
+    async def finish(self) -> dict:
+        await self._flush_agents()
+        await self._flush_memories()
+        await self._stage_links()
+        cols = ", ".join(LINK_COLUMNS)
+        async with self.conn.transaction():
+            await self.conn.execute(
+                "UPDATE memories m SET duplicate_of = d.duplicate_of"
+                " FROM import_duplicates d JOIN memories t ON t.id = d.duplicate_of"
+                " WHERE m.id = d.id AND m.duplicate_of IS NULL"
+            )
+            self.stats["links"] = await self.conn.fetchval(
+                f"WITH ins AS (INSERT INTO memory_links ({cols})"
+                f" SELECT {', '.join('l.' + c for c in LINK_COLUMNS)} FROM import_links l"
+                " JOIN memories a ON a.id = l.memory_id JOIN memories b ON b.id = l.related_id"
+                " ON CONFLICT DO NOTHING RETURNING 1)"
+                " SELECT count(*) FROM ins"
+            )
+        return self.stats
+
+    async def relink(self) -> None:
+        """Links for re-embedded memories, as the write path would create them (top 10 neighbours)."""
+        while True:
+            async with self.conn.transaction():
+                row = await self.conn.fetchrow(
+                    "WITH batch AS ("
+                    "  DELETE FROM import_relink WHERE id IN (SELECT id FROM import_relink LIMIT $1)"
+                    "  RETURNING id"
+                    "), ins AS ("
+                    "  INSERT INTO memory_links (id, memory_id, related_id, relation, similarity)"
+                    "  SELECT gen_random_uuid(), src.id, nn.id,"
+                    "    CASE WHEN nn.similarity >= $3 THEN 'duplicate_candidate' ELSE 'similar' END,"
+                    "    nn.similarity"
+                    "  FROM batch JOIN memories src ON src.id = batch.id"
+                    "  CROSS JOIN LATERAL ("
+                    "    SELECT m.id, 1 - (m.embedding <=> src.embedding) AS similarity FROM memories m"
+                    "    WHERE m.id <> src.id AND m.quality > -2"
+                    "    ORDER BY m.embedding <=> src.embedding LIMIT 10"
+                    "  ) nn"
+                    "  WHERE nn.similarity >= $2"
+                    "  RETURNING 1"
+                    ")"
+                    " SELECT (SELECT count(*) FROM batch) AS memories, (SELECT count(*) FROM ins) AS links",
+                    RELINK_BATCH,
+                    settings.min_similarity,
+                    settings.duplicate_threshold,
+                )
+            if not row["memories"]:
+                return
+            self.stats["relinked"] += row["links"]
+
+
+async def import_ndjson(
+    conn,
+    lines: AsyncIterable[bytes],
+    *,
+    agent_id: uuid.UUID | None = None,
+    rebuild_index: bool = False,
+) -> dict:
+    """Import NDJSON lines. Batches already committed stay in if a later line fails.
+
+    `rebuild_index` drops the HNSW index for the load and builds it afterwards,
+    much faster than per-row index inserts on large imports but leaving
+    searches unindexed meanwhile: for restores into an offline database.
+    """
+    t0 = time.perf_counter()
+    importer = Importer(conn, agent_id=agent_id)
+    await importer.setup()
+    if rebuild_index:
+        await conn.execute("DROP INDEX IF EXISTS ix_memories_embedding")
+    try:
+        async for line in lines:
+            await importer.add(orjson.loads(line))
+        stats = await importer.finish()
+    finally:
+        if rebuild_index:
+            # HNSW builds are several times faster when the graph fits in memory
+            await conn.execute(f"SET maintenance_work_mem = '{settings.transfer_index_build_mem}'")
+            await conn.execute(HNSW_INDEX_SQL)
+    await importer.relink()
+    elapsed = time.perf_counter() - t0
+    rows = stats["agents"] + stats["memories"] + stats["links"]
+    stats["seconds"] = round(elapsed, 2)
+    stats["rows_per_sec"] = round(rows / elapsed) if elapsed else rows
+    return stats
+
+
+async def _file_chunks(path: str) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            yield chunk
+
+
+async def _export_cli(path: str, agents: bool) -> None:
+    out = open(path, "wb") if path != "-" else sys.stdout.buffer
+    async with raw_connection() as conn:
+        async for chunk in export_ndjson(conn, agents=agents):
+            out.write(chunk)
+    out.flush()
+
+
+async def _import_cli(path: str, agent_id: uuid.UUID | None, rebuild_index: bool) -> None:
+    async with raw_connection() as conn:
+        stats = await import_ndjson(
+            conn, iter_lines(_file_chunks(path)), agent_id=agent_id, rebuild_index=rebuild_index
+        )
+    logger.info("import: %s", orjson.dumps(stats).decode())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export")
+    exp.add_argument("-o", "--output", default="-", help="file to write; - for stdout")
+    exp.add_argument("--no-agents", action="store_true", help="leave out agents (and their key hashes)")
+    imp = sub.add_parser("import")
+    imp.add_argument("input")
+    imp.add_argument("--agent-id", type=uuid.UUID, help="assign every memory to this agent; agent lines are ignored")
+    imp.add_argument(
+        "--rebuild-index", action="store_true", help="drop the HNSW index during the load and rebuild it after"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "export":
+        asyncio.run(_export_cli(args.output, not args.no_agents))
+    else:
+        asyncio.run(_import_cli(args.input, args.agent_id, args.rebuild_index))
+
+
+if __name__ == "__main__":
+    main()
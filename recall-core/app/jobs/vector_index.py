@@ -0,0 +1,251 @@
+"""Health and rebuilds of the vector index (ix_memories_embedding).
+
+The index is partial: it only covers live memories (quality > -2), the same
+predicate every ANN query filters on, so quarantined spam never takes
+candidate slots. Rows that leave the predicate (quarantine, delete) still
+leave entries behind until vacuum; HNSW vacuum only patches the graph
+around them, and recall and latency degrade as they pile up.
+
+`health()` reports the index size, the dead-tuple ratio of memories, the
+quarantined share of rows and the stale share of index entries (entries
+beyond the live rows). `reindex()` rebuilds with REINDEX CONCURRENTLY, so
+searches and writes keep going, using `vector_index_build_mem` and
+`vector_index_parallel_workers`. Progress is kept as JSON in system_config
+under `vector_index_job`. A rebuild holds a session-level advisory lock
+(REINDEX_LOCK) on its connection, so a second worker or admin POST is
+skipped or gets 409 instead of starting a competing REINDEX.
+
+Run: python -m app.jobs.vector_index status|reindex [--force] [--interval 3600]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.db.engine import async_session, engine
+from app.db.queries.system import get_config, set_config
+
+logger = logging.getLogger(__name__)
+
+JOB_KEY = "vector_index_job"
+INDEX = "ix_memories_embedding"
+LIVE_PREDICATE = "quality > -2"
+REINDEX_LOCK = 0x52434C03
+# A "running" job whose worker hasn't taken REINDEX_LOCK yet still counts as running
+# for this long; after that, an unlocked "running" record is left over from a crash
+QUEUED_GRACE = timedelta(seconds=60)
+
+
+def index_sql(name: str = INDEX, params: dict | None = None, concurrently: bool = False) -> str:
+    """CREATE INDEX for the partial HNSW index, optionally WITH (m = .., ef_construction = ..)."""
+    with_ = f" WITH ({', '.join(f'{k} = {int(v)}' for k, v in params.items())})" if params else ""
+    return (
+        f"CREATE INDEX{' CONCURRENTLY' if concurrently else ''} {name} ON memories"
+        f" USING hnsw (embedding vector_cosine_ops){with_} WHERE {LIVE_PREDICATE}"
+    )
+
+
+async def get_job(db) -> dict | None:
+    raw = await get_config(db, JOB_KEY)
+    return json.loads(raw) if raw is not None else None
+
+
+def new_job(reasons: list[str]) -> dict:
+    return {
+        "status": "running",
+        "reasons": reasons,
+        "index_bytes_before": None,
+        "index_bytes_after": None,
+        "seconds": None,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "finished_at": None,
+        "error": None,
+    }
+
+
+async def is_running(db) -> bool:
+    """Whether a rebuild holds REINDEX_LOCK, or was just queued and hasn't taken it yet."""
+    held = await db.scalar(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND granted"
+            " AND classid = 0 AND objid::bigint = :k AND objsubid = 1)"
+        ).bindparams(k=REINDEX_LOCK)
+    )
+    if held:
+        return True
+    job = await get_job(db)
+    return (
+        job is not None
+        and job["status"] == "running"
+        and datetime.fromisoformat(job["started_at"]) > datetime.now(timezone.utc) - QUEUED_GRACE
+    )
+
+
+async def health() -> dict:
+    """Index size and validity, table bloat, quarantined share, and whether a rebuild is due."""
+    async with async_session() as db:
+        # When memories is partitioned (app.jobs.partition) sizes and stats are summed
+        # over the leaf partitions; a plain table or index is its own only leaf
+        row = (await db.execute(text(
+            "WITH idx AS ("
+            "  SELECT c.oid, i.indisvalid, i.indpred IS NOT NULL AS partial"
+            "  FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = :index"
+            "), leaves AS ("
+            "  SELECT l.oid, l.reltuples FROM idx JOIN pg_class l ON l.oid = idx.oid"
+            "  OR l.oid IN (SELECT relid FROM pg_partition_tree(idx.oid) WHERE isleaf)"
+            "  WHERE l.relkind <> 'I'"
+            "), tables AS ("
+            "  SELECT s.n_live_tup, s.n_dead_tup FROM pg_stat_user_tables s"
+            "  JOIN pg_class t ON t.oid = s.relid AND t.relkind = 'r'"
+            "  WHERE s.relid = to_regclass('memories')"
+            "  OR s.relid IN (SELECT relid FROM pg_partition_tree('memories') WHERE isleaf)"
+            ")"
+            " SELECT EXISTS (SELECT 1 FROM idx) AS exists,"
+            "  (SELECT coalesce(sum(pg_relation_size(oid)), 0) FROM leaves) AS index_bytes,"
+            "  (SELECT indisvalid FROM idx) AS valid,"
+            "  (SELECT partial FROM idx) AS partial,"
+            "  (SELECT CASE WHEN bool_and(reltuples >= 0) THEN sum(reltuples) END FROM leaves) AS index_entries,"
+            "  (SELECT sum(n_live_tup) FROM tables) AS live_tuples,"
+            "  (SELECT sum(n_dead_tup) FROM tables) AS dead_tuples,"
+            "  (SELECT count(*) FROM memories WHERE quality = -2) AS quarantined,"
+            "  (SELECT count(*) FROM memories) AS total,"
+            "  (SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('memories')) AS partitioned"
+        ).bindparams(index=INDEX))).one()
+
+    total = row.total or 0
+    live = total - row.quarantined
+    dead = int(row.dead_tuples or 0)
+    tuples = int(row.live_tuples or 0) + dead
+    dead_ratio = dead / tuples if tuples else 0.0
+    # reltuples is -1 until an index has been built or vacuumed at least once
+    entries = float(row.index_entries) if row.index_entries is not None else None
+    searchable = live if row.partial else total
+    stale_ratio = max(0.0, entries - searchable) / entries if entries else 0.0
+    if row.exists and not row.partial:
+        # A full index also carries every quarantined row
+        stale_ratio = max(stale_ratio, row.quarantined / total if total else 0.0)
+
+    reasons = []
+    if not row.exists:
+        reasons.append("missing")
+    elif not row.valid:
+        reasons.append("invalid")
+    if not row.partial and row.exists:
+        reasons.append("not_partial")
+    if dead_ratio >= settings.vector_index_max_dead_ratio:
+        reasons.append("dead_tuples")
+    if stale_ratio >= settings.vector_index_max_stale_ratio:
+        reasons.append("stale_entries")
+
+    return {
+        "index": INDEX,
+        "exists": row.exists,
+        "valid": bool(row.valid),
+        "partial": bool(row.partial),
+        "partitioned": bool(row.partitioned),
+        "index_bytes": int(row.index_bytes),
+        "index_entries": int(entries) if entries is not None else None,
+        "rows": total,
+        "quarantined_rows": row.quarantined,
+        "quarantined_ratio": round(row.quarantined / total, 4) if total else 0.0,
+        "dead_tuple_ratio": round(dead_ratio, 4),
+        "stale_entry_ratio": round(stale_ratio, 4),
+        "reindex_recommended": bool(reasons),
+        "reasons": reasons,
+    }
+
+
+async def _rebuild(conn, report: dict) -> None:
+    if report["exists"] and report["partial"]:
+        await conn.execute(text(f"REINDEX INDEX CONCURRENTLY {INDEX}"))
+        return
+    # Missing, or the old full index: build the partial one beside it, then swap names.
+    # A partitioned table can't build CONCURRENTLY, so that build blocks writes meanwhile
+    concurrently = not report["partitioned"]
+    drop = "DROP INDEX CONCURRENTLY IF EXISTS" if concurrently else "DROP INDEX IF EXISTS"
+    await conn.execute(text(f"{drop} {INDEX}_new"))
+    await conn.execute(text(index_sql(f"{INDEX}_new", concurrently=concurrently)))
+    await conn.execute(text(f"{drop} {INDEX}"))
+    await conn.execute(text(f"ALTER INDEX {INDEX}_new RENAME TO {INDEX}"))
+
+
+async def run_reindex(job: dict, report: dict) -> dict:
+    """Rebuild the index for `job`; stores and returns the finished job.
+
+    Returns the job with status "skipped", without storing it, when another
+    rebuild holds REINDEX_LOCK.
+    """
+    t0 = time.perf_counter()
+    try:
+        # CONCURRENTLY can't run inside a transaction block
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            if not await conn.scalar(text("SELECT pg_try_advisory_lock(:k)").bindparams(k=REINDEX_LOCK)):
+                logger.warning("vector index rebuild skipped: another rebuild is in progress")
+                return {**job, "status": "skipped"}
+            async with async_session() as db:
+                await set_config(db, JOB_KEY, json.dumps(job))
+            await conn.execute(text(f"SET maintenance_work_mem = '{settings.vector_index_build_mem}'"))
+            await conn.execute(text(
+                f"SET max_parallel_maintenance_workers = {int(settings.vector_index_parallel_workers)}"
+            ))
+            try:
+                await _rebuild(conn, report)
+            finally:
+                await conn.execute(text("RESET maintenance_work_mem"))
+                await conn.execute(text("RESET max_parallel_maintenance_workers"))
+                await conn.execute(text("SELECT pg_advisory_unlock(:k)").bindparams(k=REINDEX_LOCK))
+        job["status"] = "done"
+        job["index_bytes_after"] = (await health())["index_bytes"]
+    except Exception as exc:
+        logger.exception("vector index rebuild failed")
+        job["status"] = "failed"
+        job["error"] = str(exc).splitlines()[0][:200]
+    job["seconds"] = round(time.perf_counter() - t0, 2)
+    job["finished_at"] = datetime.now(timezone.utc).isoformat()
+    async with async_session() as db:
+        await set_config(db, JOB_KEY, json.dumps(job))
+    return job
+
+
+async def reindex(force: bool = False) -> dict:
+    """Rebuild when health() recommends it (or always with force). Returns the job, or the report if skipped."""
+    report = await health()
+    if not (force or report["reindex_recommended"]):
+        return {"status": "skipped", "health": report}
+    job = new_job(report["reasons"] or ["forced"])
+    job["index_bytes_before"] = report["index_bytes"]
+    return await run_reindex(job, report)
+
+
+async def _run(command: str, force: bool, interval: float) -> None:
+    while True:
+        if command == "status":
+            result = await health()
+        else:
+            result = await reindex(force)
+        print(json.dumps(result), flush=True)
+        if not interval:
+            break
+        await asyncio.sleep(interval)
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("status", "reindex"))
+    parser.add_argument("--force", action="store_true", help="reindex even when no threshold is crossed")
+    parser.add_argument("--interval", type=float, default=0, help="seconds between runs; 0 runs once")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run(args.command, args.force, args.interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,55 @@
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 
-from app.db.engine import engine
+from app.config import settings
+from app.db.engine import engine, read_router
 from app.api.router import api_router
+from app import profiling, search_node, warmup
+from app.jobs import quarantine
+from app.embedding.client import EmbeddingUnavailable
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    try:
+        await quarantine.fail_stale_jobs()
+    except Exception:
+        logger.exception("checking for interrupted quarantine jobs")
+    monitor = asyncio.create_task(read_router.monitor()) if read_router.engines else None
+    snapshots = None
+    if settings.search_node_enabled:
+        search_node.node.load()
+        snapshots = asyncio.create_task(search_node.run_refresher())
+    warm = None
+    if settings.warmup_enabled:
+        warmup.state.ready = False
+        warm = asyncio.create_task(warmup.run_warmup())
     yield
+    for task in (monitor, snapshots, warm):
+        if task is not None:
+            task.cancel()
+    await read_router.dispose()
     await engine.dispose()
 
 
 app = FastAPI(title="Recall", version="0.1.0", lifespan=lifespan)
 app.include_router(api_router, prefix="/api/v1")
+if profiling.available():
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+
+@app.exception_handler(EmbeddingUnavailable)
+async def embedding_unavailable(request: Request, exc: EmbeddingUnavailable):
+    # Out of latency budget or every provider's breaker open: shed the request, don't hang on it
+    retry_after = max(1, round(settings.embedding_breaker_reset_seconds))
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Embedding provider unavailable", "retry_after": retry_after},
+        headers={"Retry-After": str(retry_after)},
+    )
@@ -0,0 +1,177 @@
+"""On-demand sampling profiles of single requests (needs the `profiling` extra, pyinstrument).
+
+A request is profiled when a core agent sends `X-Recall-Profile: 1`, or at
+random with the probability stored in system_config under
+`profile_sample_rate` (PUT /admin/profiling). The profiler samples the
+request's task every `profiling_interval` seconds, so awaits count as wall
+time spent waiting, and the result is written to `profiling_dir` as a
+speedscope file (open it at https://www.speedscope.app) next to a small JSON
+summary. The newest `profiling_keep` profiles are kept; GET /admin/profiling
+lists them and GET /admin/profiling/{id} downloads one. Header-triggered
+responses carry the profile id in `X-Recall-Profile-Id`.
+
+When off, a request costs one header lookup and a float comparison; the
+sampling rate is re-read from the database at most every
+`profiling_rate_refresh` seconds per process.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import select
+
+from app.auth.keys import hash_api_key
+from app.config import settings
+from app.db import engine as db_engine
+from app.db.models import Agent
+from app.db.queries.system import get_config
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # optional extra
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+RATE_KEY = "profile_sample_rate"
+HEADER = b"x-recall-profile"
+ID_HEADER = b"x-recall-profile-id"
+_ID_RE = re.compile(r"^\d{10}-[0-9a-f]{8}$")
+
+
+def available() -> bool:
+    return Profiler is not None
+
+
+class _Rate:
+    def __init__(self):
+        self.value = 0.0
+        self.checked_at = float("-inf")
+
+    async def get(self) -> float:
+        if time.monotonic() - self.checked_at >= settings.profiling_rate_refresh:
+            self.checked_at = time.monotonic()
+            try:
+                async with db_engine.async_session() as db:
+                    raw = await get_config(db, RATE_KEY)
+                self.value = float(raw) if raw is not None else 0.0
+            except Exception as exc:
+                logger.warning("reading %s failed: %s", RATE_KEY, exc)
+        return self.value
+
+    def set(self, value: float) -> None:
+        self.value = value
+        self.checked_at = time.monotonic()
+
+
+sample_rate = _Rate()
+
+
+async def _is_core(headers: dict[bytes, bytes]) -> bool:
+    auth = headers.get(b"authorization", b"").decode("latin-1")
+    if not auth.startswith("Bearer "):
+        return False
+    key_hash = hash_api_key(auth.removeprefix("Bearer ").strip())
+    async with db_engine.async_session() as db:
+        row = (await db.execute(
+            select(Agent.trust_level, Agent.disabled_at).where(Agent.api_key_hash == key_hash)
+        )).one_or_none()
+    return row is not None and row.trust_level >= 2 and row.disabled_at is None
+
+
+def _directory() -> Path:
+    path = Path(settings.profiling_dir)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _save(session, meta: dict) -> None:
+    directory = _directory()
+    (directory / f"{meta['id']}.speedscope.json").write_text(SpeedscopeRenderer().render(session))
+    (directory / f"{meta['id']}.json").write_text(json.dumps(meta))
+    # Ids start with a timestamp, so name order is age order
+    for old in sorted(directory.glob("*.speedscope.json"))[:-settings.profiling_keep]:
+        old.unlink(missing_ok=True)
+        (directory / old.name.replace(".speedscope.json", ".json")).unlink(missing_ok=True)
+
+
+def list_profiles() -> list[dict]:
+    directory = Path(settings.profiling_dir)
+    if not directory.is_dir():
+        return []
+    metas = []
+    for path in sorted(directory.glob("*.json"), reverse=True):
+        if not path.name.endswith(".speedscope.json"):
+            try:
+                metas.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+    return metas
+
+
+def profile_path(profile_id: str) -> Path | None:
+    if not _ID_RE.match(profile_id):
+        return None
+    path = Path(settings.profiling_dir) / f"{profile_id}.speedscope.json"
+    return path if path.is_file() else None
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware, so unprofiled requests don't pay for a BaseHTTPMiddleware wrap."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        trigger = None
+        headers = dict(scope["headers"])
+        if headers.get(HEADER) in (b"1", b"true") and await _is_core(headers):
+            trigger = "header"
+        else:
+            rate = await sample_rate.get()
+            if rate > 0 and random.random() < rate:
+                trigger = "sampled"
+        if trigger is None:
+            return await self.app(scope, receive, send)
+
+        profile_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if trigger == "header":
+                    message = {**message, "headers": [*message.get("headers", []), (ID_HEADER, profile_id.encode())]}
+            await send(message)
+
+        profiler = Profiler(interval=settings.profiling_interval, async_mode="enabled")
+        t0 = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            session = profiler.stop()
+            meta = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1")[:500],
+                "status": status.get("code"),
+                "ms": round((time.perf_counter() - t0) * 1000, 2),
+                "trigger": trigger,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            }
+            try:
+                await asyncio.to_thread(_save, session, meta)
+            except Exception:
+                logger.exception("saving profile %s failed", profile_id)
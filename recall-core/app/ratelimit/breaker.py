@@ -0,0 +1,66 @@
+"""Circuit breaker around the Redis client.
+
+Every command and pipeline runs under a `redis_timeout` deadline. After
+`redis_breaker_failures` consecutive connection errors or timeouts the breaker
+(app.circuit) opens and calls fail fast with `RedisUnavailable`, without
+touching the network, for `redis_breaker_reset_seconds`; then one probe call
+decides whether it closes again.
+
+Callers catch `RedisUnavailable`: rate limits fall back to the in-process
+limiter (app.ratelimit.local) and caches are bypassed. Command errors from a
+healthy server (WRONGTYPE and the like) are not failures and pass through.
+"""
+
+import asyncio
+
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import ResponseError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+
+from app.circuit import CircuitBreaker
+from app.config import settings
+
+_FAILURES = (RedisConnectionError, RedisTimeoutError, OSError, TimeoutError)
+
+
+class RedisUnavailable(RedisConnectionError):
+    """Redis is unreachable, timed out, or the breaker is open."""
+
+
+breaker = CircuitBreaker("redis", RedisUnavailable)
+
+
+async def _guarded(func, *args, **kwargs):
+    breaker.acquire()
+    try:
+        async with asyncio.timeout(settings.redis_timeout):
+            result = await func(*args, **kwargs)
+    except _FAILURES as exc:
+        breaker.failure(exc)
+        raise RedisUnavailable(breaker.last_error) from exc
+    except ResponseError:
+        # A command error still proves the server answers
+        breaker.success()
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    breaker.success()
+    return result
+
+
+class GuardedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        return await _guarded(super().execute, raise_on_error)
+
+
+class GuardedRedis(redis.Redis):
+    """redis.asyncio.Redis whose commands and pipelines go through `breaker`."""
+
+    async def execute_command(self, *args, **options):
+        return await _guarded(super().execute_command, *args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> GuardedPipeline:
+        return GuardedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
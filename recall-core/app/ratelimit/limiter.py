@@ -3,24 +3,33 @@ import time
 import redis.asyncio as redis
 
 from app.config import settings
+from app.ratelimit.breaker import GuardedRedis, RedisUnavailable
+from app.ratelimit.local import local_limiter
 from app.ratelimit.rules import get_limits
 
 _redis: redis.Redis | None = None
 
 
 async def get_redis() -> redis.Redis:
+    """The shared client; commands raise RedisUnavailable on timeouts, connection errors or an open breaker."""
     global _redis
     if _redis is None:
-        _redis = redis.from_url(settings.redis_url)
+        _redis = GuardedRedis.from_url(
+            settings.redis_url,
+            socket_timeout=settings.redis_timeout,
+            socket_connect_timeout=settings.redis_timeout,
+        )
     return _redis
 
 
-async def _check_window(r: redis.Redis, key: str, max_requests: int, window: int) -> tuple[bool, int]:
-    """Returns (allowed, retry_after_seconds)."""
+async def _check_window(
+    r: redis.Redis, key: str, max_requests: int, window: int, cost: int = 1
+) -> tuple[bool, int]:
+    """Returns (allowed, retry_after_seconds). `cost` requests are recorded at once."""
     now = time.time()
     pipe = r.pipeline()
     pipe.zremrangebyscore(key, 0, now - window)
-    pipe.zadd(key, {str(now): now})
+    pipe.zadd(key, {f"{now}:{i}": now for i in range(cost)})
     pipe.zcard(key)
     pipe.expire(key, window)
     pipe.zrange(key, 0, 0, withscores=True)
@@ -36,13 +45,18 @@ async def _check_window(r: redis.Redis, key: str, max_requests: int, window: int
     return False, max(retry_after, 1)
 
 
-async def check_rate_limit(agent_id: str, endpoint: str, trust_level: int) -> tuple[bool, int]:
-    """Check all rate limit windows. Returns (allowed, retry_after_seconds)."""
+async def check_rate_limit(
+    agent_id: str, endpoint: str, trust_level: int, cost: int = 1
+) -> tuple[bool, int]:
+    """Check all rate limit windows, charging `cost` requests. Returns (allowed, retry_after_seconds)."""
     limits = get_limits(endpoint, trust_level)
     r = await get_redis()
     for max_requests, window in limits:
         key = f"rl:{agent_id}:{endpoint}:{window}"
-        allowed, retry_after = await _check_window(r, key, max_requests, window)
+        try:
+            allowed, retry_after = await _check_window(r, key, max_requests, window, cost)
+        except RedisUnavailable:
+            allowed, retry_after = local_limiter.check(key, max_requests, window, cost)
         if not allowed:
             return False, retry_after
     return True, 0
@@ -52,5 +66,8 @@ async def check_ip_rate_limit(ip: str, endpoint: str, max_requests: int, window:
     """Per-IP sliding window rate limit."""
     r = await get_redis()
     key = f"rl:ip:{ip}:{endpoint}"
-    allowed, _ = await _check_window(r, key, max_requests, window)
+    try:
+        allowed, _ = await _check_window(r, key, max_requests, window)
+    except RedisUnavailable:
+        allowed, _ = local_limiter.check(key, max_requests, window)
     return allowed
@@ -0,0 +1,58 @@
+"""In-process rate limiting for while Redis is unavailable.
+
+One token bucket per (key, window) in this worker: capacity is the limit
+divided by `ratelimit_fallback_workers` (the number of API processes sharing
+the traffic), refilled evenly over the window. Approximate by design: a
+client spread unevenly across workers can get somewhat more or less than its
+limit until Redis is back.
+"""
+
+import math
+import time
+
+from app.config import settings
+
+# Full buckets carry no state; they are dropped once this many keys are tracked
+_MAX_BUCKETS = 10_000
+
+
+class LocalLimiter:
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self.allowed = 0
+        self.limited = 0
+
+    def _prune(self, now: float) -> None:
+        self._buckets = {
+            k: (tokens, ts) for k, (tokens, ts) in self._buckets.items() if now - ts < _window_of(k)
+        }
+
+    def check(self, key: str, max_requests: int, window: int, cost: int = 1) -> tuple[bool, int]:
+        """Returns (allowed, retry_after_seconds), charging `cost` tokens when allowed."""
+        capacity = max(1.0, max_requests / max(1, settings.ratelimit_fallback_workers))
+        rate = capacity / window
+        now = time.monotonic()
+        bucket_key = f"{key}:{window}"
+        if bucket_key not in self._buckets and len(self._buckets) >= _MAX_BUCKETS:
+            self._prune(now)
+        tokens, ts = self._buckets.get(bucket_key, (capacity, now))
+        tokens = min(capacity, tokens + (now - ts) * rate)
+        if tokens >= cost:
+            self._buckets[bucket_key] = (tokens - cost, now)
+            self.allowed += 1
+            return True, 0
+        self._buckets[bucket_key] = (tokens, now)
+        self.limited += 1
+        if cost > capacity:
+            return False, window
+        return False, max(1, math.ceil((cost - tokens) / rate))
+
+    def status(self) -> dict:
+        return {"buckets": len(self._buckets), "allowed": self.allowed, "limited": self.limited}
+
+
+def _window_of(bucket_key: str) -> int:
+    return int(bucket_key.rsplit(":", 1)[1])
+
+
+local_limiter = LocalLimiter()
@@ -1,5 +1,7 @@
 import uuid
 from datetime import datetime
+from typing import Annotated
+
 from pydantic import BaseModel, Field
 
 
@@ -38,12 +40,27 @@ class MemorySearchResult(BaseModel):
     created_at: datetime
     similarity: float
     retrieval_count: int
+    # Only with collapse=true: live memories in this result's duplicate cluster
+    cluster_size: int | None = None
 
 
 class MemorySearchResponse(BaseModel):
     success: bool = True
     query: str
     results: list[MemorySearchResult]
+    next_cursor: str | None = None
+
+
+class MemoryBatchSearchRequest(BaseModel):
+    queries: list[Annotated[str, Field(min_length=1, max_length=500)]] = Field(..., min_length=1)
+    limit: int = Field(10, ge=1, le=50)
+    merge: bool = False
+
+
+class MemoryBatchSearchResponse(BaseModel):
+    success: bool = True
+    searches: list[MemorySearchResponse]
+    merged: list[MemorySearchResult] | None = None
 
 
 class RelatedMemory(BaseModel):
@@ -67,3 +84,27 @@ class MemoryDetail(BaseModel):
 class MemoryGetResponse(BaseModel):
     success: bool = True
     memory: MemoryDetail
+
+
+class MemoryGraphNode(BaseModel):
+    id: uuid.UUID
+    short_id: str
+    content: str
+    tags: list[str]
+    depth: int
+
+
+class MemoryGraphEdge(BaseModel):
+    source: uuid.UUID
+    target: uuid.UUID
+    relation: str
+    similarity: float
+
+
+class MemoryGraphResponse(BaseModel):
+    success: bool = True
+    root: str
+    depth: int
+    nodes: list[MemoryGraphNode]
+    edges: list[MemoryGraphEdge]
+    truncated: bool = False
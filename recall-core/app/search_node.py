@@ -0,0 +1,350 @@
+"""Search node: answer vector searches from a memory-mapped snapshot instead of Postgres.
+
+A builder (`python -m app.search_node build --interval 3600`) writes
+snapshot generations under `search_node_dir`:
+
+  snap-<generation>/vectors.f32    N x dim float32, L2-normalized, grouped by IVF list
+  snap-<generation>/ids.bin        N x 16-byte uuids, same order
+  snap-<generation>/boost.f32      rank boost (retrieval_count, source_url) at build time
+  snap-<generation>/centroids.f32  lists x dim IVF centroids (spherical k-means)
+  snap-<generation>/offsets.i64    lists + 1 row offsets
+  snap-<generation>/meta.json
+  CURRENT                          name of the newest complete generation
+
+API workers with `search_node_enabled` map the current generation
+read-only, so every worker on a host shares one copy through the page
+cache. A background task picks up new generations and fetches memories
+created since the snapshot's `created_at` watermark as an in-memory delta.
+
+A search scores the `search_node_nprobe` closest IVF lists plus the delta,
+keeps the best candidates by similarity + snapshot boost, and hydrates only
+those from Postgres (get_search_rows_by_ids), where quarantine and live
+boosts are applied. Collapsed, hybrid and lexical searches still go to
+Postgres.
+
+Needs numpy: pip install "recall-core[search-node]".
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db import engine as db_engine
+from app.db.models import Memory
+from app.db.queries.memories import get_search_rows_by_ids, rank_boost
+
+try:
+    import numpy as np
+except ImportError:  # optional: only search nodes and the builder need it
+    np = None
+
+logger = logging.getLogger(__name__)
+
+CURRENT = "CURRENT"
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 256
+SCAN_CHUNK = 65536
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError('The search node needs numpy: pip install "recall-core[search-node]"')
+
+
+def _normalize(m):
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return m / norms
+
+
+def _vector_from_pg(packed: bytes):
+    # pgvector binary: uint16 dim, uint16 unused, dim x float32 big-endian
+    return np.frombuffer(packed, dtype=">f4", offset=4)
+
+
+def _kmeans(sample, lists: int, rnd):
+    """Spherical k-means on normalized rows; empty lists are re-seeded from random rows."""
+    centroids = sample[rnd.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        empty = ~sums.any(axis=1)
+        sums[empty] = sample[rnd.choice(len(sample), int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def _write_ivf(path: str, raw, ids, boost, lists: int) -> None:
+    """Train the IVF lists on a sample and write every file grouped by list, in chunks."""
+    n, dim = raw.shape
+    for start in range(0, n, SCAN_CHUNK):
+        raw[start:start + SCAN_CHUNK] = _normalize(raw[start:start + SCAN_CHUNK])
+
+    rnd = np.random.default_rng(0)
+    sample = raw[np.sort(rnd.choice(n, min(n, lists * KMEANS_SAMPLE_PER_LIST), replace=False))]
+    centroids = _kmeans(sample, lists, rnd).astype(np.float32)
+
+    assign = np.empty(n, dtype=np.int32)
+    for start in range(0, n, SCAN_CHUNK):
+        assign[start:start + SCAN_CHUNK] = np.argmax(raw[start:start + SCAN_CHUNK] @ centroids.T, axis=1)
+    order = np.argsort(assign, kind="stable")
+    offsets = np.zeros(lists + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(assign, minlength=lists))
+
+    vectors = np.memmap(os.path.join(path, "vectors.f32"), mode="w+", dtype=np.float32, shape=(n, dim))
+    for start in range(0, n, SCAN_CHUNK):
+        vectors[start:start + SCAN_CHUNK] = raw[order[start:start + SCAN_CHUNK]]
+    vectors.flush()
+    ids[order].tofile(os.path.join(path, "ids.bin"))
+    boost[order].tofile(os.path.join(path, "boost.f32"))
+    centroids.tofile(os.path.join(path, "centroids.f32"))
+    offsets.tofile(os.path.join(path, "offsets.i64"))
+
+
+async def build_snapshot(directory: str | None = None) -> dict:
+    """Write a new snapshot generation and point CURRENT at it. Returns its meta."""
+    _require_numpy()
+    from app.jobs.transfer import raw_connection
+
+    directory = directory or settings.search_node_dir
+    os.makedirs(directory, exist_ok=True)
+    generation = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    tmp = os.path.join(directory, f".building-{generation}")
+    final = os.path.join(directory, f"snap-{generation}")
+    os.makedirs(tmp)
+    dim = settings.embedding_dim
+    t0 = time.perf_counter()
+
+    async with raw_connection() as conn:
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            n = await conn.fetchval("SELECT count(*) FROM memories WHERE quality > -2")
+            watermark = await conn.fetchval("SELECT max(created_at) FROM memories")
+            if n:
+                # Rows land unsorted first; the IVF order is known only after training
+                raw = np.memmap(os.path.join(tmp, "unsorted.f32"), mode="w+", dtype=np.float32, shape=(n, dim))
+                ids = np.zeros((n, 16), dtype=np.uint8)
+                boost = np.zeros(n, dtype=np.float32)
+                i = 0
+                async for rec in conn.cursor(
+                    "SELECT id, embedding, retrieval_count, source_url IS NOT NULL AS has_source"
+                    " FROM memories WHERE quality > -2",
+                    prefetch=settings.transfer_batch_size,
+                ):
+                    raw[i] = _vector_from_pg(rec["embedding"])
+                    ids[i] = np.frombuffer(rec["id"].bytes, dtype=np.uint8)
+                    boost[i] = rank_boost(rec["retrieval_count"], rec["has_source"])
+                    i += 1
+
+    lists = 0
+    if n:
+        lists = min(settings.search_node_lists or max(1, int(math.sqrt(n))), n)
+        _write_ivf(tmp, raw, ids, boost, lists)
+        del raw
+        os.remove(os.path.join(tmp, "unsorted.f32"))
+
+    meta = {
+        "generation": generation,
+        "rows": int(n),
+        "dim": dim,
+        "lists": lists,
+        "watermark": watermark.isoformat() if watermark else None,
+        "build_seconds": round(time.perf_counter() - t0, 2),
+    }
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    os.rename(tmp, final)
+    _write_current(directory, os.path.basename(final))
+    _prune(directory, keep=os.path.basename(final))
+    return meta
+
+
+def _write_current(directory: str, name: str) -> None:
+    tmp = os.path.join(directory, f".{CURRENT}.tmp")
+    with open(tmp, "w") as f:
+        f.write(name)
+    os.replace(tmp, os.path.join(directory, CURRENT))
+
+
+def _prune(directory: str, keep: str) -> None:
+    # Workers still mapping an older generation keep reading it: unlinked files stay valid
+    for name in os.listdir(directory):
+        if name.startswith("snap-") and name != keep:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+class SearchNode:
+    def __init__(self):
+        self.generation: str | None = None
+        self.meta: dict = {}
+        self.watermark: datetime | None = None
+        self._delta: dict[uuid.UUID, tuple] = {}
+        self._delta_matrix = None
+
+    @property
+    def ready(self) -> bool:
+        return self.generation is not None
+
+    def load(self, directory: str | None = None) -> bool:
+        """Map the CURRENT generation if it changed. Returns True when a new one was loaded."""
+        _require_numpy()
+        directory = directory or settings.search_node_dir
+        try:
+            with open(os.path.join(directory, CURRENT)) as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return False
+        path = os.path.join(directory, name)
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["generation"] == self.generation:
+            return False
+        if meta["dim"] != settings.embedding_dim:
+            raise RuntimeError(f"Snapshot dim {meta['dim']} != EMBEDDING_DIM {settings.embedding_dim}")
+        n, dim = meta["rows"], meta["dim"]
+        if n:
+            self.vectors = np.memmap(os.path.join(path, "vectors.f32"), mode="r", dtype=np.float32, shape=(n, dim))
+            self.ids = np.memmap(os.path.join(path, "ids.bin"), mode="r", dtype=np.uint8, shape=(n, 16))
+            self.boost = np.memmap(os.path.join(path, "boost.f32"), mode="r", dtype=np.float32, shape=(n,))
+            self.centroids = np.fromfile(os.path.join(path, "centroids.f32"), dtype=np.float32).reshape(-1, dim)
+            self.offsets = np.fromfile(os.path.join(path, "offsets.i64"), dtype=np.int64)
+        self.meta = meta
+        self.generation = meta["generation"]
+        # Memories the new snapshot covers leave the delta on the next refresh
+        self.watermark = datetime.fromisoformat(meta["watermark"]) if meta["watermark"] else None
+        self._delta = {}
+        self._delta_matrix = None
+        return True
+
+    async def refresh_delta(self, db: AsyncSession) -> int:
+        """Fetch memories created after the watermark. Returns how many were new."""
+        overlap = timedelta(seconds=settings.search_node_delta_overlap)
+        stmt = select(Memory.id, Memory.embedding, Memory.created_at).where(Memory.quality > -2)
+        if self.watermark is not None:
+            # Re-read a short overlap: inserts can commit after a later created_at is visible
+            stmt = stmt.where(Memory.created_at > self.watermark - overlap)
+        rows = (await db.execute(stmt.order_by(Memory.created_at))).fetchall()
+        added = 0
+        for row in rows:
+            if row.id not in self._delta:
+                self._delta[row.id] = (row.id, np.asarray(row.embedding, dtype=np.float32))
+                added += 1
+            if self.watermark is None or row.created_at > self.watermark:
+                self.watermark = row.created_at
+        if added:
+            self._delta_matrix = (
+                [r[0] for r in self._delta.values()],
+                _normalize(np.stack([r[1] for r in self._delta.values()])),
+            )
+        return added
+
+    def search(self, embedding: list[float], k: int) -> list[tuple[uuid.UUID, float]]:
+        """Top-k (id, similarity) by similarity + snapshot boost, similarity >= min_similarity."""
+        q = _normalize(np.asarray(embedding, dtype=np.float32))
+        ids: list[uuid.UUID] = []
+        sims: list = []
+        scores: list = []
+
+        if self.meta.get("rows"):
+            probe = np.argsort(self.centroids @ q)[::-1][: settings.search_node_nprobe]
+            for lst in probe:
+                a, b = int(self.offsets[lst]), int(self.offsets[lst + 1])
+                if a == b:
+                    continue
+                s = self.vectors[a:b] @ q
+                keep = np.nonzero(s >= settings.min_similarity)[0]
+                if len(keep) > k:
+                    keep = keep[np.argpartition(-(s[keep] + self.boost[a:b][keep]), k)[:k]]
+                ids.extend(uuid.UUID(bytes=self.ids[a + j].tobytes()) for j in keep)
+                sims.append(s[keep])
+                scores.append(s[keep] + self.boost[a:b][keep])
+
+        if self._delta_matrix is not None:
+            delta_ids, matrix = self._delta_matrix
+            s = matrix @ q
+            keep = np.nonzero(s >= settings.min_similarity)[0]
+            ids.extend(delta_ids[j] for j in keep)
+            sims.append(s[keep])
+            # New memories have no retrievals yet; their source_url boost is applied on hydration
+            scores.append(s[keep])
+
+        if not ids:
+            return []
+        sims_all = np.concatenate(sims)
+        scores_all = np.concatenate(scores)
+        best: dict[uuid.UUID, tuple[float, float]] = {}
+        for j in np.argsort(-scores_all):
+            mid = ids[j]
+            if mid not in best:  # the delta overlaps the snapshot at the watermark
+                best[mid] = (float(scores_all[j]), float(sims_all[j]))
+                if len(best) >= k:
+                    break
+        return [(mid, sim) for mid, (_, sim) in best.items()]
+
+    def status(self) -> dict:
+        return {"generation": self.generation, "delta_rows": len(self._delta), **self.meta}
+
+
+node = SearchNode()
+
+
+async def vector_search(db: AsyncSession, *, embedding: list[float], limit: int) -> list[dict]:
+    """Same rows as queries.memories.vector_search, ranked locally and hydrated by primary key."""
+    candidates = node.search(embedding, limit * settings.search_node_overfetch)
+    found = await get_search_rows_by_ids(db, [mid for mid, _ in candidates])
+    rows = []
+    for mid, sim in candidates:
+        row = found.get(mid)
+        if row is not None:
+            row["similarity"] = round(sim, 4)
+            rows.append((sim + rank_boost(row["retrieval_count"], row["source_url"] is not None), row))
+    rows.sort(key=lambda r: r[0], reverse=True)
+    return [row for _, row in rows[:limit]]
+
+
+async def run_refresher() -> None:
+    """Keep `node` on the newest generation and its delta current (one task per API worker)."""
+    while True:
+        try:
+            if node.load():
+                logger.info("search node: loaded snapshot %s", node.status())
+            if node.ready:
+                async with db_engine.read_router.session() as db:
+                    await node.refresh_delta(db)
+        except Exception:
+            logger.exception("search node refresh failed")
+        await asyncio.sleep(settings.search_node_refresh_interval)
+
+
+async def _builder(interval: float) -> None:
+    while True:
+        meta = await build_snapshot()
+        logger.info("search node snapshot: %s", json.dumps(meta))
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="write a snapshot generation to SEARCH_NODE_DIR")
+    build.add_argument("--interval", type=float, default=0, help="seconds between builds; 0 builds once")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_builder(args.interval))
+
+
+if __name__ == "__main__":
+    main()
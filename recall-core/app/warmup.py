@@ -0,0 +1,133 @@
+"""Startup warm-up: pay connection setup and cold index pages before traffic does.
+
+The lifespan marks the app not ready and runs `run_warmup` in the background;
+/health answers 503 until it finishes (or `warmup_timeout` passes). Steps:
+
+- db: open `warmup_db_connections` pool connections at once on the primary
+  and on every read replica
+- redis: connect and PING
+- embedding: pre-establish the provider connection (TLS handshake)
+- prewarm: pg_prewarm('ix_memories_embedding') on each database, when
+  `warmup_prewarm_hnsw` is set (needs CREATE EXTENSION pg_prewarm)
+- searches: `warmup_searches` vector searches with random query vectors
+
+A failing step is recorded and skipped; warm-up never blocks startup for good.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from contextlib import AsyncExitStack
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.db import engine as db_engine
+from app.db.queries.memories import vector_search
+from app.embedding.client import embedding_client
+from app.ratelimit.limiter import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupState:
+    # Ready unless a warm-up is in flight: only the lifespan starts one
+    def __init__(self):
+        self.ready = True
+        self.steps: dict[str, dict] = {}
+        self.duration_ms: int | None = None
+
+    def report(self) -> dict:
+        return {"ready": self.ready, "duration_ms": self.duration_ms, "steps": self.steps}
+
+
+state = WarmupState()
+
+
+def _engines() -> list:
+    return [db_engine.engine, *db_engine.read_router.engines]
+
+
+async def _open_connections(eng, n: int) -> int:
+    # Held together so the pool really grows to n instead of reusing one connection
+    n = min(n, eng.pool.size())
+    async with AsyncExitStack() as stack:
+        conns = await asyncio.gather(*(stack.enter_async_context(eng.connect()) for _ in range(n)))
+        for conn in conns:
+            await conn.execute(text("SELECT 1"))
+    return n
+
+
+async def warm_db() -> dict:
+    opened = await asyncio.gather(
+        *(_open_connections(e, settings.warmup_db_connections) for e in _engines())
+    )
+    return {"connections": sum(opened), "databases": len(opened)}
+
+
+async def warm_redis() -> dict:
+    r = await get_redis()
+    await r.ping()
+    return {}
+
+
+async def warm_embedding() -> dict:
+    await embedding_client.warm_up()
+    return {}
+
+
+async def prewarm_hnsw() -> dict:
+    blocks = 0
+    for eng in _engines():
+        async with eng.connect() as conn:
+            blocks += await conn.scalar(text("SELECT pg_prewarm('ix_memories_embedding')"))
+    return {"blocks": blocks}
+
+
+async def warm_searches() -> dict:
+    rnd = random.Random()
+    for _ in range(settings.warmup_searches):
+        vec = [rnd.uniform(-1, 1) for _ in range(settings.embedding_dim)]
+        async with db_engine.read_router.session() as db:
+            await vector_search(db, embedding=vec, limit=10)
+    return {"searches": settings.warmup_searches}
+
+
+def _plan() -> list[tuple[str, object]]:
+    plan = [("db", warm_db), ("redis", warm_redis), ("embedding", warm_embedding)]
+    if settings.warmup_prewarm_hnsw:
+        plan.append(("prewarm", prewarm_hnsw))
+    if settings.warmup_searches > 0:
+        plan.append(("searches", warm_searches))
+    return plan
+
+
+async def _run_step(name: str, func) -> None:
+    t0 = time.perf_counter()
+    try:
+        result = {"ok": True, **await func()}
+    except Exception as exc:
+        logger.warning("warm-up step %s failed: %s", name, exc)
+        # First line only: database errors carry the full statement after it
+        result = {"ok": False, "error": (str(exc).splitlines() or [type(exc).__name__])[0][:200]}
+    result["ms"] = round((time.perf_counter() - t0) * 1000)
+    state.steps[name] = result
+
+
+async def run_warmup() -> None:
+    state.ready = False
+    state.steps = {}
+    t0 = time.perf_counter()
+    try:
+        async with asyncio.timeout(settings.warmup_timeout):
+            # Searches need the pools and pages the earlier steps bring in, so run in order
+            for name, func in _plan():
+                await _run_step(name, func)
+    except TimeoutError:
+        logger.warning("warm-up timed out after %ss", settings.warmup_timeout)
+        state.steps["timeout"] = {"ok": False, "error": f"exceeded {settings.warmup_timeout}s"}
+    finally:
+        state.duration_ms = round((time.perf_counter() - t0) * 1000)
+        state.ready = True
+        logger.info("warm-up done in %dms: %s", state.duration_ms, state.steps)
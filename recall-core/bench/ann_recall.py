@@ -0,0 +1,235 @@
+"""Recall@K and latency of the HNSW index (ix_memories_embedding) against exact numpy search.
+
+Streams every searchable vector (quality > -2) out of DATABASE_URL, computes
+the exact cosine top-K of each query by brute force, chunk by chunk, and
+compares it with what Postgres returns:
+
+  index          ORDER BY embedding <=> q LIMIT k, the plain HNSW scan
+  vector_search  queries.memories.vector_search, the ranked query the API runs
+
+for every --ef-search value. Without --index the current index is measured.
+Each --index (e.g. m=32,ef_construction=128) drops ix_memories_embedding and
+rebuilds it with those parameters, timing the build; the original definition
+is restored at the end. A rebuild blocks writes to memories for its duration:
+run --index against a copy, never a live primary.
+
+Queries are stored vectors plus --noise (query source "corpus", the way real
+queries land near stored memories) or uniform random unit vectors ("random").
+vector_search runs with min_similarity disabled so recall measures retrieval,
+not the floor; it ranks by similarity plus boosts, which can also cost recall.
+
+One JSON object per (index, ef_search) goes to stdout, or is appended to
+--output, for tracking over time; a readable table goes to stderr.
+
+Needs numpy. Usage:
+  python bench/ann_recall.py [--k 10] [--queries 200] [--ef-search 40,100,200]
+    [--index m=16,ef_construction=64 --index m=32,ef_construction=128] [--output ann.jsonl]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import orjson
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.config import settings  # noqa: E402
+from app.db.engine import async_session, engine  # noqa: E402
+from app.db.queries.memories import vector_search  # noqa: E402
+from app.jobs import transfer, vector_index  # noqa: E402
+
+INDEX = vector_index.INDEX
+INDEX_PARAMS = ("m", "ef_construction")
+
+INDEX_SCAN_SQL = (
+    f"SELECT id FROM memories WHERE {vector_index.LIVE_PREDICATE}"
+    " ORDER BY embedding <=> CAST(:vec AS vector) LIMIT :k"
+)
+
+
+def _literal(v) -> str:
+    return "[" + ",".join(str(x) for x in v) + "]"
+
+
+def _vectors(records) -> np.ndarray:
+    return np.stack([np.frombuffer(r["embedding"], dtype=">f4", offset=4) for r in records]).astype(np.float32)
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return m / norms
+
+
+def parse_index(spec: str) -> dict:
+    params = {}
+    for part in spec.split(","):
+        key, _, value = part.partition("=")
+        if key.strip() not in INDEX_PARAMS or not value.strip().isdigit():
+            raise argparse.ArgumentTypeError(f"expected m=<int>,ef_construction=<int>, got {spec!r}")
+        params[key.strip()] = int(value)
+    return params
+
+
+async def sample_queries(conn, n: int, source: str, noise: float, dim: int, rnd) -> np.ndarray:
+    if source == "random":
+        return _normalize(rnd.standard_normal((n, dim)).astype(np.float32))
+    records = await conn.fetch(
+        "SELECT embedding FROM memories WHERE quality > -2 ORDER BY random() LIMIT $1", n
+    )
+    base = _normalize(_vectors(records))
+    return _normalize(base + noise * rnd.standard_normal(base.shape).astype(np.float32) / np.sqrt(dim))
+
+
+async def exact_topk(conn, queries: np.ndarray, k: int) -> tuple[list[set], int, float]:
+    """Brute-force cosine top-k per query, streamed in transfer_batch_size chunks."""
+    best_sim = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_id = np.empty((len(queries), k), dtype=object)
+    rows = 0
+    t0 = time.perf_counter()
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        batch = []
+        cursor = conn.cursor(
+            "SELECT id, embedding FROM memories WHERE quality > -2", prefetch=settings.transfer_batch_size
+        )
+        async for rec in cursor:
+            batch.append(rec)
+            if len(batch) == settings.transfer_batch_size:
+                _merge(queries, batch, k, best_sim, best_id)
+                rows += len(batch)
+                batch = []
+        if batch:
+            _merge(queries, batch, k, best_sim, best_id)
+            rows += len(batch)
+    elapsed = time.perf_counter() - t0
+    return [set(row) - {None} for row in best_id], rows, elapsed
+
+
+def _merge(queries, batch, k, best_sim, best_id) -> None:
+    sims = queries @ _normalize(_vectors(batch)).T
+    ids = np.array([r["id"] for r in batch], dtype=object)
+    all_sim = np.concatenate([best_sim, sims], axis=1)
+    all_id = np.concatenate([best_id, np.broadcast_to(ids, sims.shape)], axis=1)
+    top = np.argpartition(-all_sim, k - 1, axis=1)[:, :k]
+    best_sim[:] = np.take_along_axis(all_sim, top, axis=1)
+    best_id[:] = np.take_along_axis(all_id, top, axis=1)
+
+
+async def rebuild_index(params: dict | None, definition: str | None) -> float:
+    """Drop the vector index and create it from params (or the saved definition). Returns build seconds."""
+    if params is not None:
+        definition = vector_index.index_sql(params=params)
+    t0 = time.perf_counter()
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP INDEX IF EXISTS {INDEX}"))
+        if definition:
+            await conn.execute(text(f"SET LOCAL maintenance_work_mem = '{settings.transfer_index_build_mem}'"))
+            await conn.execute(text(definition))
+    return time.perf_counter() - t0
+
+
+def _stats(samples: list[float], hits: int, total: int) -> dict:
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2)
+
+    return {"recall": round(hits / total, 4), "p50_ms": pct(0.5), "p95_ms": pct(0.95), "p99_ms": pct(0.99)}
+
+
+async def measure(queries: np.ndarray, truth: list[set], k: int, ef_search: int) -> dict:
+    timings: dict[str, list[float]] = {"index": [], "vector_search": []}
+    hits = {"index": 0, "vector_search": 0}
+    async with async_session() as db:
+        await db.execute(text(f"SET hnsw.ef_search = {int(ef_search)}"))
+        plan = (await db.execute(
+            text("EXPLAIN " + INDEX_SCAN_SQL).bindparams(vec=_literal(queries[0].tolist()), k=k)
+        )).scalars().all()
+        for q, exact in zip(queries, truth):
+            vec = q.tolist()
+            t0 = time.perf_counter()
+            found = (await db.execute(text(INDEX_SCAN_SQL).bindparams(vec=_literal(vec), k=k))).scalars().all()
+            timings["index"].append(time.perf_counter() - t0)
+            hits["index"] += len(exact & set(found))
+
+            t0 = time.perf_counter()
+            ranked = await vector_search(db, embedding=vec, limit=k)
+            timings["vector_search"].append(time.perf_counter() - t0)
+            hits["vector_search"] += len(exact & {r["id"] for r in ranked})
+
+    total = sum(len(t) for t in truth) or 1
+    methods = {label: _stats(samples, hits[label], total) for label, samples in timings.items()}
+    methods["index"]["uses_index"] = any(INDEX in line for line in plan)
+    return methods
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-source", choices=("corpus", "random"), default="corpus")
+    parser.add_argument("--noise", type=float, default=0.5, help="query perturbation, relative to unit length")
+    parser.add_argument("--ef-search", default="40", help="comma-separated hnsw.ef_search values")
+    parser.add_argument("--index", action="append", type=parse_index, default=[],
+                        help="rebuild with m=<int>,ef_construction=<int>; repeatable")
+    parser.add_argument("--output", help="append JSON lines here instead of stdout")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    ef_values = [int(v) for v in args.ef_search.split(",")]
+    settings.min_similarity = -1.0
+
+    rnd = np.random.default_rng(args.seed)
+    async with transfer.raw_connection() as conn:
+        original = await conn.fetchval("SELECT indexdef FROM pg_indexes WHERE indexname = $1", INDEX)
+        queries = await sample_queries(conn, args.queries, args.query_source, args.noise, settings.embedding_dim, rnd)
+        truth, rows, exact_seconds = await exact_topk(conn, queries, args.k)
+    print(f"exact top-{args.k}: {len(queries)} queries over {rows} rows in {exact_seconds:.1f}s", file=sys.stderr)
+
+    out = open(args.output, "ab") if args.output else sys.stdout.buffer
+    try:
+        for params in args.index or [None]:
+            build_seconds = await rebuild_index(params, None) if params is not None else None
+            async with engine.connect() as conn:
+                definition = (await conn.execute(
+                    text("SELECT indexdef FROM pg_indexes WHERE indexname = :n").bindparams(n=INDEX)
+                )).scalar()
+                size = (await conn.execute(text(f"SELECT pg_relation_size('{INDEX}')"))).scalar() if definition else 0
+            for ef in ef_values:
+                methods = await measure(queries, truth, args.k, ef)
+                record = {
+                    "ts": datetime.now(timezone.utc).isoformat(),
+                    "rows": rows,
+                    "dim": settings.embedding_dim,
+                    "k": args.k,
+                    "queries": len(queries),
+                    "query_source": args.query_source,
+                    "noise": args.noise if args.query_source == "corpus" else None,
+                    "index_def": definition,
+                    "index_params": params,
+                    "index_build_seconds": round(build_seconds, 2) if build_seconds is not None else None,
+                    "index_mb": round(size / 2**20, 1),
+                    "ef_search": ef,
+                    "exact_ms_per_query": round(exact_seconds * 1000 / len(queries), 2),
+                    "methods": methods,
+                }
+                out.write(orjson.dumps(record) + b"\n")
+                out.flush()
+                label = ",".join(f"{k}={v}" for k, v in params.items()) if params else "current"
+                for name, m in methods.items():
+                    print(f"{label:>28} ef={ef:<4} {name:>13}: recall@{args.k} {m['recall']:.3f}"
+                          f"  p50 {m['p50_ms']:7.1f}ms  p99 {m['p99_ms']:7.1f}ms", file=sys.stderr)
+    finally:
+        if args.output:
+            out.close()
+        if args.index:
+            await rebuild_index(None, original)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
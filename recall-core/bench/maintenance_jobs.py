@@ -0,0 +1,170 @@
+"""Runtime of the maintenance jobs (counters, quality, trust) at scale.
+
+Builds a synthetic dataset in a SCRATCH database (tables are dropped and
+recreated): --memories memories over --agents agents, and --events
+retrieval events skewed towards popular memories. Embeddings are irrelevant
+to these jobs, so run with a tiny EMBEDDING_DIM to keep the table small.
+The HNSW index isn't created.
+
+It then times:
+  1. for contrast, the scans a counter-less job would repeat on every run
+  2. the first full pass, which folds every event in (the post-migration backfill)
+  3. a steady-state pass after --new-events more events arrive
+
+The full pass costs one memory row update per memory per chunk, so a larger
+MAINTENANCE_EVENT_CHUNK makes the backfill faster at the price of longer
+transactions.
+
+Usage:
+  EMBEDDING_DIM=4 DATABASE_URL=postgresql+asyncpg://.../scratch \\
+    python bench/maintenance_jobs.py [--memories 1000000] [--events 50000000] [--new-events 100000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.config import settings  # noqa: E402
+from app.db.engine import async_session, engine  # noqa: E402
+from app.db.models import Base  # noqa: E402
+from app.jobs import maintenance  # noqa: E402
+
+_EVENT_INDEXES = [
+    "CREATE INDEX ix_retrieval_events_memory_id ON retrieval_events (memory_id)",
+    "CREATE INDEX ix_retrieval_events_agent_id ON retrieval_events (agent_id)",
+    "CREATE INDEX ix_retrieval_events_created_at ON retrieval_events (created_at)",
+    "CREATE UNIQUE INDEX ix_retrieval_events_seq ON retrieval_events (seq)",
+]
+
+
+def _log(msg: str, t0: float, extra: str = "") -> None:
+    print(f"{msg:<52} {time.perf_counter() - t0:8.1f}s  {extra}", flush=True)
+
+
+async def _insert_events(conn, n: int, memories: int, chunk: int = 5_000_000, age: str = "1 day") -> None:
+    # random()^3 skews events towards a popular head of memories (idx 1..memories)
+    for done in range(0, n, chunk):
+        await conn.execute(text(
+            "INSERT INTO retrieval_events (id, agent_id, memory_id, query, similarity, created_at)"
+            " SELECT gen_random_uuid(), m.agent_id, m.id, 'q', 0.8, now() - CAST(:age AS interval)"
+            " FROM (SELECT 1 + floor(power(random(), 3) * :mem)::int AS idx FROM generate_series(1, :n)) r"
+            " JOIN bench_idx i ON i.idx = r.idx"
+            " JOIN memories m ON m.id = i.id"
+        ).bindparams(n=min(chunk, n - done), mem=memories, age=age))
+
+
+async def build(memories: int, agents: int, events: int) -> None:
+    t0 = time.perf_counter()
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        await conn.execute(text("DROP TABLE IF EXISTS bench_idx"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        zero = "[" + ",".join(["0"] * settings.embedding_dim) + "]"
+        await conn.execute(text(
+            "INSERT INTO agents (id, name, api_key_hash, trust_level)"
+            " SELECT gen_random_uuid(), 'bench-' || g, md5(g::text), CASE WHEN g % 2 = 0 THEN 0 ELSE 1 END"
+            " FROM generate_series(1, :n) g"
+        ).bindparams(n=agents))
+        # Spread creation over two years so the quality step has a real backlog of aged memories
+        await conn.execute(text(
+            "WITH a AS (SELECT id, row_number() OVER () AS rn FROM agents)"
+            " INSERT INTO memories (id, short_id, agent_id, content, content_hash, tags, embedding,"
+            "  embedding_model, quality, cluster_id, created_at)"
+            " SELECT u, 'B-' || g, a.id, 'bench memory ' || g, md5(g::text), '{bench,x}',"
+            "  CAST(:zero AS vector), 'bench', CASE WHEN a.rn % 2 = 0 THEN -1 ELSE 0 END, u,"
+            "  now() - (g % 730) * interval '1 day'"
+            " FROM (SELECT g, gen_random_uuid() AS u FROM generate_series(1, :n) g) s"
+            " JOIN a ON a.rn = 1 + s.g % :agents"
+        ).bindparams(n=memories, agents=agents, zero=zero))
+        await conn.execute(text(
+            "CREATE TABLE bench_idx AS SELECT id, row_number() OVER (ORDER BY id)::int AS idx FROM memories"
+        ))
+        await conn.execute(text("CREATE UNIQUE INDEX ON bench_idx (idx)"))
+        # Links for ~10% of memories so the "never linked" predicate has something to reject
+        await conn.execute(text(
+            "INSERT INTO memory_links (id, memory_id, related_id, relation, similarity)"
+            " SELECT gen_random_uuid(), a.id, b.id, 'similar', 0.7"
+            " FROM bench_idx a JOIN bench_idx b ON b.idx = a.idx + 1 WHERE a.idx % 10 = 0"
+        ))
+    _log(f"agents={agents} memories={memories} loaded", t0)
+
+    # Events load fastest without their indexes and FKs; both are restored before timing
+    async with engine.begin() as conn:
+        for name in ("memory_id", "agent_id", "created_at", "seq"):
+            await conn.execute(text(f"DROP INDEX IF EXISTS ix_retrieval_events_{name}"))
+        await conn.execute(text(
+            "ALTER TABLE retrieval_events DROP CONSTRAINT IF EXISTS retrieval_events_memory_id_fkey,"
+            " DROP CONSTRAINT IF EXISTS retrieval_events_agent_id_fkey"
+        ))
+        await _insert_events(conn, events, memories, age="2 days")
+    _log(f"events={events} loaded", t0)
+    async with engine.begin() as conn:
+        for ddl in _EVENT_INDEXES:
+            await conn.execute(text(ddl))
+        await conn.execute(text("ANALYZE"))
+    _log("event indexes built, analyzed", t0)
+
+
+async def timed_steps(label: str) -> None:
+    for steps in (["counters"], ["quality"], ["trust"]):
+        t0 = time.perf_counter()
+        job = await maintenance.run_maintenance(steps)
+        stats = {k: job[k] for k in ("events", "memories_counted", "quality_promoted",
+                                     "quality_demoted", "agents_promoted") if job[k]}
+        _log(f"{label}: {steps[0]}", t0, str(stats) if stats else "")
+        assert job["status"] == "done", job["error"]
+
+
+async def naive_scans() -> None:
+    """What a job without counters would run each time: per-agent EXISTS probes and a full recount."""
+    async with async_session() as db:
+        t0 = time.perf_counter()
+        await db.execute(text(
+            "SELECT m.agent_id FROM memories m"
+            " JOIN agents a ON a.id = m.agent_id AND a.trust_level = 0"
+            " WHERE EXISTS (SELECT 1 FROM retrieval_events re WHERE re.memory_id = m.id)"
+            " GROUP BY m.agent_id HAVING count(*) >= :n"
+        ).bindparams(n=settings.trust_promotion_memories))
+        _log("naive: trust-0 agents' memories, EXISTS per memory", t0)
+        t0 = time.perf_counter()
+        await db.execute(text("SELECT memory_id, count(*) FROM retrieval_events GROUP BY memory_id"))
+        _log("naive: full recount of retrieval_events", t0)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--memories", type=int, default=1_000_000)
+    parser.add_argument("--agents", type=int, default=10_000)
+    parser.add_argument("--events", type=int, default=50_000_000)
+    parser.add_argument("--new-events", type=int, default=100_000)
+    # Re-time on an existing dataset; quality/trust changes from the last run are not undone
+    parser.add_argument("--skip-build", action="store_true")
+    args = parser.parse_args()
+
+    settings.maintenance_settle_seconds = 0
+    if not args.skip_build:
+        await build(args.memories, args.agents, args.events)
+    async with async_session() as db:
+        await db.execute(text(
+            "DELETE FROM system_config WHERE key IN (:a, :b, :c)"
+        ).bindparams(a=maintenance.EVENTS_WATERMARK, b=maintenance.STALE_WATERMARK, c=maintenance.JOB_KEY))
+        await db.execute(text("UPDATE memories SET retrieval_count = 0 WHERE retrieval_count <> 0"))
+        await db.execute(text("UPDATE agents SET retrieved_memories = 0"))
+        await db.commit()
+
+    await naive_scans()
+    await timed_steps("full")
+    async with engine.begin() as conn:
+        await _insert_events(conn, args.new_events, args.memories, age="1 second")
+    await timed_steps(f"incremental (+{args.new_events} events)")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
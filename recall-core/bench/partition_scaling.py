@@ -0,0 +1,114 @@
+"""Insert throughput and search latency against the number of hash partitions.
+
+For each --partitions value the memories table of a SCRATCH database is
+converted with app.jobs.partition (0 = plain table), then:
+
+  search  --queries vector_search calls (per-partition fan-out when partitioned)
+          with random stored vectors, p50/p99 latency
+  insert  --inserts insert_memory calls from --writers concurrent sessions,
+          the API write path including the dedup ANN query, rows/s
+
+The table is converted back to a plain table at the end. The database needs
+an existing corpus, e.g. one loaded by bench/search_node_latency.py; rows
+inserted here are left in place. EMBEDDING_DIM must match the corpus.
+
+Usage:
+  EMBEDDING_DIM=256 DATABASE_URL=postgresql+asyncpg://.../scratch \\
+    python bench/partition_scaling.py [--partitions 0,2,4,8] [--queries 200] [--inserts 1000] [--writers 4]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.config import settings  # noqa: E402
+from app.db import partitions as db_partitions  # noqa: E402
+from app.db.engine import async_session, engine  # noqa: E402
+from app.db.queries.memories import insert_memory, vector_search  # noqa: E402
+from app.jobs import partition  # noqa: E402
+
+
+def _pct(samples: list[float], p: float) -> float:
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+
+def _unit(dim: int) -> list[float]:
+    v = [random.gauss(0, 1) for _ in range(dim)]
+    norm = sum(x * x for x in v) ** 0.5
+    return [x / norm for x in v]
+
+
+async def search(queries: int) -> list[float]:
+    async with async_session() as db:
+        rows = (await db.execute(text(
+            "SELECT embedding::text FROM memories TABLESAMPLE SYSTEM (1) LIMIT :n"
+        ).bindparams(n=queries))).scalars().all()
+    vectors = [[float(x) for x in r.strip("[]").split(",")] for r in rows]
+    timings = []
+    async with async_session() as db:
+        for vec in vectors:
+            t0 = time.perf_counter()
+            await vector_search(db, embedding=vec, limit=10)
+            timings.append(time.perf_counter() - t0)
+    return timings
+
+
+async def insert(total: int, writers: int, agent_id) -> float:
+    async def writer(n: int) -> None:
+        async with async_session() as db:
+            for _ in range(n):
+                await insert_memory(
+                    db,
+                    agent_id=agent_id,
+                    content=f"partition bench memory {random.getrandbits(64):x} " + "p" * 80,
+                    tags=["bench", "partition"],
+                    source_url=None,
+                    embedding=_unit(settings.embedding_dim),
+                    embedding_model="bench",
+                )
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(writer(total // writers) for _ in range(writers)))
+    return (total // writers * writers) / (time.perf_counter() - t0)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--partitions", default="0,2,4,8")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--inserts", type=int, default=1000)
+    parser.add_argument("--writers", type=int, default=4)
+    args = parser.parse_args()
+
+    async with async_session() as db:
+        agent_id = (await db.execute(text("SELECT id FROM agents LIMIT 1"))).scalar_one()
+
+    try:
+        for n in [int(p) for p in args.partitions.split(",")]:
+            stats = await partition.convert(n)
+            db_partitions.clear_partition_cache()
+            # Fresh statistics and visibility map, so autovacuum doesn't land mid-measurement
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.execute(text("VACUUM ANALYZE memories"))
+            timings = await search(args.queries)
+            rate = await insert(args.inserts, args.writers, agent_id)
+            print(
+                f"partitions={n:<3} rows={stats['rows']}  convert {stats['seconds']:6.1f}s"
+                f" (indexes {stats['index_seconds']:.1f}s)  search p50 {_pct(timings, 0.5):6.1f}ms"
+                f" p99 {_pct(timings, 0.99):6.1f}ms  insert {rate:7.0f} rows/s",
+                flush=True,
+            )
+    finally:
+        await partition.convert(0)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
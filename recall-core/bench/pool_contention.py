@@ -0,0 +1,131 @@
+"""GET /memory/{id} latency while writes and searches wait on a slow embedding provider.
+
+Requests only hold a database connection for their statements, so a slow
+provider must not starve the pool: GET latency should stay flat however slow
+the embeds are. Without that, every in-flight write and search sits on a
+connection for the whole embed call and GETs queue behind them.
+
+Start a slow fake provider, point the server at it, then drive load:
+
+  python bench/pool_contention.py provider --port 9100 --delay-ms 800
+  EMBEDDING_BASE_URL=http://localhost:9100 OPENAI_API_KEY=sk-fake uvicorn app.main:app
+  export RECALL_URL=http://localhost:8000/api/v1
+  export RECALL_KEY=recall_...   (trust 2 recommended, the load counts against rate limits)
+  python bench/pool_contention.py load [--concurrency 40] [--seconds 20]
+
+Compare a run with --delay-ms 0 against a slow one. The pool's checkout wait
+counters come from /health (`db_pool`) and are printed before and after.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+def _pct(samples: list[float], p: float) -> float:
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * p))]
+
+
+def _report(name: str, samples: list[float]) -> None:
+    if not samples:
+        print(f"{name:>8}: no samples")
+        return
+    print(
+        f"{name:>8}: n={len(samples)} mean={statistics.mean(samples):.1f}ms"
+        f" p50={_pct(samples, 0.5):.1f}ms p95={_pct(samples, 0.95):.1f}ms"
+        f" p99={_pct(samples, 0.99):.1f}ms"
+    )
+
+
+def provider(port: int, delay_ms: int, dim: int) -> None:
+    import uvicorn
+    from fastapi import FastAPI, Request
+
+    app = FastAPI()
+
+    @app.post("/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        await asyncio.sleep(delay_ms / 1000)
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        # Random directions, so every memory is distinct and searches return something
+        return {"data": [
+            {"index": i, "embedding": [((hash((t, j)) % 2000) - 1000) / 1000 for j in range(dim)]}
+            for i, t in enumerate(texts)
+        ]}
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+async def load(concurrency: int, seconds: float) -> None:
+    url = os.environ["RECALL_URL"].rstrip("/")
+    headers = {"Authorization": f"Bearer {os.environ['RECALL_KEY']}"}
+    limits = httpx.Limits(max_connections=concurrency + 10)
+    async with httpx.AsyncClient(timeout=60, headers=headers, limits=limits) as http:
+        resp = await http.post(f"{url}/memory", json={
+            "content": f"pool contention probe {uuid.uuid4().hex} " * 4, "tags": ["bench", "pool"],
+        })
+        resp.raise_for_status()
+        memory_id = resp.json()["id"]
+        print("before:", (await http.get(f"{url}/health")).json().get("db_pool"))
+
+        timings: dict[str, list[float]] = {"get": [], "write": [], "search": []}
+        deadline = time.monotonic() + seconds
+
+        async def worker(i: int) -> None:
+            while time.monotonic() < deadline:
+                word = uuid.uuid4().hex
+                if i % 2:
+                    kind = "write"
+                    call = http.post(f"{url}/memory", json={
+                        "content": f"pool contention {word} " * 6, "tags": ["bench", "pool"],
+                    })
+                else:
+                    # A fresh query each time: a cache hit would skip the embed
+                    kind = "search"
+                    call = http.get(f"{url}/memory/search", params={"q": f"pool contention {word}"})
+                t0 = time.perf_counter()
+                resp = await call
+                if resp.status_code == 200:
+                    timings[kind].append((time.perf_counter() - t0) * 1000)
+
+        async def reader() -> None:
+            while time.monotonic() < deadline:
+                t0 = time.perf_counter()
+                resp = await http.get(f"{url}/memory/{memory_id}")
+                resp.raise_for_status()
+                timings["get"].append((time.perf_counter() - t0) * 1000)
+                await asyncio.sleep(0.05)
+
+        await asyncio.gather(reader(), *(worker(i) for i in range(concurrency)))
+        print("after: ", (await http.get(f"{url}/health")).json().get("db_pool"))
+    for name, samples in timings.items():
+        _report(name, samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("provider")
+    p.add_argument("--port", type=int, default=9100)
+    p.add_argument("--delay-ms", type=int, default=800)
+    p.add_argument("--dim", type=int, default=int(os.environ.get("EMBEDDING_DIM", 1536)))
+    p = sub.add_parser("load")
+    p.add_argument("--concurrency", type=int, default=40)
+    p.add_argument("--seconds", type=float, default=20)
+    args = parser.parse_args()
+
+    if args.command == "provider":
+        provider(args.port, args.delay_ms, args.dim)
+    else:
+        asyncio.run(load(args.concurrency, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
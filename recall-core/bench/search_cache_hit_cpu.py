@@ -0,0 +1,108 @@
+"""CPU per cache-hit search: legacy rows-JSON path vs pre-rendered body path.
+
+Runs in-process with no server, Postgres or Redis; only the response-building
+work a cache hit pays for is measured (the Redis read and retrieval-event
+insert are identical in both paths).
+
+  legacy:   json.loads(rows) -> MemorySearchResult per row -> response_model
+            validation -> jsonable_encoder -> json.dumps
+  rendered: orjson.loads(hits) for retrieval logging, body bytes returned as-is
+
+Usage:
+  python bench/search_cache_hit_cpu.py [iterations] [results_per_page]
+"""
+
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.schemas.memories import AuthorInfo, MemorySearchResponse, MemorySearchResult  # noqa: E402
+
+
+def _rows(n: int) -> list[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "short_id": f"RCL-{i:08d}",
+            "content": "Redis BRPOPLPUSH was removed in Redis 7. Use LMPOP or BLMOVE instead. " * 4,
+            "tags": ["redis", "migration", "ci", "breaking-change"],
+            "source_url": "https://github.com/example/issue/42",
+            "author_name": "BenchAgent",
+            "created_at": now.isoformat(),
+            "similarity": 0.8123,
+            "retrieval_count": i,
+        }
+        for i in range(n)
+    ]
+
+
+def legacy(cached: str, q: str, adapter: TypeAdapter) -> bytes:
+    rows = json.loads(cached)
+    model = MemorySearchResponse(
+        query=q,
+        results=[
+            MemorySearchResult(
+                id=row["id"],
+                short_id=row["short_id"],
+                content=row["content"],
+                tags=row["tags"],
+                source_url=row["source_url"],
+                author=AuthorInfo(name=row["author_name"]),
+                created_at=row["created_at"],
+                similarity=row["similarity"],
+                retrieval_count=row["retrieval_count"],
+            )
+            for row in rows
+        ],
+    )
+    # What FastAPI does with a returned model and a response_model
+    validated = adapter.validate_python(model, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def rendered(body: bytes, hits: bytes) -> bytes:
+    orjson.loads(hits)
+    return body
+
+
+def _cpu_us(fn, iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    q = "redis command removed in version 7"
+    rows = _rows(n)
+
+    cached = json.dumps(rows)
+    body = orjson.dumps({
+        "success": True,
+        "query": q,
+        "results": [{**r, "author": {"name": r.pop("author_name")}} for r in _rows(n)],
+        "next_cursor": None,
+    })
+    hits = orjson.dumps([[r["id"], r["similarity"]] for r in rows])
+    adapter = TypeAdapter(MemorySearchResponse)
+
+    legacy_us = _cpu_us(lambda: legacy(cached, q, adapter), iterations)
+    rendered_us = _cpu_us(lambda: rendered(body, hits), iterations)
+    print(f"results/page={n} iterations={iterations}")
+    print(f"  legacy:   {legacy_us:8.1f} us CPU/request")
+    print(f"  rendered: {rendered_us:8.1f} us CPU/request ({legacy_us / rendered_us:.0f}x less)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Search node vs Postgres HNSW: latency and recall@10 on a synthetic corpus.
+
+Loads --rows clustered random vectors into a SCRATCH database (tables are
+dropped and recreated; loaded with app.jobs.transfer, HNSW built after),
+builds a search-node snapshot, then runs --queries searches through both:
+
+  postgres  queries.memories.vector_search (HNSW + ranking, one round trip)
+  node      search_node.vector_search (IVF scan over the mmap + PK hydration)
+  node scan search_node.SearchNode.search alone, without hydration
+
+Recall@10 is measured against an exact numpy scan of the same vectors.
+Needs numpy. EMBEDDING_DIM sets the vector size.
+
+Usage:
+  EMBEDDING_DIM=256 DATABASE_URL=postgresql+asyncpg://.../scratch \\
+    python bench/search_node_latency.py [--rows 100000] [--queries 200] [--nprobe 8]
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import orjson
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app import search_node  # noqa: E402
+from app.auth.keys import generate_api_key, hash_api_key  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.db.engine import async_session, engine  # noqa: E402
+from app.db.models import Base  # noqa: E402
+from app.db.queries.memories import vector_search  # noqa: E402
+from app.jobs import transfer  # noqa: E402
+
+
+def corpus(rows: int, dim: int, rnd) -> np.ndarray:
+    # Gaussian blobs around 1000 topic centres: neighbourhoods an index can exploit
+    centres = rnd.standard_normal((1000, dim)).astype(np.float32)
+    vecs = centres[rnd.integers(0, len(centres), rows)] + 0.6 * rnd.standard_normal((rows, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+async def load(vecs: np.ndarray) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(text(transfer.HNSW_INDEX_SQL))
+        agent_id = uuid.uuid4()
+        await conn.execute(text(
+            "INSERT INTO agents (id, name, api_key_hash, trust_level) VALUES (:id, 'bench', :h, 2)"
+        ).bindparams(id=agent_id, h=hash_api_key(generate_api_key())))
+
+    model = transfer.current_model()
+
+    async def lines():
+        for i, v in enumerate(vecs):
+            yield orjson.dumps({
+                "content": f"bench memory {i}",
+                "tags": ["bench", "node"],
+                "embedding": base64.b64encode(transfer.pack_vector(v.tolist())).decode(),
+                "embedding_model": model,
+            })
+
+    t0 = time.perf_counter()
+    async with transfer.raw_connection() as conn:
+        await transfer.import_ndjson(conn, lines(), agent_id=agent_id, rebuild_index=True)
+    print(f"loaded {len(vecs)} rows + HNSW in {time.perf_counter() - t0:.0f}s", flush=True)
+
+
+def _pct(samples: list[float], p: float) -> float:
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, default=settings.search_node_nprobe)
+    parser.add_argument("--skip-load", action="store_true")
+    args = parser.parse_args()
+
+    rnd = np.random.default_rng(3)
+    vecs = corpus(args.rows, settings.embedding_dim, rnd)
+    if not args.skip_load:
+        await load(vecs)
+
+    directory = tempfile.mkdtemp(prefix="recall-node-")
+    meta = await search_node.build_snapshot(directory)
+    print(f"snapshot: {meta}", flush=True)
+    node = search_node.SearchNode()
+    node.load(directory)
+    search_node.node = node
+    settings.search_node_nprobe = args.nprobe
+    settings.min_similarity = -1.0  # rank everything: recall is about the ANN, not the floor
+
+    # Queries are perturbed corpus vectors, the way real queries land near stored memories
+    picks = rnd.integers(0, len(vecs), args.queries)
+    noise = rnd.standard_normal((args.queries, vecs.shape[1])).astype(np.float32)
+    queries = vecs[picks] + 0.5 * noise / np.sqrt(vecs.shape[1])
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    # Exact top-10 by similarity, mapped to row ids via content order
+    async with async_session() as db:
+        rows = (await db.execute(text("SELECT id, content FROM memories"))).fetchall()
+    row_id = {int(r.content.rsplit(" ", 1)[1]): r.id for r in rows}
+    truth = [{row_id[j] for j in np.argsort(-(vecs @ q))[:10]} for q in queries]
+
+    timings: dict[str, list[float]] = {"postgres": [], "node": [], "node scan": []}
+    hits = {"postgres": 0, "node": 0}
+    async with async_session() as db:
+        await db.execute(text("SET hnsw.ef_search = 40"))
+        for q, exact in zip(queries, truth):
+            qv = q.tolist()
+            for label, run in (
+                ("postgres", lambda: vector_search(db, embedding=qv, limit=10)),
+                ("node", lambda: search_node.vector_search(db, embedding=qv, limit=10)),
+            ):
+                t0 = time.perf_counter()
+                result = await run()
+                timings[label].append(time.perf_counter() - t0)
+                hits[label] += len(exact & {r["id"] for r in result})
+            t0 = time.perf_counter()
+            node.search(qv, 10 * settings.search_node_overfetch)
+            timings["node scan"].append(time.perf_counter() - t0)
+
+    print(f"rows={args.rows} dim={settings.embedding_dim} lists={meta['lists']} nprobe={args.nprobe}")
+    for label, samples in timings.items():
+        recall = f"  recall@10 {hits[label] / (10 * len(queries)):.3f}" if label in hits else ""
+        print(f"{label:>10}: p50 {_pct(samples, 0.5):6.1f}ms  p99 {_pct(samples, 0.99):6.1f}ms{recall}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""Page-1 vs page-2+ latency of cursor-paged /memory/search.
+
+Page 1 pays embed + ANN (or a cache hit); follow-up pages should only cost a
+Redis read and a primary-key fetch. Each round uses a fresh query so page 1 is
+always a cache miss.
+
+Prerequisites:
+  export RECALL_URL=http://localhost:8000/api/v1
+  export RECALL_KEY=recall_...   (trust >= 1 recommended, searches count against rate limits)
+
+Usage:
+  python bench/search_pagination.py [rounds] [pages] [limit]
+"""
+
+import os
+import statistics
+import sys
+import time
+import uuid
+
+import httpx
+
+
+def _pct(samples: list[float], p: float) -> float:
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * p))]
+
+
+def _report(name: str, samples: list[float]) -> None:
+    if not samples:
+        print(f"{name:>8}: no samples")
+        return
+    print(
+        f"{name:>8}: n={len(samples)} mean={statistics.mean(samples):.1f}ms"
+        f" p50={_pct(samples, 0.5):.1f}ms p95={_pct(samples, 0.95):.1f}ms"
+        f" p99={_pct(samples, 0.99):.1f}ms"
+    )
+
+
+def main() -> None:
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    limit = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    url = os.environ["RECALL_URL"].rstrip("/")
+    headers = {"Authorization": f"Bearer {os.environ['RECALL_KEY']}"}
+    first: list[float] = []
+    later: list[float] = []
+
+    with httpx.Client(timeout=30, headers=headers) as http:
+        for _ in range(rounds):
+            params = {"q": f"redis connection timeout {uuid.uuid4().hex[:6]}", "limit": limit}
+            for page in range(pages):
+                t0 = time.perf_counter()
+                r = http.get(f"{url}/memory/search", params=params)
+                elapsed = (time.perf_counter() - t0) * 1000
+                r.raise_for_status()
+                (first if page == 0 else later).append(elapsed)
+                cursor = r.json().get("next_cursor")
+                if not cursor:
+                    break
+                params = {"cursor": cursor, "limit": limit}
+
+    _report("page 1", first)
+    _report("page 2+", later)
+
+
+if __name__ == "__main__":
+    main()
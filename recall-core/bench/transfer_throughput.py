@@ -0,0 +1,80 @@
+"""Rows/sec of NDJSON export and COPY-based import (app.jobs.transfer).
+
+Exports --source to a file, then imports that file into --target, a SCRATCH
+database whose tables are dropped and recreated with the HNSW index, which
+is maintained row by row, or with --rebuild-index dropped and built after
+the load. Prints rows/sec for both directions and the peak RSS of this
+process, which should stay flat however big the corpus is.
+
+A source of any size can be made with bench/maintenance_jobs.py (1M memories
+at a small EMBEDDING_DIM); EMBEDDING_DIM must match the source either way.
+
+Usage:
+  EMBEDDING_DIM=4 python bench/transfer_throughput.py \\
+    --source postgresql+asyncpg://.../big --target postgresql+asyncpg://.../scratch [--file /tmp/corpus.ndjson]
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.db.models import Base  # noqa: E402
+from app.jobs import transfer  # noqa: E402
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def export(url: str, path: str) -> None:
+    transfer.engine = create_async_engine(url)
+    t0 = time.perf_counter()
+    rows = 0
+    with open(path, "wb") as f:
+        async with transfer.raw_connection() as conn:
+            async for chunk in transfer.export_ndjson(conn):
+                rows += chunk.count(b"\n")
+                f.write(chunk)
+    elapsed = time.perf_counter() - t0
+    await transfer.engine.dispose()
+    print(f"export: {rows} lines, {os.path.getsize(path) / 1e6:.0f} MB in {elapsed:.1f}s"
+          f" = {rows / elapsed:,.0f} rows/s, peak RSS {_rss_mb():.0f} MB", flush=True)
+
+
+async def load(url: str, path: str, rebuild_index: bool) -> None:
+    transfer.engine = create_async_engine(url)
+    async with transfer.engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(text(transfer.HNSW_INDEX_SQL))
+    async with transfer.raw_connection() as conn:
+        stats = await transfer.import_ndjson(
+            conn, transfer.iter_lines(transfer._file_chunks(path)), rebuild_index=rebuild_index
+        )
+    await transfer.engine.dispose()
+    mode = "rebuild index after" if rebuild_index else "index maintained per row"
+    print(f"import ({mode}): {stats}, peak RSS {_rss_mb():.0f} MB", flush=True)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", required=True)
+    parser.add_argument("--target", required=True)
+    parser.add_argument("--file", default="/tmp/recall-export.ndjson")
+    parser.add_argument("--rebuild-index", action="store_true")
+    args = parser.parse_args()
+
+    await export(args.source, args.file)
+    await load(args.target, args.file, args.rebuild_index)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
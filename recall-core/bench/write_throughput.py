@@ -0,0 +1,107 @@
+"""Write-path throughput: insert_memory from concurrent sessions.
+
+Each insert is the single data-modifying statement of the write path (memory
+row, dedup ANN query, links, cluster merge) plus SET LOCAL and the commit.
+--writers sessions insert --inserts memories between them; --dup-share of
+them reuse a stored vector with a little noise, so they link duplicate
+candidates and merge clusters instead of only inserting. Reported: rows/s,
+p50/p99 latency per insert and statements per insert (from the slow-query
+log's statement counter).
+
+The database needs an existing corpus, e.g. one loaded by
+bench/search_node_latency.py; rows inserted here are left in place.
+EMBEDDING_DIM must match the corpus.
+
+Usage:
+  EMBEDDING_DIM=256 DATABASE_URL=postgresql+asyncpg://.../scratch \\
+    python bench/write_throughput.py [--inserts 2000] [--writers 1,4,16] [--dup-share 0.2]
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+import time
+
+import orjson
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.config import settings  # noqa: E402
+from app.db import slowlog  # noqa: E402
+from app.db.engine import async_session, engine  # noqa: E402
+from app.db.queries.memories import insert_memory  # noqa: E402
+
+
+def _pct(samples: list[float], p: float) -> float:
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+
+def _unit(vec: list[float]) -> list[float]:
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+async def run(total: int, writers: int, agent_id, stored: list[list[float]], dup_share: float):
+    timings: list[float] = []
+
+    async def writer(n: int) -> None:
+        async with async_session() as db:
+            for _ in range(n):
+                if stored and random.random() < dup_share:
+                    vec = _unit([v + random.gauss(0, 0.01) for v in random.choice(stored)])
+                else:
+                    vec = _unit([random.gauss(0, 1) for _ in range(settings.embedding_dim)])
+                t0 = time.perf_counter()
+                await insert_memory(
+                    db,
+                    agent_id=agent_id,
+                    content=f"write bench memory {random.getrandbits(64):x} " + "w" * 80,
+                    tags=["bench", "write"],
+                    source_url=None,
+                    embedding=vec,
+                    embedding_model="bench",
+                )
+                timings.append(time.perf_counter() - t0)
+
+    statements = slowlog.counters["statements"]
+    t0 = time.perf_counter()
+    await asyncio.gather(*(writer(total // writers) for _ in range(writers)))
+    elapsed = time.perf_counter() - t0
+    done = len(timings)
+    return done / elapsed, timings, (slowlog.counters["statements"] - statements) / done
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inserts", type=int, default=2000)
+    parser.add_argument("--writers", default="1,4,16")
+    parser.add_argument("--dup-share", type=float, default=0.2)
+    args = parser.parse_args()
+    # Time statements only: nothing is slow enough to be logged or explained
+    settings.slow_query_ms = 0
+
+    async with async_session() as db:
+        agent_id = (await db.execute(text("SELECT id FROM agents LIMIT 1"))).scalar_one()
+        rows = (await db.execute(text(
+            "SELECT embedding::text FROM memories TABLESAMPLE SYSTEM (1) LIMIT 200"
+        ))).scalars().all()
+    stored = [orjson.loads(r) for r in rows]
+
+    try:
+        for writers in [int(w) for w in args.writers.split(",")]:
+            rate, timings, per_insert = await run(args.inserts, writers, agent_id, stored, args.dup_share)
+            print(
+                f"writers={writers:<3} inserts={len(timings)}  {rate:7.0f} rows/s"
+                f"  p50 {_pct(timings, 0.5):6.1f}ms  p99 {_pct(timings, 0.99):6.1f}ms"
+                f"  {per_insert:.1f} statements/insert",
+                flush=True,
+            )
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
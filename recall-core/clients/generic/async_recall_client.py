@@ -0,0 +1,174 @@
+"""Async Recall client — pooled, retrying, concurrent counterpart of RecallClient."""
+
+import asyncio
+import random
+import time
+from collections import OrderedDict
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+_RETRY_STATUSES = {429, 502, 503, 504}
+_BATCH_MAX = 10  # server default for batch_search_max_queries
+
+
+class AsyncRecallClient:
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        *,
+        max_connections: int = 20,
+        concurrency: int = 8,
+        max_retries: int = 3,
+        cache_size: int = 512,
+        cache_ttl: float = 300,
+        max_retry_wait: float = 60,
+    ):
+        self._url = base_url.rstrip("/")
+        self._http = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=30,
+            http2=_HTTP2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+        self._sem = asyncio.Semaphore(concurrency)
+        self._max_retries = max_retries
+        self._max_retry_wait = max_retry_wait
+        self._cache_size = cache_size
+        self._cache_ttl = cache_ttl
+        # memory id/short_id -> (expires_at, etag, memory)
+        self._cache: OrderedDict[str, tuple[float, str | None, dict]] = OrderedDict()
+        self._has_batch_search: bool | None = None
+
+    async def __aenter__(self) -> "AsyncRecallClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    async def _request(
+        self, method: str, path: str, *, idempotent: bool = True, **kwargs
+    ) -> httpx.Response:
+        """Send with bounded retries: honors Retry-After on 429, jittered backoff otherwise.
+
+        A Retry-After longer than max_retry_wait (e.g. a daily write cap) is not
+        waited out; the 429 is returned to the caller. Non-idempotent requests are
+        only retried when the server cannot have acted on them: a 429, or a failure
+        to connect. A 5xx or a dropped connection may follow a committed write.
+        """
+        attempt = 0
+        while True:
+            try:
+                r = await self._http.request(method, f"{self._url}{path}", **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= self._max_retries:
+                    raise
+                if not idempotent and not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+                    raise
+            else:
+                if r.status_code not in _RETRY_STATUSES or attempt >= self._max_retries:
+                    return r
+                if not idempotent and r.status_code != 429:
+                    return r
+                retry_after = r.headers.get("Retry-After")
+                if retry_after is not None and retry_after.isdigit():
+                    if int(retry_after) > self._max_retry_wait:
+                        return r
+                    await asyncio.sleep(int(retry_after))
+                    attempt += 1
+                    continue
+            await asyncio.sleep(min(8.0, 0.25 * 2**attempt) * random.uniform(0.5, 1.5))
+            attempt += 1
+
+    async def save(self, content: str, tags: list[str], source_url: str | None = None) -> dict:
+        body = {"content": content, "tags": tags}
+        if source_url:
+            body["source_url"] = source_url
+        async with self._sem:
+            r = await self._request("POST", "/memory", idempotent=False, json=body)
+        r.raise_for_status()
+        return r.json()
+
+    async def search(self, query: str, limit: int = 5) -> list[dict]:
+        async with self._sem:
+            r = await self._request("GET", "/memory/search", params={"q": query, "limit": limit})
+        r.raise_for_status()
+        return r.json()["results"]
+
+    async def get(self, memory_id: str) -> dict:
+        """Memories are immutable, so fresh cache entries skip the network entirely.
+
+        Stale entries are revalidated with If-None-Match; a 304 just renews them.
+        """
+        entry = self._cache.get(memory_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._cache.move_to_end(memory_id)
+            return entry[2]
+
+        headers = {"If-None-Match": entry[1]} if entry is not None and entry[1] else {}
+        async with self._sem:
+            r = await self._request("GET", f"/memory/{memory_id}", headers=headers)
+        if r.status_code == 304 and entry is not None:
+            memory = entry[2]
+        else:
+            r.raise_for_status()
+            memory = r.json()["memory"]
+        self._remember(memory_id, r.headers.get("ETag"), memory)
+        return memory
+
+    def _remember(self, memory_id: str, etag: str | None, memory: dict) -> None:
+        self._cache[memory_id] = (time.monotonic() + self._cache_ttl, etag, memory)
+        self._cache.move_to_end(memory_id)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    async def search_many(
+        self, queries: list[str], limit: int = 5, merge: bool = False
+    ) -> list[list[dict]] | list[dict]:
+        """Run several searches concurrently, via POST /memory/search/batch when the server has it.
+
+        Returns one result list per query, or a single deduplicated list if `merge`.
+        """
+        chunks = [queries[i:i + _BATCH_MAX] for i in range(0, len(queries), _BATCH_MAX)]
+        per_query: list[list[dict]] = []
+        for results in await asyncio.gather(*(self._search_chunk(c, limit) for c in chunks)):
+            per_query.extend(results)
+        if not merge:
+            return per_query
+        best: dict[str, dict] = {}
+        for results in per_query:
+            for m in results:
+                if m["id"] not in best or m["similarity"] > best[m["id"]]["similarity"]:
+                    best[m["id"]] = m
+        return sorted(best.values(), key=lambda m: m["similarity"], reverse=True)
+
+    async def _search_chunk(self, queries: list[str], limit: int) -> list[list[dict]]:
+        if self._has_batch_search is not False:
+            async with self._sem:
+                r = await self._request(
+                    "POST", "/memory/search/batch", json={"queries": queries, "limit": limit}
+                )
+            if r.status_code in (404, 405):
+                self._has_batch_search = False
+            else:
+                r.raise_for_status()
+                self._has_batch_search = True
+                return [s["results"] for s in r.json()["searches"]]
+        return list(await asyncio.gather(*(self.search(q, limit) for q in queries)))
+
+    async def save_many(self, memories: list[dict]) -> list[dict]:
+        """Save several memories concurrently. Each dict takes save()'s keyword arguments."""
+        return list(await asyncio.gather(*(self.save(**m) for m in memories)))
@@ -0,0 +1,27 @@
+"""Add generated tsvector column on memories.content for lexical search
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "003"
+down_revision: Union[str, None] = "002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE memories ADD COLUMN content_tsv tsvector"
+        " GENERATED ALWAYS AS (to_tsvector('english', content)) STORED"
+    )
+    op.create_index("ix_memories_content_tsv", "memories", ["content_tsv"], postgresql_using="gin")
+
+
+def downgrade() -> None:
+    op.drop_index("ix_memories_content_tsv", table_name="memories")
+    op.drop_column("memories", "content_tsv")
@@ -0,0 +1,31 @@
+"""Add normalized content hash on memories for exact-duplicate detection
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "004"
+down_revision: Union[str, None] = "003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("memories", sa.Column("content_hash", sa.Text(), nullable=True))
+    # Mirrors app.dedup.content_hash: collapse whitespace runs, trim, sha256 hex
+    op.execute(
+        "UPDATE memories SET content_hash = encode(sha256(convert_to("
+        "btrim(regexp_replace(content, '\\s+', ' ', 'g'), ' '), 'UTF8')), 'hex')"
+    )
+    op.alter_column("memories", "content_hash", nullable=False)
+    op.create_index("ix_memories_content_hash", "memories", ["content_hash"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_memories_content_hash", table_name="memories")
+    op.drop_column("memories", "content_hash")
@@ -0,0 +1,53 @@
+"""Add SimHash fingerprint and band columns on memories for near-duplicate detection
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.dedup import simhash, simhash_bands
+
+revision: str = "005"
+down_revision: Union[str, None] = "004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH = 1000
+
+
+def upgrade() -> None:
+    op.add_column("memories", sa.Column("simhash", sa.BigInteger(), nullable=True))
+    op.add_column("memories", sa.Column("simhash_bands", postgresql.ARRAY(sa.Integer()), nullable=True))
+
+    # SimHash isn't expressible in SQL; backfill from Python in keyset batches
+    bind = op.get_bind()
+    select = sa.text(
+        "SELECT id, content FROM memories WHERE simhash IS NULL AND id > :after ORDER BY id LIMIT :n"
+    )
+    update = sa.text("UPDATE memories SET simhash = :h, simhash_bands = :b WHERE id = :id")
+    after = "00000000-0000-0000-0000-000000000000"
+    while True:
+        rows = bind.execute(select, {"after": after, "n": BATCH}).fetchall()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            value = simhash(row.content)
+            params.append({"id": row.id, "h": value, "b": simhash_bands(value)})
+        bind.execute(update, params)
+        after = rows[-1].id
+
+    op.create_index(
+        "ix_memories_simhash_bands", "memories", ["simhash_bands"], postgresql_using="gin"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_memories_simhash_bands", table_name="memories")
+    op.drop_column("memories", "simhash_bands")
+    op.drop_column("memories", "simhash")
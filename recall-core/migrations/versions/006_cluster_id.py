@@ -0,0 +1,31 @@
+"""Add duplicate cluster label on memories
+
+Every memory starts as its own cluster. Run POST /admin/clusters/rebuild once
+after upgrading to fold existing duplicate_of / duplicate_candidate links.
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = "006"
+down_revision: Union[str, None] = "005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("memories", sa.Column("cluster_id", postgresql.UUID(as_uuid=True), nullable=True))
+    op.execute("UPDATE memories SET cluster_id = id")
+    op.alter_column("memories", "cluster_id", nullable=False)
+    op.create_index("ix_memories_cluster_id", "memories", ["cluster_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_memories_cluster_id", table_name="memories")
+    op.drop_column("memories", "cluster_id")
@@ -0,0 +1,44 @@
+"""Add retrieval counters and an insert-order sequence on retrieval_events
+
+Counters start at 0; the first maintenance run folds in all existing events
+(from seq 0) in chunks.
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "007"
+down_revision: Union[str, None] = "006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rows are numbered by the identity as the column is added
+    op.execute("ALTER TABLE retrieval_events ADD COLUMN seq BIGINT GENERATED ALWAYS AS IDENTITY")
+    op.create_index("ix_retrieval_events_seq", "retrieval_events", ["seq"], unique=True)
+    op.add_column(
+        "memories",
+        sa.Column("retrieval_count", sa.Integer(), nullable=False, server_default=sa.text("0")),
+    )
+    op.add_column(
+        "agents",
+        sa.Column("retrieved_memories", sa.Integer(), nullable=False, server_default=sa.text("0")),
+    )
+    op.add_column(
+        "agents",
+        sa.Column("quarantine_count", sa.Integer(), nullable=False, server_default=sa.text("0")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("agents", "quarantine_count")
+    op.drop_column("agents", "retrieved_memories")
+    op.drop_column("memories", "retrieval_count")
+    op.drop_index("ix_retrieval_events_seq", table_name="retrieval_events")
+    op.drop_column("retrieval_events", "seq")
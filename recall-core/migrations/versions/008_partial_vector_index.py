@@ -0,0 +1,40 @@
+"""Make the HNSW index partial on live memories (quality > -2)
+
+Quarantined memories no longer take candidate slots in ANN scans. The new
+index is built CONCURRENTLY next to the old one and swapped in by name, so
+searches stay indexed and writes are not blocked during the upgrade.
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "008"
+down_revision: Union[str, None] = "007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _swap(create_sql: str) -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_memories_embedding_new")
+        op.execute(create_sql)
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_memories_embedding")
+        op.execute("ALTER INDEX ix_memories_embedding_new RENAME TO ix_memories_embedding")
+
+
+def upgrade() -> None:
+    _swap(
+        "CREATE INDEX CONCURRENTLY ix_memories_embedding_new ON memories"
+        " USING hnsw (embedding vector_cosine_ops) WHERE quality > -2"
+    )
+
+
+def downgrade() -> None:
+    _swap(
+        "CREATE INDEX CONCURRENTLY ix_memories_embedding_new ON memories"
+        " USING hnsw (embedding vector_cosine_ops)"
+    )
@@ -1,12 +1,14 @@
 import os
+from typing import NamedTuple
 from unittest.mock import AsyncMock, patch
 
 import pytest
 from httpx import ASGITransport, AsyncClient
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
-from app.db.models import Base
-from app.auth.middleware import get_db
+from app.db.models import Agent, Base
+from app.auth.middleware import get_db, get_read_db
 from app.main import app
 
 DATABASE_URL = os.getenv(
@@ -46,6 +48,7 @@ async def client(db):
         yield db
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
 
     # Mock rate limiter to always allow
     with patch("app.ratelimit.limiter.check_rate_limit", new_callable=AsyncMock, return_value=True):
@@ -67,5 +70,32 @@ def mock_embedding():
         "app.embedding.client.embedding_client.embed",
         new_callable=AsyncMock,
         return_value=FAKE_EMBEDDING,
+    ), patch(
+        "app.embedding.client.embedding_client.embed_many",
+        new_callable=AsyncMock,
+        side_effect=lambda texts, budget=None: [FAKE_EMBEDDING] * len(texts),
     ):
         yield
+
+
+def auth_headers(api_key: str) -> dict:
+    return {"Authorization": f"Bearer {api_key}"}
+
+
+class RegisteredAgent(NamedTuple):
+    id: str
+    api_key: str
+
+    @property
+    def headers(self) -> dict:
+        return auth_headers(self.api_key)
+
+
+async def register_agent(client, name, trust_level=0, db=None) -> RegisteredAgent:
+    """Register through the API; a higher trust_level is set directly, through the test's `db`."""
+    resp = await client.post("/api/v1/agents/register", json={"name": name})
+    data = resp.json()
+    if trust_level:
+        await db.execute(update(Agent).where(Agent.id == data["agent"]["id"]).values(trust_level=trust_level))
+        await db.commit()
+    return RegisteredAgent(data["agent"]["id"], data["api_key"])
@@ -0,0 +1,526 @@
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import select, update
+
+from app.db.models import Agent, Memory
+from tests.conftest import TestSession, auth_headers, register_agent
+
+SAMPLE_CONTENT = "x" * 100
+
+
+@pytest.fixture
+async def core_key(client, db):
+    _, key = await register_agent(client, "CoreAgent", trust_level=2, db=db)
+    return key
+
+
+@pytest.fixture(autouse=True)
+def job_session():
+    with patch("app.jobs.quarantine.async_session", TestSession):
+        yield
+
+
+@pytest.mark.anyio
+async def test_quarantine_requires_core(client):
+    _, key = await register_agent(client, "Plain")
+    victim_id, _ = await register_agent(client, "Victim")
+    resp = await client.post(f"/api/v1/admin/quarantine/{victim_id}", headers=auth_headers(key))
+    assert resp.status_code == 403
+
+
+@pytest.mark.anyio
+async def test_quarantine_and_unquarantine(client, db, core_key):
+    spammer_id, spammer_key = await register_agent(client, "Spammer")
+    write = await client.post(
+        "/api/v1/memory",
+        json={"content": SAMPLE_CONTENT, "tags": ["spam", "test"]},
+        headers=auth_headers(spammer_key),
+    )
+    memory_id = write.json()["id"]
+    search = {"q": "spam check", "limit": 50}
+    before = await client.get("/api/v1/memory/search", params=search, headers=auth_headers(core_key))
+    assert memory_id in [r["id"] for r in before.json()["results"]]
+
+    resp = await client.post(f"/api/v1/admin/quarantine/{spammer_id}", headers=auth_headers(core_key))
+    assert resp.status_code == 202
+
+    status = await client.get(f"/api/v1/admin/quarantine/{spammer_id}", headers=auth_headers(core_key))
+    job = status.json()["job"]
+    assert job["action"] == "quarantine"
+    assert job["status"] == "done"
+    assert job["processed"] == 1
+
+    db.expire_all()
+    quality = await db.scalar(select(Memory.quality).where(Memory.id == memory_id))
+    assert quality == -2
+
+    # Cached search entries that returned the memory were purged
+    after = await client.get("/api/v1/memory/search", params=search, headers=auth_headers(core_key))
+    assert memory_id not in [r["id"] for r in after.json()["results"]]
+
+    resp = await client.post(f"/api/v1/admin/unquarantine/{spammer_id}", headers=auth_headers(core_key))
+    assert resp.status_code == 202
+    db.expire_all()
+    quality = await db.scalar(select(Memory.quality).where(Memory.id == memory_id))
+    disabled_at = await db.scalar(select(Agent.disabled_at).where(Agent.id == spammer_id))
+    assert quality == -1  # trust 0 default
+    assert disabled_at is None
+
+
+@pytest.mark.anyio
+async def test_quarantined_original_is_not_a_duplicate(client, db, core_key):
+    from app.embedding.client import embedding_client
+
+    content = "Quarantined original: this memory is spam and must not absorb later copies " + "q" * 40
+    spammer_id, spammer_key = await register_agent(client, "DupSpammer")
+    spam = await client.post(
+        "/api/v1/memory", json={"content": content, "tags": ["spam", "test"]}, headers=auth_headers(spammer_key)
+    )
+    resp = await client.post(f"/api/v1/admin/quarantine/{spammer_id}", headers=auth_headers(core_key))
+    assert resp.status_code == 202
+
+    _, key = await register_agent(client, "HonestWriter")
+    embedding_client.embed.reset_mock()
+    write = await client.post(
+        "/api/v1/memory", json={"content": content, "tags": ["spam", "test"]}, headers=auth_headers(key)
+    )
+    assert write.status_code == 200
+    # Not linked to the quarantined copy, and embedded on its own
+    embedding_client.embed.assert_called_once()
+    duplicate_of = await db.scalar(select(Memory.duplicate_of).where(Memory.id == write.json()["id"]))
+    assert str(duplicate_of) != spam.json()["id"]
+
+
+@pytest.mark.anyio
+async def test_interrupted_quarantine_resumes(client, db, core_key, monkeypatch):
+    import json
+    from datetime import datetime, timedelta, timezone
+    from unittest.mock import AsyncMock
+
+    from app.config import settings
+    from app.db.queries.system import set_config
+    from app.jobs import quarantine
+
+    spammer_id, spammer_key = await register_agent(client, "Interrupted")
+    ids = []
+    for i in range(3):
+        write = await client.post(
+            "/api/v1/memory",
+            json={"content": f"Interrupted quarantine {i} " + "i" * 90, "tags": ["spam", "test"]},
+            headers=auth_headers(spammer_key),
+        )
+        ids.append(write.json()["id"])
+    ids.sort()
+
+    # A job that died after its first batch: one row done, no progress saved for a while
+    await db.execute(update(Memory).where(Memory.id == ids[0]).values(quality=-2))
+    job = quarantine.new_job("quarantine")
+    old = (datetime.now(timezone.utc) - timedelta(seconds=settings.quarantine_stale_seconds + 60)).isoformat()
+    job.update(processed=1, last_id=ids[0], updated_at=old)
+    await set_config(db, quarantine.job_key(spammer_id), json.dumps(job))
+
+    assert await quarantine.fail_stale_jobs() == 1
+    status = await client.get(f"/api/v1/admin/quarantine/{spammer_id}", headers=auth_headers(core_key))
+    assert status.json()["job"]["status"] == "failed"
+    assert status.json()["job"]["error"] == "interrupted"
+
+    monkeypatch.setattr(settings, "quarantine_batch_size", 1)
+    monkeypatch.setattr(settings, "quarantine_batch_pause", 0)
+    monkeypatch.setattr(settings, "quarantine_purge_batches", 1)
+    purge = AsyncMock(return_value=0)
+    monkeypatch.setattr(quarantine, "purge_search_cache", purge)
+    resp = await client.post(f"/api/v1/admin/quarantine/{spammer_id}", headers=auth_headers(core_key))
+    assert resp.status_code == 202
+
+    status = await client.get(f"/api/v1/admin/quarantine/{spammer_id}", headers=auth_headers(core_key))
+    job = status.json()["job"]
+    assert job["status"] == "done" and job["error"] is None
+    assert job["processed"] == 3 and job["last_id"] == ids[2]
+    # Resumed past last_id: only the two remaining rows went through the batches
+    assert [call.args[0] for call in purge.call_args_list] == [[ids[1]], [ids[2]], []]
+
+
+@pytest.mark.anyio
+async def test_quarantine_purges_search_cache_per_n_batches(client, core_key, monkeypatch):
+    from unittest.mock import AsyncMock
+
+    from app.config import settings
+    from app.jobs import quarantine
+
+    spammer_id, spammer_key = await register_agent(client, "BigSpammer")
+    ids = []
+    for i in range(5):
+        write = await client.post(
+            "/api/v1/memory",
+            json={"content": f"Purge batching {i} " + "p" * 90, "tags": ["spam", "test"]},
+            headers=auth_headers(spammer_key),
+        )
+        ids.append(write.json()["id"])
+
+    monkeypatch.setattr(settings, "quarantine_batch_size", 1)
+    monkeypatch.setattr(settings, "quarantine_batch_pause", 0)
+    monkeypatch.setattr(settings, "quarantine_purge_batches", 2)
+    purge = AsyncMock(return_value=0)
+    monkeypatch.setattr(quarantine, "purge_search_cache", purge)
+    resp = await client.post(f"/api/v1/admin/quarantine/{spammer_id}", headers=auth_headers(core_key))
+    assert resp.status_code == 202
+
+    # One cache scan per two batches plus the remainder, not one per batch
+    purged = [call.args[0] for call in purge.call_args_list]
+    assert [len(p) for p in purged] == [2, 2, 1]
+    assert sorted(sum(purged, [])) == sorted(ids)
+
+
+@pytest.mark.anyio
+async def test_quarantine_conflicts_and_repeat_posts(client, db, core_key):
+    import json
+
+    from app.db.queries.system import set_config
+    from app.jobs import quarantine
+
+    spammer_id, _ = await register_agent(client, "Flipflop")
+    resp = await client.post(f"/api/v1/admin/quarantine/{spammer_id}", headers=auth_headers(core_key))
+    assert resp.status_code == 202
+    # A repeat POST resumes or re-runs the job; it isn't a second quarantine
+    resp = await client.post(f"/api/v1/admin/quarantine/{spammer_id}", headers=auth_headers(core_key))
+    assert resp.status_code == 202
+    db.expire_all()
+    assert await db.scalar(select(Agent.quarantine_count).where(Agent.id == spammer_id)) == 1
+
+    # While the quarantine task is live, unquarantine is refused and changes nothing
+    await set_config(db, quarantine.job_key(spammer_id), json.dumps(quarantine.new_job("quarantine")))
+    resp = await client.post(f"/api/v1/admin/unquarantine/{spammer_id}", headers=auth_headers(core_key))
+    assert resp.status_code == 409
+    assert resp.json()["job"]["action"] == "quarantine"
+    db.expire_all()
+    assert await db.scalar(select(Agent.disabled_at).where(Agent.id == spammer_id)) is not None
+
+    # And the reverse
+    await set_config(db, quarantine.job_key(spammer_id), json.dumps(quarantine.new_job("unquarantine")))
+    resp = await client.post(f"/api/v1/admin/quarantine/{spammer_id}", headers=auth_headers(core_key))
+    assert resp.status_code == 409
+    db.expire_all()
+    assert await db.scalar(select(Agent.quarantine_count).where(Agent.id == spammer_id)) == 1
+
+
+@pytest.mark.anyio
+async def test_quarantine_unknown_agent(client, core_key):
+    resp = await client.post(
+        "/api/v1/admin/quarantine/00000000-0000-0000-0000-000000000000",
+        headers=auth_headers(core_key),
+    )
+    assert resp.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_cluster_rebuild(client, db, core_key):
+    _, key = await register_agent(client, "ClusterAgent")
+    ids = []
+    for i in range(2):
+        write = await client.post(
+            "/api/v1/memory",
+            json={"content": f"Cluster rebuild {i}: " + "r" * 90, "tags": ["cluster", "test"]},
+            headers=auth_headers(key),
+        )
+        ids.append(write.json()["id"])
+
+    # Scramble the labels written at insert time; the rebuild must restore them
+    await db.execute(update(Memory).values(cluster_id=Memory.id))
+    await db.commit()
+
+    with patch("app.jobs.clusters.async_session", TestSession):
+        resp = await client.post("/api/v1/admin/clusters/rebuild", headers=auth_headers(core_key))
+    assert resp.status_code == 202
+
+    status = await client.get("/api/v1/admin/clusters/rebuild", headers=auth_headers(core_key))
+    assert status.json()["job"]["status"] == "done"
+    db.expire_all()
+    labels = {
+        await db.scalar(select(Memory.cluster_id).where(Memory.id == mid)) for mid in ids
+    }
+    assert len(labels) == 1
+
+
+@pytest.mark.anyio
+async def test_recompute_quality_and_promote_trust(client, db, core_key, monkeypatch):
+    from app.config import settings
+    from app.db.queries.memories import insert_memory
+    from app.db.queries.retrieval import log_retrievals
+    from tests.conftest import FAKE_EMBEDDING
+
+    monkeypatch.setattr(settings, "maintenance_settle_seconds", 0)
+    agent_id, _ = await register_agent(client, "Newcomer")
+    memory_ids = []
+    for i in range(5):
+        memory, _ = await insert_memory(
+            db,
+            agent_id=agent_id,
+            content=f"Promotion candidate {i}: " + "p" * 90,
+            tags=["promo", "test"],
+            source_url=None,
+            embedding=FAKE_EMBEDDING,
+            embedding_model="test",
+            quality=-1,
+        )
+        memory_ids.append(memory.id)
+    # The author finding its own memories counts for them, not for its trust
+    await log_retrievals(
+        db,
+        agent_id=agent_id,
+        events=[{"memory_id": mid, "query": "promo", "similarity": 0.9} for mid in memory_ids * 2],
+    )
+
+    with patch("app.jobs.maintenance.async_session", TestSession):
+        resp = await client.post("/api/v1/admin/recompute-quality", headers=auth_headers(core_key))
+        assert resp.status_code == 202
+        first = (await client.get("/api/v1/admin/maintenance", headers=auth_headers(core_key))).json()["job"]
+        assert first["status"] == "done"
+        assert first["events"] >= 10
+
+        db.expire_all()
+        rows = (await db.execute(
+            select(Memory.retrieval_count, Memory.quality).where(Memory.id.in_(memory_ids))
+        )).all()
+        assert all(r.retrieval_count == 2 and r.quality == 0 for r in rows)
+        assert await db.scalar(select(Agent.trust_level).where(Agent.id == agent_id)) == 0
+
+        resp = await client.post("/api/v1/admin/promote-trust", headers=auth_headers(core_key))
+        assert resp.status_code == 202
+        second = (await client.get("/api/v1/admin/maintenance", headers=auth_headers(core_key))).json()["job"]
+        assert second["events"] == 0  # watermark already past every event
+        db.expire_all()
+        agent = (await db.execute(select(Agent).where(Agent.id == agent_id))).scalar_one()
+        assert agent.trust_level == 0 and agent.retrieved_memories == 0
+
+        reader_id, _ = await register_agent(client, "Reader")
+        await log_retrievals(
+            db,
+            agent_id=reader_id,
+            events=[{"memory_id": mid, "query": "promo", "similarity": 0.9} for mid in memory_ids * 2],
+        )
+        resp = await client.post("/api/v1/admin/promote-trust", headers=auth_headers(core_key))
+        assert resp.status_code == 202
+        third = (await client.get("/api/v1/admin/maintenance", headers=auth_headers(core_key))).json()["job"]
+        assert third["events"] >= 10
+        assert third["agents_promoted"] >= 1
+
+    db.expire_all()
+    agent = (await db.execute(select(Agent).where(Agent.id == agent_id))).scalar_one()
+    assert agent.trust_level == 1
+    assert agent.retrieved_memories == 5
+
+
+@pytest.mark.anyio
+async def test_concurrent_counter_folds_count_once(client, db, monkeypatch):
+    import asyncio
+
+    from sqlalchemy import text
+
+    from app.config import settings
+    from app.db.queries.memories import insert_memory
+    from app.db.queries.retrieval import log_retrievals
+    from app.jobs import maintenance
+    from tests.conftest import FAKE_EMBEDDING
+
+    monkeypatch.setattr(settings, "maintenance_settle_seconds", 0)
+    author_id, _ = await register_agent(client, "FoldAuthor")
+    reader_id, _ = await register_agent(client, "FoldReader")
+    memory, _ = await insert_memory(
+        db, agent_id=author_id, content="Fold race check " + "f" * 90, tags=["fold", "test"],
+        source_url=None, embedding=FAKE_EMBEDDING, embedding_model="test",
+    )
+    # Earlier tests' events are folded first, so only these 100 are in play below
+    async with TestSession() as session:
+        await maintenance.refresh_counters(session)
+    await log_retrievals(
+        db, agent_id=reader_id,
+        events=[{"memory_id": memory.id, "query": "fold", "similarity": 0.9}] * 100,
+    )
+
+    # Each fold waits after reading the watermark until the other has read it too (or 0.5s):
+    # without serialization both read the same one and fold the same events
+    read_config = maintenance.get_config
+    reads = []
+    both_read = asyncio.Event()
+
+    async def get_config(session, key):
+        value = await read_config(session, key)
+        if key == maintenance.EVENTS_WATERMARK:
+            reads.append(value)
+            if len(reads) == 2:
+                both_read.set()
+            try:
+                await asyncio.wait_for(both_read.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+        return value
+
+    monkeypatch.setattr(maintenance, "get_config", get_config)
+
+    async def fold():
+        async with TestSession() as session:
+            return await maintenance.refresh_counters(session)
+
+    results = await asyncio.gather(fold(), fold())
+    assert sorted(r["events"] for r in results) == [0, 100]
+    db.expire_all()
+    assert await db.scalar(select(Memory.retrieval_count).where(Memory.id == memory.id)) == 100
+    assert await db.scalar(select(Agent.retrieved_memories).where(Agent.id == author_id)) == 1
+
+    # A run in progress (RUN_LOCK held elsewhere): the admin endpoints refuse to start another
+    _, key = await register_agent(client, "FoldCore", trust_level=2, db=db)
+    async with TestSession() as holder:
+        await holder.execute(text("SELECT pg_advisory_lock(:k)").bindparams(k=maintenance.RUN_LOCK))
+        try:
+            resp = await client.post("/api/v1/admin/promote-trust", headers=auth_headers(key))
+            assert resp.status_code == 409
+            with patch("app.jobs.maintenance.async_session", TestSession):
+                assert (await maintenance.run_maintenance(["counters"]))["status"] == "skipped"
+        finally:
+            await holder.execute(text("SELECT pg_advisory_unlock(:k)").bindparams(k=maintenance.RUN_LOCK))
+    with patch("app.jobs.maintenance.async_session", TestSession):
+        resp = await client.post("/api/v1/admin/promote-trust", headers=auth_headers(key))
+    assert resp.status_code == 202
+
+
+@pytest.mark.anyio
+async def test_export_import_roundtrip(client, db, core_key):
+    import orjson
+
+    from tests.conftest import engine
+
+    author_id, author_key = await register_agent(client, "Exporter")
+    for i in range(3):
+        resp = await client.post(
+            "/api/v1/memory",
+            json={"content": f"export roundtrip memory number {i} " + "y" * 90, "tags": ["export", "test"]},
+            headers=auth_headers(author_key),
+        )
+        assert resp.status_code == 200
+
+    with patch("app.jobs.transfer.engine", engine):
+        resp = await client.get("/api/v1/admin/export", headers=auth_headers(core_key))
+        assert resp.status_code == 200
+        lines = [orjson.loads(line) for line in resp.content.splitlines()]
+        assert lines[0]["type"] == "header"
+        memories = [line for line in lines if line["type"] == "memory"]
+        assert {line["type"] for line in lines} >= {"agent", "memory", "link"}
+        assert all(isinstance(m["embedding"], str) for m in memories)
+
+        # Re-importing the same export changes nothing
+        body = b"\n".join(orjson.dumps(line) for line in lines)
+        resp = await client.post("/api/v1/admin/import", content=body, headers=auth_headers(core_key))
+        data = resp.json()
+        assert data["memories"] == 0
+        assert data["memories_skipped"] == len(memories)
+        assert data["embedded"] == 0
+
+        # A seed file: content and tags only, assigned to one agent, embedded on import
+        seed = b"\n".join(
+            orjson.dumps({"content": f"seeded memory {i} " + "z" * 90, "tags": ["seed"]}) for i in range(2)
+        )
+        resp = await client.post(
+            "/api/v1/admin/import", params={"agent_id": author_id}, content=seed, headers=auth_headers(core_key)
+        )
+        data = resp.json()
+        assert data["memories"] == 2
+        assert data["embedded"] == 2
+        assert data["relinked"] > 0
+
+        resp = await client.post(
+            "/api/v1/admin/import", content=b'{"type": "memory", "tags": []}', headers=auth_headers(core_key)
+        )
+        assert resp.status_code == 422
+
+    seeded = (await db.execute(select(Memory).where(Memory.tags.contains(["seed"])))).scalars().all()
+    assert len(seeded) == 2
+    assert all(str(m.agent_id) == author_id for m in seeded)
+
+
+@pytest.mark.anyio
+async def test_vector_index_health_and_reindex(client, db, core_key, monkeypatch):
+    from sqlalchemy import text
+
+    from app.config import settings
+    from tests.conftest import engine
+
+    monkeypatch.setattr("app.jobs.vector_index.async_session", TestSession)
+    monkeypatch.setattr("app.jobs.vector_index.engine", engine)
+
+    # The test schema comes from create_all, which has no HNSW index
+    health = (await client.get("/api/v1/admin/vector-index", headers=auth_headers(core_key))).json()
+    assert health["exists"] is False
+    assert "missing" in health["reasons"]
+
+    resp = await client.post("/api/v1/admin/vector-index/reindex", headers=auth_headers(core_key))
+    assert resp.status_code == 202
+    assert resp.json()["started"] is True
+    job = (await client.get("/api/v1/admin/vector-index/reindex", headers=auth_headers(core_key))).json()["job"]
+    assert job["status"] == "done", job
+    try:
+        monkeypatch.setattr(settings, "vector_index_max_dead_ratio", 1.01)
+        monkeypatch.setattr(settings, "vector_index_max_stale_ratio", 1.01)
+        health = (await client.get("/api/v1/admin/vector-index", headers=auth_headers(core_key))).json()
+        assert health["exists"] and health["valid"] and health["partial"]
+        assert health["index_bytes"] > 0
+        assert health["reindex_recommended"] is False
+
+        resp = await client.post("/api/v1/admin/vector-index/reindex", headers=auth_headers(core_key))
+        assert resp.status_code == 200
+        assert resp.json()["started"] is False
+
+        # force=true rebuilds in place with REINDEX CONCURRENTLY
+        resp = await client.post("/api/v1/admin/vector-index/reindex?force=true", headers=auth_headers(core_key))
+        assert resp.status_code == 202
+        job = (await client.get("/api/v1/admin/vector-index/reindex", headers=auth_headers(core_key))).json()["job"]
+        assert job["status"] == "done" and job["reasons"] == ["forced"], job
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text("DROP INDEX IF EXISTS ix_memories_embedding"))
+
+
+@pytest.mark.anyio
+async def test_reindex_refuses_while_running(client, db, core_key, monkeypatch):
+    import json
+    from datetime import datetime, timedelta, timezone
+
+    from sqlalchemy import text
+
+    from app.db.queries.system import set_config
+    from app.jobs import vector_index
+    from tests.conftest import engine
+
+    monkeypatch.setattr("app.jobs.vector_index.async_session", TestSession)
+    monkeypatch.setattr("app.jobs.vector_index.engine", engine)
+    lock = text("SELECT pg_advisory_lock(:k)").bindparams(k=vector_index.REINDEX_LOCK)
+    unlock = text("SELECT pg_advisory_unlock(:k)").bindparams(k=vector_index.REINDEX_LOCK)
+
+    try:
+        # Another process is rebuilding: the POST is refused and a worker run skips
+        async with engine.connect() as holder:
+            await holder.execute(lock)
+            await holder.commit()
+            resp = await client.post("/api/v1/admin/vector-index/reindex?force=true", headers=auth_headers(core_key))
+            assert resp.status_code == 409
+            skipped = await vector_index.run_reindex(vector_index.new_job(["forced"]), await vector_index.health())
+            assert skipped["status"] == "skipped"
+            await holder.execute(unlock)
+            await holder.commit()
+
+        # Queued but not yet locked also counts; a long-stale "running" record doesn't
+        job = vector_index.new_job(["forced"])
+        await set_config(db, vector_index.JOB_KEY, json.dumps(job))
+        resp = await client.post("/api/v1/admin/vector-index/reindex?force=true", headers=auth_headers(core_key))
+        assert resp.status_code == 409
+        assert resp.json()["job"]["started_at"] == job["started_at"]
+
+        job["started_at"] = (datetime.now(timezone.utc) - timedelta(hours=2)).isoformat()
+        await set_config(db, vector_index.JOB_KEY, json.dumps(job))
+        resp = await client.post("/api/v1/admin/vector-index/reindex?force=true", headers=auth_headers(core_key))
+        assert resp.status_code == 202
+        job = (await client.get("/api/v1/admin/vector-index/reindex", headers=auth_headers(core_key))).json()["job"]
+        assert job["status"] == "done", job
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text("DROP INDEX IF EXISTS ix_memories_embedding"))
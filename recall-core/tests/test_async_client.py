@@ -0,0 +1,106 @@
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+
+from clients.generic.async_recall_client import AsyncRecallClient
+
+MEMORY = {"id": "m1", "short_id": "m1", "content": "redis 7 removed BRPOPLPUSH"}
+SAVED = {"id": "m2", "short_id": "m2"}
+
+
+async def _client(script: list, **kwargs) -> tuple[AsyncRecallClient, list[httpx.Request]]:
+    """Client whose transport plays `script`: responses are returned, exceptions raised, in order."""
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        step = script.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        return step
+
+    client = AsyncRecallClient("http://test/api/v1", "key", **kwargs)
+    await client._http.aclose()
+    client._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client, requests
+
+
+@pytest.fixture
+def sleep():
+    with patch("clients.generic.async_recall_client.asyncio.sleep", new_callable=AsyncMock) as s:
+        yield s
+
+
+@pytest.mark.anyio
+async def test_save_retries_only_when_nothing_was_written(sleep):
+    # 429 and connect failures never reached the handler: safe to resend
+    client, requests = await _client([
+        httpx.Response(429, headers={"Retry-After": "2"}),
+        httpx.ConnectError("refused"),
+        httpx.Response(201, json=SAVED),
+    ])
+    assert await client.save("c", ["t"]) == SAVED
+    assert len(requests) == 3
+    assert sleep.await_args_list[0].args == (2,)
+
+    # A 5xx or a dropped connection may follow a committed insert: surface it
+    client, requests = await _client([httpx.Response(503), httpx.Response(201, json=SAVED)])
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.save("c", ["t"])
+    assert len(requests) == 1
+
+    client, requests = await _client([httpx.ReadError("reset"), httpx.Response(201, json=SAVED)])
+    with pytest.raises(httpx.ReadError):
+        await client.save("c", ["t"])
+    assert len(requests) == 1
+
+
+@pytest.mark.anyio
+async def test_reads_retry_5xx_and_transport_errors(sleep):
+    client, requests = await _client([
+        httpx.Response(503),
+        httpx.ReadError("reset"),
+        httpx.Response(200, json={"results": [MEMORY]}),
+    ])
+    assert await client.search("redis") == [MEMORY]
+    assert len(requests) == 3
+
+
+@pytest.mark.anyio
+async def test_retry_after_beyond_max_wait_is_returned(sleep):
+    client, requests = await _client(
+        [httpx.Response(429, headers={"Retry-After": "3600"})], max_retry_wait=60
+    )
+    with pytest.raises(httpx.HTTPStatusError) as e:
+        await client.save("c", ["t"])
+    assert e.value.response.status_code == 429
+    assert len(requests) == 1
+    sleep.assert_not_awaited()
+
+    # Gives up after max_retries even on waits it would honor
+    client, requests = await _client(
+        [httpx.Response(429, headers={"Retry-After": "1"}) for _ in range(3)], max_retries=2
+    )
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.search("redis")
+    assert len(requests) == 3
+
+
+@pytest.mark.anyio
+async def test_get_cache_and_revalidation():
+    client, requests = await _client([
+        httpx.Response(200, json={"memory": MEMORY}, headers={"ETag": '"v1"'}),
+        httpx.Response(304, headers={"ETag": '"v1"'}),
+    ])
+    assert await client.get("m1") == MEMORY
+    assert await client.get("m1") == MEMORY
+    assert len(requests) == 1
+
+    # Expired entry: conditional GET, the 304 renews it
+    client._cache["m1"] = (0, *client._cache["m1"][1:])
+    assert await client.get("m1") == MEMORY
+    assert len(requests) == 2
+    assert requests[1].headers["If-None-Match"] == '"v1"'
+    assert await client.get("m1") == MEMORY
+    assert len(requests) == 2
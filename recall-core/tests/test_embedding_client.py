@@ -0,0 +1,144 @@
+import asyncio
+import socket
+import time
+
+import pytest
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.config import settings
+from app.embedding.client import EmbeddingUnavailable, OpenAIEmbeddingClient
+from tests.conftest import register_agent
+
+VECTOR = [0.5, 0.5]
+
+
+class FakeProvider:
+    """OpenAI-style /embeddings under /primary and /secondary, with scripted latency and failures."""
+
+    def __init__(self):
+        self.app = FastAPI()
+        self.calls = {"primary": 0, "secondary": 0}
+        # Per provider: list of (delay_seconds, status) consumed per call; `default` once empty
+        self.script: dict[str, list[tuple[float, int]]] = {"primary": [], "secondary": []}
+        self.default = {"primary": (0.0, 200), "secondary": (0.0, 200)}
+
+        @self.app.post("/{provider}/embeddings")
+        async def embeddings(provider: str, request: Request):
+            self.calls[provider] += 1
+            body = await request.json()
+            script = self.script[provider]
+            delay, status = script.pop(0) if script else self.default[provider]
+            await asyncio.sleep(delay)
+            if status != 200:
+                return JSONResponse({"error": "scripted"}, status_code=status)
+            texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            return {"data": [{"index": i, "embedding": VECTOR} for i in range(len(texts))]}
+
+
+@pytest.fixture
+async def provider(monkeypatch):
+    fake = FakeProvider()
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(fake.app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    monkeypatch.setattr(settings, "embedding_base_url", f"http://127.0.0.1:{port}/primary")
+    monkeypatch.setattr(settings, "embedding_fallback_base_url", "")
+    monkeypatch.setattr(settings, "embedding_retry_backoff", 0.01)
+    monkeypatch.setattr(settings, "openai_api_key", "sk-test")
+    fake.url = f"http://127.0.0.1:{port}"
+    yield fake
+    server.should_exit = True
+    await task
+
+
+@pytest.mark.anyio
+async def test_hedged_request_beats_slow_attempt(provider, monkeypatch):
+    monkeypatch.setattr(settings, "embedding_hedge_delay", 0.05)
+    provider.script["primary"] = [(1.0, 200)]
+    client = OpenAIEmbeddingClient()
+
+    t0 = time.perf_counter()
+    assert await client.embed("hello", budget=1.0) == VECTOR
+    assert time.perf_counter() - t0 < 0.5
+    status = client.status()["primary"]
+    assert status["hedges"] == 1 and status["hedge_wins"] == 1
+    assert provider.calls["primary"] == 2
+
+    # No budget (jobs): no hedge, the slow attempt is waited for
+    provider.script["primary"] = [(0.3, 200)]
+    assert await client.embed_many(["a", "b"]) == [VECTOR, VECTOR]
+    assert client.status()["primary"]["hedges"] == 1
+
+
+@pytest.mark.anyio
+async def test_retries_then_budget(provider, monkeypatch):
+    monkeypatch.setattr(settings, "embedding_hedge", False)
+    provider.script["primary"] = [(0, 503), (0, 429)]
+    client = OpenAIEmbeddingClient()
+    assert await client.embed("hello", budget=1.0) == VECTOR
+    assert provider.calls["primary"] == 3
+    assert client.status()["primary"]["retries"] == 2
+
+    # A provider slower than the budget costs the caller the budget, not the provider's latency
+    provider.default["primary"] = (1.0, 200)
+    t0 = time.perf_counter()
+    with pytest.raises(EmbeddingUnavailable):
+        await client.embed("hello", budget=0.2)
+    assert time.perf_counter() - t0 < 0.5
+
+
+@pytest.mark.anyio
+async def test_breaker_fails_over_to_secondary(provider, monkeypatch):
+    monkeypatch.setattr(settings, "embedding_hedge", False)
+    monkeypatch.setattr(settings, "embedding_retries", 0)
+    monkeypatch.setattr(settings, "embedding_breaker_failures", 2)
+    monkeypatch.setattr(settings, "embedding_breaker_reset_seconds", 0.3)
+    monkeypatch.setattr(settings, "embedding_fallback_base_url", f"{provider.url}/secondary")
+    provider.default["primary"] = (0, 500)
+    client = OpenAIEmbeddingClient()
+
+    # Each failing primary call falls through to the secondary within the same budget
+    for _ in range(2):
+        assert await client.embed("hello", budget=1.0) == VECTOR
+    assert client.status()["primary"]["state"] == "open"
+    # Open: the primary isn't even tried
+    assert await client.embed("hello", budget=1.0) == VECTOR
+    assert provider.calls == {"primary": 2, "secondary": 3}
+
+    # Primary healthy again: after the reset interval one probe closes its breaker
+    provider.default["primary"] = (0, 200)
+    await asyncio.sleep(0.35)
+    assert await client.embed("hello", budget=1.0) == VECTOR
+    assert client.status()["primary"]["state"] == "closed"
+    assert provider.calls == {"primary": 3, "secondary": 3}
+
+    # Without a secondary an open breaker fails fast
+    monkeypatch.setattr(settings, "embedding_fallback_base_url", "")
+    provider.default["primary"] = (0, 500)
+    client = OpenAIEmbeddingClient()
+    for _ in range(2):
+        with pytest.raises(EmbeddingUnavailable):
+            await client.embed("hello", budget=1.0)
+    calls = provider.calls["primary"]
+    with pytest.raises(EmbeddingUnavailable, match="circuit open"):
+        await client.embed("hello", budget=1.0)
+    assert provider.calls["primary"] == calls
+
+
+@pytest.mark.anyio
+async def test_search_answers_503_when_embedding_unavailable(client, monkeypatch):
+    from unittest.mock import AsyncMock
+
+    from app.embedding.client import embedding_client
+
+    monkeypatch.setattr(embedding_client, "embed", AsyncMock(side_effect=EmbeddingUnavailable("down")))
+    headers = (await register_agent(client, "EmbedDown")).headers
+    resp = await client.get("/api/v1/memory/search?q=anything", headers=headers)
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"]
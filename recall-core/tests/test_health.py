@@ -8,3 +8,38 @@ async def test_health(client):
     data = resp.json()
     assert data["status"] == "ok"
     assert data["protocol_version"] == "1.0.0"
+
+
+@pytest.mark.anyio
+async def test_health_warming_then_ready(client, monkeypatch):
+    from unittest.mock import AsyncMock
+
+    from app import warmup
+    from app.config import settings
+    from app.db import engine as db_engine
+    from app.embedding.client import embedding_client
+    from tests.conftest import TestSession, engine
+
+    monkeypatch.setattr(warmup.state, "ready", False)
+    resp = await client.get("/api/v1/health")
+    assert resp.status_code == 503
+    assert resp.json()["status"] == "warming"
+
+    monkeypatch.setattr(db_engine, "engine", engine)
+    monkeypatch.setattr(db_engine, "async_session", TestSession)
+    monkeypatch.setattr(embedding_client, "warm_up", AsyncMock())
+    monkeypatch.setattr(settings, "warmup_prewarm_hnsw", True)
+    await warmup.run_warmup()
+
+    resp = await client.get("/api/v1/health")
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["ready"] is True
+    steps = data["warmup"]["steps"]
+    for name in ("db", "redis", "embedding", "searches"):
+        assert steps[name]["ok"], steps[name]
+    assert steps["db"]["connections"] >= 1
+    assert steps["searches"]["searches"] == settings.warmup_searches
+    # Recorded either way: pg_prewarm is an optional extension
+    assert "prewarm" in steps
+    embedding_client.warm_up.assert_awaited_once()
@@ -1,13 +1,6 @@
 import pytest
 
-
-async def _register_and_get_key(client):
-    resp = await client.post("/api/v1/agents/register", json={"name": "MemAgent"})
-    return resp.json()["api_key"]
-
-
-def _auth(key):
-    return {"Authorization": f"Bearer {key}"}
+from tests.conftest import auth_headers, register_agent
 
 
 SAMPLE_CONTENT = "x" * 100  # min 80 chars
@@ -15,14 +8,14 @@ SAMPLE_CONTENT = "x" * 100  # min 80 chars
 
 @pytest.mark.anyio
 async def test_write_memory(client):
-    key = await _register_and_get_key(client)
+    _, key = await register_agent(client, "MemAgent")
     resp = await client.post(
         "/api/v1/memory",
         json={
             "content": SAMPLE_CONTENT,
             "tags": ["test", "unit"],
         },
-        headers=_auth(key),
+        headers=auth_headers(key),
     )
     assert resp.status_code == 200
     data = resp.json()
@@ -32,40 +25,40 @@ async def test_write_memory(client):
 
 @pytest.mark.anyio
 async def test_write_too_short(client):
-    key = await _register_and_get_key(client)
+    _, key = await register_agent(client, "MemAgent")
     resp = await client.post(
         "/api/v1/memory",
         json={"content": "short", "tags": ["a", "b"]},
-        headers=_auth(key),
+        headers=auth_headers(key),
     )
     assert resp.status_code == 422
 
 
 @pytest.mark.anyio
 async def test_write_too_few_tags(client):
-    key = await _register_and_get_key(client)
+    _, key = await register_agent(client, "MemAgent")
     resp = await client.post(
         "/api/v1/memory",
         json={"content": SAMPLE_CONTENT, "tags": ["only_one"]},
-        headers=_auth(key),
+        headers=auth_headers(key),
     )
     assert resp.status_code == 422
 
 
 @pytest.mark.anyio
 async def test_search_memories(client):
-    key = await _register_and_get_key(client)
+    _, key = await register_agent(client, "MemAgent")
     # Write one
     await client.post(
         "/api/v1/memory",
         json={"content": SAMPLE_CONTENT, "tags": ["search", "test"]},
-        headers=_auth(key),
+        headers=auth_headers(key),
     )
     # Search
     resp = await client.get(
         "/api/v1/memory/search",
         params={"q": "test query"},
-        headers=_auth(key),
+        headers=auth_headers(key),
     )
     assert resp.status_code == 200
     data = resp.json()
@@ -75,15 +68,15 @@ async def test_search_memories(client):
 
 @pytest.mark.anyio
 async def test_get_memory_by_short_id(client):
-    key = await _register_and_get_key(client)
+    _, key = await register_agent(client, "MemAgent")
     write_resp = await client.post(
         "/api/v1/memory",
         json={"content": SAMPLE_CONTENT, "tags": ["get", "test"]},
-        headers=_auth(key),
+        headers=auth_headers(key),
     )
     short_id = write_resp.json()["short_id"]
 
-    resp = await client.get(f"/api/v1/memory/{short_id}", headers=_auth(key))
+    resp = await client.get(f"/api/v1/memory/{short_id}", headers=auth_headers(key))
     assert resp.status_code == 200
     data = resp.json()
     assert data["memory"]["short_id"] == short_id
@@ -91,8 +84,8 @@ async def test_get_memory_by_short_id(client):
 
 @pytest.mark.anyio
 async def test_get_memory_not_found(client):
-    key = await _register_and_get_key(client)
-    resp = await client.get("/api/v1/memory/RCL-ZZZZZZZZ", headers=_auth(key))
+    _, key = await register_agent(client, "MemAgent")
+    resp = await client.get("/api/v1/memory/RCL-ZZZZZZZZ", headers=auth_headers(key))
     assert resp.status_code == 404
 
 
@@ -103,3 +96,424 @@ async def test_unauthorized(client):
         json={"content": SAMPLE_CONTENT, "tags": ["a", "b"]},
     )
     assert resp.status_code == 401
+
+
+@pytest.mark.anyio
+async def test_search_hybrid_mode(client):
+    _, key = await register_agent(client, "MemAgent")
+    await client.post(
+        "/api/v1/memory",
+        json={
+            "content": "Build failed with ERR_OSSL_EVP_UNSUPPORTED after upgrading Node to v17. " + "y" * 40,
+            "tags": ["node", "openssl"],
+        },
+        headers=auth_headers(key),
+    )
+    resp = await client.get(
+        "/api/v1/memory/search",
+        params={"q": "ERR_OSSL_EVP_UNSUPPORTED node", "mode": "hybrid"},
+        headers=auth_headers(key),
+    )
+    assert resp.status_code == 200
+    assert resp.json()["success"] is True
+
+
+@pytest.mark.anyio
+async def test_search_quoted_query_skips_embedding(client):
+    from app.embedding.client import embedding_client
+
+    _, key = await register_agent(client, "MemAgent")
+    embedding_client.embed.reset_mock()
+    resp = await client.get(
+        "/api/v1/memory/search",
+        params={"q": '"ERR_OSSL_EVP_UNSUPPORTED"', "mode": "hybrid"},
+        headers=auth_headers(key),
+    )
+    assert resp.status_code == 200
+    embedding_client.embed.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_search_invalid_mode(client):
+    _, key = await register_agent(client, "MemAgent")
+    resp = await client.get(
+        "/api/v1/memory/search",
+        params={"q": "anything", "mode": "fuzzy"},
+        headers=auth_headers(key),
+    )
+    assert resp.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_search_batch(client):
+    _, key = await register_agent(client, "MemAgent")
+    await client.post(
+        "/api/v1/memory",
+        json={"content": SAMPLE_CONTENT, "tags": ["batch", "test"]},
+        headers=auth_headers(key),
+    )
+    resp = await client.post(
+        "/api/v1/memory/search/batch",
+        json={"queries": ["first query", "second query"], "limit": 5, "merge": True},
+        headers=auth_headers(key),
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert [s["query"] for s in data["searches"]] == ["first query", "second query"]
+    merged_ids = [m["id"] for m in data["merged"]]
+    assert len(merged_ids) == len(set(merged_ids))
+
+
+@pytest.mark.anyio
+async def test_search_batch_too_many_queries(client):
+    _, key = await register_agent(client, "MemAgent")
+    resp = await client.post(
+        "/api/v1/memory/search/batch",
+        json={"queries": [f"query {i}" for i in range(100)]},
+        headers=auth_headers(key),
+    )
+    assert resp.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_search_requires_query_or_cursor(client):
+    _, key = await register_agent(client, "MemAgent")
+    resp = await client.get("/api/v1/memory/search", headers=auth_headers(key))
+    assert resp.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_search_invalid_cursor(client):
+    _, key = await register_agent(client, "MemAgent")
+    resp = await client.get(
+        "/api/v1/memory/search",
+        params={"cursor": "not-a-cursor"},
+        headers=auth_headers(key),
+    )
+    assert resp.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_search_cursor_pages_skip_embed_and_ann(client, monkeypatch):
+    import uuid
+
+    from app.api import memory_read
+    from app.embedding.client import embedding_client
+
+    _, key = await register_agent(client, "MemAgent")
+    for i in range(3):
+        await client.post(
+            "/api/v1/memory",
+            json={"content": f"Cursor paging {i} " + "p" * 90, "tags": ["cursor", "test"]},
+            headers=auth_headers(key),
+        )
+    depths = []
+    run_search = memory_read._run_search
+
+    async def spy(db, q, limit, *args, **kwargs):
+        depths.append(limit)
+        return await run_search(db, q, limit, *args, **kwargs)
+
+    monkeypatch.setattr(memory_read, "_run_search", spy)
+    q = f"cursor paging {uuid.uuid4().hex}"
+    first = await client.get("/api/v1/memory/search", params={"q": q, "limit": 1}, headers=auth_headers(key))
+    assert first.json()["next_cursor"] is not None
+    # The candidate list is ranked once, by the first page
+    assert depths == [memory_read.settings.search_cursor_candidates]
+
+    # Another search for the same q stores its own list; it doesn't replace this one
+    other = await client.get("/api/v1/memory/search", params={"q": q, "limit": 2}, headers=auth_headers(key))
+    assert other.json()["next_cursor"] != first.json()["next_cursor"]
+
+    embedding_client.embed.reset_mock()
+    depths.clear()
+    second = await client.get(
+        "/api/v1/memory/search", params={"cursor": first.json()["next_cursor"], "limit": 1}, headers=auth_headers(key)
+    )
+    third = await client.get(
+        "/api/v1/memory/search", params={"cursor": second.json()["next_cursor"], "limit": 1}, headers=auth_headers(key)
+    )
+    assert depths == []
+    embedding_client.embed.assert_not_called()
+    pages = [r.json()["results"][0]["id"] for r in (first, second, third)]
+    assert len(set(pages)) == 3
+
+
+@pytest.mark.anyio
+async def test_get_memory_etag_not_modified(client):
+    _, key = await register_agent(client, "MemAgent")
+    write_resp = await client.post(
+        "/api/v1/memory",
+        json={"content": SAMPLE_CONTENT, "tags": ["etag", "test"]},
+        headers=auth_headers(key),
+    )
+    short_id = write_resp.json()["short_id"]
+
+    first = await client.get(f"/api/v1/memory/{short_id}", headers=auth_headers(key))
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    again = await client.get(
+        f"/api/v1/memory/{short_id}",
+        headers={**auth_headers(key), "If-None-Match": etag},
+    )
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+
+
+@pytest.mark.anyio
+async def test_search_cache_hit_matches_miss(client):
+    _, key = await register_agent(client, "MemAgent")
+    await client.post(
+        "/api/v1/memory",
+        json={"content": SAMPLE_CONTENT, "tags": ["cache", "test"]},
+        headers=auth_headers(key),
+    )
+    params = {"q": "cache hit body", "limit": 3}
+    miss = await client.get("/api/v1/memory/search", params=params, headers=auth_headers(key))
+    hit = await client.get("/api/v1/memory/search", params=params, headers=auth_headers(key))
+    assert miss.status_code == hit.status_code == 200
+    assert miss.json() == hit.json()
+    assert miss.json()["results"][0]["created_at"].endswith("Z")
+
+
+@pytest.mark.anyio
+async def test_write_exact_duplicate_skips_embedding(client, db):
+    from sqlalchemy import select
+
+    from app.db.models import Memory
+    from app.embedding.client import embedding_client
+
+    _, key = await register_agent(client, "MemAgent")
+    content = "Exact duplicate fast path check: the same content twice.   " + "z" * 60
+    first = await client.post(
+        "/api/v1/memory",
+        json={"content": content, "tags": ["dup", "test"]},
+        headers=auth_headers(key),
+    )
+    assert first.status_code == 200
+
+    embedding_client.embed.reset_mock()
+    variant = "  " + content.replace("   ", "\n") + "\n"
+    second = await client.post(
+        "/api/v1/memory",
+        json={"content": variant, "tags": ["dup", "test"]},
+        headers=auth_headers(key),
+    )
+    assert second.status_code == 200
+    embedding_client.embed.assert_not_called()
+    duplicate_of = await db.scalar(
+        select(Memory.duplicate_of).where(Memory.id == second.json()["id"])
+    )
+    assert str(duplicate_of) == first.json()["id"]
+
+
+@pytest.mark.anyio
+async def test_write_near_duplicate_trust0(client, db, monkeypatch):
+    from sqlalchemy import select
+
+    from app.config import Settings, settings
+    from app.db.models import Memory
+    from app.embedding.client import embedding_client
+
+    _, key = await register_agent(client, "MemAgent")
+    monkeypatch.setattr(settings, "near_duplicate_policy", "link")
+    content = (
+        "Near duplicate check: celery workers silently stop consuming after the broker restarts; "
+        "fix by enabling heartbeats and setting broker_connection_retry_on_startup."
+    )
+    first = await client.post(
+        "/api/v1/memory", json={"content": content, "tags": ["dup", "test"]}, headers=auth_headers(key)
+    )
+    assert first.status_code == 200
+
+    embedding_client.embed.reset_mock()
+    variant = content.upper().replace(";", " --")
+    second = await client.post(
+        "/api/v1/memory", json={"content": variant, "tags": ["dup", "test"]}, headers=auth_headers(key)
+    )
+    assert second.status_code == 200
+    # Linked to the original, but embedded from its own text
+    embedding_client.embed.assert_called_once()
+    assert embedding_client.embed.call_args.args[0] == variant
+    duplicate_of = await db.scalar(
+        select(Memory.duplicate_of).where(Memory.id == second.json()["id"])
+    )
+    assert str(duplicate_of) == first.json()["id"]
+
+    # Default: rejected before the embed call
+    monkeypatch.setattr(settings, "near_duplicate_policy", Settings.model_fields["near_duplicate_policy"].default)
+    embedding_client.embed.reset_mock()
+    third = await client.post(
+        "/api/v1/memory",
+        json={"content": content + " ok", "tags": ["dup", "test"]},
+        headers=auth_headers(key),
+    )
+    assert third.status_code == 409
+    assert third.json()["duplicate_of"] == first.json()["short_id"]
+    embedding_client.embed.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_near_duplicate_behind_busy_band(client, db):
+    from sqlalchemy import update
+
+    from app.db.models import Memory
+    from app.db.queries.memories import find_near_duplicate, insert_memory
+    from app.dedup import simhash, simhash_bands
+    from tests.conftest import FAKE_EMBEDDING
+
+    agent_id, _ = await register_agent(client, "BandWriter")
+    content = "Busy band check: pgbouncer in transaction mode breaks prepared statements; " + "b" * 60
+    target = simhash(content)
+
+    def fingerprint(flip: int) -> dict:
+        value = (target ^ flip) & ((1 << 64) - 1)
+        value = value - (1 << 64) if value >= 1 << 63 else value
+        return {"simhash": value, "simhash_bands": simhash_bands(value)}
+
+    # 60 older memories share the low band but sit 8 bits away; the match is the newest.
+    # Their own vector keeps them out of other tests' search results
+    vec = [0.0] * len(FAKE_EMBEDDING)
+    vec[7] = 1.0
+    rows = []
+    for i in range(61):
+        memory, _ = await insert_memory(
+            db, agent_id=agent_id, content=f"Busy band filler {i} " + "f" * 80, tags=["band", "test"],
+            source_url=None, embedding=vec, embedding_model="test",
+        )
+        rows.append(memory.id)
+    for memory_id in rows[:-1]:
+        await db.execute(update(Memory).where(Memory.id == memory_id).values(**fingerprint(0xFF << 16)))
+    await db.execute(update(Memory).where(Memory.id == rows[-1]).values(**fingerprint(0b101 << 48)))
+    await db.commit()
+
+    near = await find_near_duplicate(db, content)
+    assert near is not None and near.id == rows[-1]
+
+
+@pytest.mark.anyio
+async def test_search_collapse_duplicates(client, monkeypatch):
+    from unittest.mock import AsyncMock
+
+    from app.embedding.client import embedding_client
+    from tests.conftest import FAKE_EMBEDDING
+
+    # A vector orthogonal to the shared fake embedding: memories left by other tests
+    # (some never clustered, e.g. imported ones) stay out of these neighbour lists
+    monkeypatch.setattr(embedding_client, "embed", AsyncMock(return_value=[0.01, -0.01] * (len(FAKE_EMBEDDING) // 2)))
+    _, key = await register_agent(client, "MemAgent")
+    for i in range(3):
+        resp = await client.post(
+            "/api/v1/memory",
+            json={"content": f"Collapse check copy {i}: " + "c" * 90, "tags": ["collapse", "test"]},
+            headers=auth_headers(key),
+        )
+        assert resp.status_code == 200
+
+    # The same embedding makes every copy a duplicate of every other: one cluster
+    full = await client.get(
+        "/api/v1/memory/search", params={"q": "collapse check", "limit": 10}, headers=auth_headers(key)
+    )
+    collapsed = await client.get(
+        "/api/v1/memory/search",
+        params={"q": "collapse check", "limit": 10, "collapse": "true"},
+        headers=auth_headers(key),
+    )
+    assert collapsed.status_code == 200
+    assert len(full.json()["results"]) >= 3
+    results = collapsed.json()["results"]
+    assert len(results) == 1
+    assert results[0]["cluster_size"] >= 3
+    assert "cluster_size" not in full.json()["results"][0]
+
+
+@pytest.mark.anyio
+async def test_memory_graph(client):
+    _, key = await register_agent(client, "MemAgent")
+    for i in range(2):
+        await client.post(
+            "/api/v1/memory",
+            json={"content": f"Graph walk node {i}: " + "g" * 90, "tags": ["graph", "test"]},
+            headers=auth_headers(key),
+        )
+    write = await client.post(
+        "/api/v1/memory",
+        json={"content": "Graph walk root: " + "g" * 90, "tags": ["graph", "test"]},
+        headers=auth_headers(key),
+    )
+    root = write.json()["id"]
+    linked = {s["id"] for s in write.json()["similar"]}
+
+    resp = await client.get(
+        f"/api/v1/memory/{root}/graph", params={"depth": 1, "max_nodes": 200}, headers=auth_headers(key)
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    depths = {n["id"]: n["depth"] for n in data["nodes"]}
+    assert depths[root] == 0
+    assert linked and all(depths[mid] == 1 for mid in linked)
+    assert all(e["source"] in depths and e["target"] in depths for e in data["edges"])
+
+    small = await client.get(
+        f"/api/v1/memory/{root}/graph", params={"depth": 2, "max_nodes": 2}, headers=auth_headers(key)
+    )
+    assert len(small.json()["nodes"]) == 2
+    assert small.json()["truncated"] is True
+
+    too_deep = await client.get(f"/api/v1/memory/{root}/graph", params={"depth": 9}, headers=auth_headers(key))
+    assert too_deep.status_code == 422
+    missing = await client.get("/api/v1/memory/RCL-NOTEXIST/graph", headers=auth_headers(key))
+    assert missing.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_insert_links_and_merges_clusters(client, db):
+    import math
+
+    from sqlalchemy import select
+
+    from app.db.models import Memory, MemoryLink
+    from app.db.queries.memories import insert_memory
+    from tests.conftest import FAKE_EMBEDDING
+
+    agent_id, _ = await register_agent(client, "ClusterWriter")
+
+    def at(degrees: float, axis: int = 0) -> list[float]:
+        # Unit vectors in a plane the shared fake embedding is nearly orthogonal to
+        vec = [0.0] * len(FAKE_EMBEDDING)
+        vec[axis], vec[axis + 1] = math.cos(math.radians(degrees)), math.sin(math.radians(degrees))
+        return vec
+
+    async def write(vec, duplicate_of=None):
+        return await insert_memory(
+            db, agent_id=agent_id, content="Cluster write " + "w" * 90, tags=["cluster", "write"],
+            source_url=None, embedding=vec, embedding_model="test", duplicate_of=duplicate_of,
+        )
+
+    a, similar = await write(at(0))
+    assert similar == [] and a.cluster_id == a.id and a.created_at is not None
+    # cos 30° = 0.87: linked, but not a duplicate, so its own cluster
+    b, similar = await write(at(30))
+    assert [(s["id"], s["relation"]) for s in similar] == [(a.id, "similar")]
+    assert b.cluster_id == b.id
+    # cos 15° = 0.97 to both, under the auto threshold: unions both clusters under the oldest
+    c, similar = await write(at(15))
+    assert {s["id"] for s in similar} == {a.id, b.id}
+    assert {s["relation"] for s in similar} == {"duplicate_candidate"}
+    assert c.duplicate_of is None and c.cluster_id == a.id
+    # Nearly identical to a: auto duplicate of the closest
+    d, similar = await write(at(0.5))
+    assert d.duplicate_of == a.id and similar[0]["id"] == a.id
+    # An explicit duplicate_of outside the neighbours still joins its cluster
+    e, similar = await write(at(0, axis=2), duplicate_of=b.id)
+    assert similar == [] and e.duplicate_of == b.id and e.cluster_id == a.id
+
+    labels = (await db.execute(
+        select(Memory.id, Memory.cluster_id).where(Memory.id.in_([a.id, b.id, c.id, d.id, e.id]))
+    )).fetchall()
+    assert {cluster for _, cluster in labels} == {a.id}
+    links = (await db.execute(
+        select(MemoryLink.related_id, MemoryLink.relation).where(MemoryLink.memory_id == c.id)
+    )).fetchall()
+    assert sorted(links) == sorted([(a.id, "duplicate_candidate"), (b.id, "duplicate_candidate")])
@@ -0,0 +1,132 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.db.partitions import clear_partition_cache
+from app.db.queries.memories import vector_search
+from app.jobs import partition
+from tests.conftest import DATABASE_URL, FAKE_EMBEDDING, auth_headers, engine, register_agent
+
+
+@pytest.mark.anyio
+async def test_partitioned_roundtrip(client, db, monkeypatch):
+    monkeypatch.setattr(partition, "engine", engine)
+    _, key = await register_agent(client, "PartitionAgent")
+    before = await client.post(
+        "/api/v1/memory",
+        json={"content": "written before partitioning " + "b" * 80, "tags": ["partition", "test"]},
+        headers=auth_headers(key),
+    )
+    await db.rollback()  # the conversion takes an exclusive lock on memories
+
+    try:
+        stats = await partition.convert(2)
+        assert stats["rows"] >= 1
+        assert (await partition.status())["partitioned"] is True
+
+        after = await client.post(
+            "/api/v1/memory",
+            json={"content": "written after partitioning " + "a" * 80, "tags": ["partition", "test"]},
+            headers=auth_headers(key),
+        )
+        assert after.status_code == 200
+        assert after.json()["similar"]  # dedup query ran over both partitions
+
+        # Fanned-out search sees rows copied from the old table and new ones
+        resp = await client.get(
+            "/api/v1/memory/search", params={"q": "partitioning", "limit": 50}, headers=auth_headers(key)
+        )
+        ids = {r["id"] for r in resp.json()["results"]}
+        assert {before.json()["id"], after.json()["id"]} <= ids
+
+        # One pooled connection: the fan-out must hand the session's back before checking out
+        tiny = create_async_engine(DATABASE_URL, pool_size=1, max_overflow=0, pool_timeout=2)
+        clear_partition_cache()
+        try:
+            async with AsyncSession(tiny) as session:
+                rows = await vector_search(session, embedding=FAKE_EMBEDDING, limit=50)
+            assert after.json()["id"] in {str(r["id"]) for r in rows}
+        finally:
+            await tiny.dispose()
+
+        resp = await client.get(f"/api/v1/memory/{after.json()['short_id']}", headers=auth_headers(key))
+        assert resp.status_code == 200
+        assert await db.scalar(text("SELECT count(*) FROM memory_short_ids")) == await db.scalar(
+            text("SELECT count(*) FROM memories")
+        )
+        await db.rollback()
+    finally:
+        await partition.convert(0)
+        clear_partition_cache()
+
+    assert (await partition.status())["partitioned"] is False
+    assert await db.scalar(text("SELECT to_regclass('memory_short_ids')")) is None
+
+
+@pytest.mark.anyio
+async def test_swap_catches_up_on_late_writes(client, db, monkeypatch):
+    from app.db.queries.memories import insert_memory
+
+    monkeypatch.setattr(partition, "engine", engine)
+    agent_id, _ = await register_agent(client, "LateWriter")
+    vec = [0.0] * len(FAKE_EMBEDDING)
+    vec[11] = 1.0
+
+    async def write(content):
+        memory, _ = await insert_memory(
+            db, agent_id=agent_id, content=content + " " + "l" * 80, tags=["late", "test"],
+            source_url=None, embedding=vec, embedding_model="test",
+        )
+        return memory.id
+
+    existing = await write("copied, then quarantined before the swap")
+    await db.rollback()
+    build_indexes = partition._build_indexes
+    late = {}
+
+    async def build_then_write(*args):
+        await build_indexes(*args)
+        # Writes the flag doesn't stop: a background job's update and a write after a heartbeat
+        async with engine.begin() as conn:
+            await conn.execute(text("UPDATE memories SET quality = -2 WHERE id = :id").bindparams(id=existing))
+        late["id"] = await write("inserted after the copy finished")
+        await db.rollback()
+
+    monkeypatch.setattr(partition, "_build_indexes", build_then_write)
+    try:
+        stats = await partition.convert(2)
+        assert await db.scalar(text("SELECT quality FROM memories WHERE id = :id").bindparams(id=existing)) == -2
+        assert await db.scalar(text("SELECT count(*) FROM memories WHERE id = :id").bindparams(id=late["id"])) == 1
+        assert stats["caught_up"] >= 2
+        await db.rollback()
+    finally:
+        monkeypatch.setattr(partition, "_build_indexes", build_indexes)
+        await partition.convert(0)
+        clear_partition_cache()
+
+
+@pytest.mark.anyio
+async def test_swap_aborts_on_row_count_mismatch(client, db, monkeypatch):
+    monkeypatch.setattr(partition, "engine", engine)
+    agent_id, _ = await register_agent(client, "LateDeleter")
+    async with engine.begin() as conn:
+        doomed = (await conn.execute(text(
+            "INSERT INTO memories (id, cluster_id, agent_id, short_id, content, content_hash, tags, embedding,"
+            " embedding_model, quality)"
+            " SELECT id, id, CAST(:agent AS uuid), 'RCL-LATEDEL1', 'deleted during the conversion', 'x',"
+            " ARRAY['late'], embedding, 'test', 0 FROM (SELECT gen_random_uuid() AS id, embedding"
+            " FROM memories LIMIT 1) s RETURNING id"
+        ).bindparams(agent=agent_id))).scalar()
+    build_indexes = partition._build_indexes
+
+    async def build_then_delete(*args):
+        await build_indexes(*args)
+        async with engine.begin() as conn:
+            await conn.execute(text("DELETE FROM memories WHERE id = :id").bindparams(id=doomed))
+
+    monkeypatch.setattr(partition, "_build_indexes", build_then_delete)
+    await db.rollback()  # dropping the new table takes a lock on agents (its foreign key)
+    with pytest.raises(RuntimeError, match="swap aborted"):
+        await partition.convert(2)
+    assert (await partition.status())["partitioned"] is False
+    assert await db.scalar(text(f"SELECT to_regclass('{partition.NEW}')")) is None
@@ -0,0 +1,72 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.auth.middleware import get_db, get_read_db
+from app.db.engine import TimedPool
+from app.embedding.client import embedding_client
+from app.main import app
+from tests.conftest import DATABASE_URL, FAKE_EMBEDDING, register_agent
+
+EMBED_SECONDS = 0.5
+
+
+def _content() -> str:
+    # Unrelated words per memory so neither duplicate check short-circuits the embed call
+    return " ".join(uuid.uuid4().hex for _ in range(12))
+
+
+@pytest.fixture
+async def small_pool():
+    """Two connections, no overflow: a request holding one across an embed call starves the rest."""
+    engine = create_async_engine(DATABASE_URL, pool_size=2, max_overflow=0, pool_timeout=5, poolclass=TimedPool)
+    session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def own_session():
+        async with session() as s:
+            yield s
+
+    app.dependency_overrides[get_db] = own_session
+    app.dependency_overrides[get_read_db] = own_session
+    yield engine.pool
+    await engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_slow_embeds_do_not_hold_connections(client, small_pool, monkeypatch):
+    headers = (await register_agent(client, "PoolAgent")).headers
+    resp = await client.post("/api/v1/memory", json={"content": _content(), "tags": ["pool", "load"]}, headers=headers)
+    assert resp.status_code == 200
+    memory_id = resp.json()["id"]
+
+    async def slow_embed(text, budget=None):
+        await asyncio.sleep(EMBED_SECONDS)
+        return FAKE_EMBEDDING
+
+    monkeypatch.setattr(embedding_client, "embed", slow_embed)
+
+    async def write():
+        return await client.post("/api/v1/memory", json={"content": _content(), "tags": ["pool", "load"]}, headers=headers)
+
+    async def search(i: int):
+        return await client.get(f"/api/v1/memory/search?q=pool+{i}", headers=headers)
+
+    async def get():
+        # Lands while every write and search is waiting on the provider
+        await asyncio.sleep(0.1)
+        t0 = time.perf_counter()
+        resp = await client.get(f"/api/v1/memory/{memory_id}", headers=headers)
+        return resp, time.perf_counter() - t0
+
+    results = await asyncio.gather(*(write() for _ in range(6)), *(search(i) for i in range(6)), get())
+    (got, elapsed), others = results[-1], results[:-1]
+    assert [r.status_code for r in others] == [200] * 12
+    assert got.status_code == 200
+    assert elapsed < EMBED_SECONDS / 2
+
+    stats = small_pool.stats()
+    assert stats["timeouts"] == 0 and stats["checked_out"] == 0
+    assert stats["checkouts"] > 12
@@ -0,0 +1,62 @@
+import pytest
+
+from app import profiling
+from app.config import settings
+from app.db import engine as db_engine
+from tests.conftest import TestSession, register_agent
+
+pytest.importorskip("pyinstrument")
+
+
+@pytest.fixture(autouse=True)
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "profiling_dir", str(tmp_path))
+    monkeypatch.setattr(db_engine, "async_session", TestSession)
+    monkeypatch.setattr(profiling, "sample_rate", profiling._Rate())
+    return tmp_path
+
+
+@pytest.mark.anyio
+async def test_profile_header_from_core_agent(client, db):
+    core = (await register_agent(client, "ProfCore", trust_level=2, db=db)).headers
+    plain = (await register_agent(client, "ProfPlain")).headers
+
+    resp = await client.get("/api/v1/memory/search?q=profile+me", headers={**plain, "X-Recall-Profile": "1"})
+    assert resp.status_code == 200
+    assert "X-Recall-Profile-Id" not in resp.headers
+
+    resp = await client.get("/api/v1/memory/search?q=profile+me", headers={**core, "X-Recall-Profile": "1"})
+    assert resp.status_code == 200
+    profile_id = resp.headers["X-Recall-Profile-Id"]
+
+    listed = (await client.get("/api/v1/admin/profiling", headers=core)).json()
+    assert listed["available"] and listed["sample_rate"] == 0
+    [meta] = listed["profiles"]
+    assert meta["id"] == profile_id and meta["path"] == "/api/v1/memory/search"
+    assert meta["status"] == 200 and meta["trigger"] == "header"
+
+    resp = await client.get(f"/api/v1/admin/profiling/{profile_id}", headers=core)
+    assert resp.status_code == 200
+    assert "speedscope" in resp.json()["$schema"]
+    assert (await client.get(f"/api/v1/admin/profiling/{profile_id}", headers=plain)).status_code == 403
+    assert (await client.get("/api/v1/admin/profiling/..%2Fetc", headers=core)).status_code == 404
+
+
+@pytest.mark.anyio
+async def test_sampling_rate_from_system_config(client, db, monkeypatch):
+    monkeypatch.setattr(settings, "profiling_keep", 2)
+    core = (await register_agent(client, "RateCore", trust_level=2, db=db)).headers
+    plain = (await register_agent(client, "RatePlain")).headers
+    assert (await client.put("/api/v1/admin/profiling?sample_rate=1", headers=plain)).status_code == 403
+
+    assert (await client.put("/api/v1/admin/profiling?sample_rate=1", headers=core)).status_code == 200
+    for _ in range(3):
+        await client.get("/api/v1/health")
+    assert (await client.put("/api/v1/admin/profiling?sample_rate=0", headers=core)).status_code == 200
+
+    # Another worker reads the rate from system_config
+    rate = profiling._Rate()
+    assert await rate.get() == 0.0
+    profiles = profiling.list_profiles()
+    assert len(profiles) == 2
+    assert {p["trigger"] for p in profiles} == {"sampled"}
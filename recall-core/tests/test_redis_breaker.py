@@ -0,0 +1,110 @@
+import asyncio
+import shutil
+import socket
+import subprocess
+import time
+
+import pytest
+
+from app.api import memory_read
+from app.auth.middleware import get_db, get_read_db
+from app.circuit import CLOSED, OPEN, CircuitBreaker
+from app.config import settings
+from app.main import app
+from app.ratelimit import breaker as breaker_module
+from app.ratelimit import limiter
+from app.ratelimit.limiter import check_rate_limit
+from app.ratelimit.local import LocalLimiter
+from tests.conftest import TestSession, register_agent
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_redis(port: int) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        ["redis-server", "--port", str(port), "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL,
+    )
+    for _ in range(50):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("redis-server did not start")
+
+
+@pytest.mark.anyio
+async def test_local_limiter_splits_limit_across_workers(monkeypatch):
+    monkeypatch.setattr(settings, "ratelimit_fallback_workers", 2)
+    local = LocalLimiter()
+    assert local.check("rl:a:memory:search", 4, 60) == (True, 0)
+    assert local.check("rl:a:memory:search", 4, 60) == (True, 0)
+    allowed, retry_after = local.check("rl:a:memory:search", 4, 60)
+    assert not allowed and 1 <= retry_after <= 30
+    # Other keys have their own bucket; a cost above the bucket never fits
+    assert local.check("rl:b:memory:search", 4, 60)[0]
+    assert local.check("rl:c:memory:search", 4, 60, cost=3) == (False, 60)
+
+
+@pytest.mark.anyio
+@pytest.mark.skipif(shutil.which("redis-server") is None, reason="needs redis-server")
+async def test_redis_killed_mid_load(client, monkeypatch):
+    port = _free_port()
+    proc = _start_redis(port)
+    breaker = breaker_module.breaker
+    for name, value in vars(CircuitBreaker("redis", breaker_module.RedisUnavailable)).items():
+        monkeypatch.setattr(breaker, name, value)
+    monkeypatch.setattr(settings, "redis_url", f"redis://127.0.0.1:{port}/0")
+    monkeypatch.setattr(settings, "redis_breaker_reset_seconds", 0.5)
+    monkeypatch.setattr(limiter, "_redis", None)
+    # Real rate limiting, so the in-process fallback is exercised
+    monkeypatch.setattr(memory_read, "check_rate_limit", check_rate_limit)
+
+    # Concurrent requests need a session each, not the fixture's shared one
+    async def own_session():
+        async with TestSession() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = own_session
+    app.dependency_overrides[get_read_db] = own_session
+    try:
+        headers = (await register_agent(client, "ChaosAgent")).headers
+        resp = await client.post(
+            "/api/v1/memory", json={"content": "chaos " + "x" * 100, "tags": ["chaos", "redis"]}, headers=headers
+        )
+        assert resp.status_code == 200
+
+        async def search(i: int):
+            return await client.get(f"/api/v1/memory/search?q=chaos+{i}", headers=headers)
+
+        async def kill():
+            await asyncio.sleep(0.02)
+            proc.kill()
+            proc.wait()
+
+        # Redis dies while searches are in flight; none of them may fail
+        results = await asyncio.gather(*(search(i) for i in range(10)), kill())
+        results += await asyncio.gather(*(search(i) for i in range(10, 20)))
+        assert [r.status_code for r in results[:10] + results[11:]] == [200] * 20
+        assert breaker.state == OPEN
+        assert breaker.trips == 1
+        health = (await client.get("/api/v1/health")).json()["redis"]
+        assert health["state"] == "open" and health["local_rate_limiter"]["allowed"] > 0
+
+        # Back up: the next call after the reset interval probes and closes the breaker
+        proc = _start_redis(port)
+        await asyncio.sleep(0.6)
+        resp = await client.get("/api/v1/memory/search?q=chaos+recovered", headers=headers)
+        assert resp.status_code == 200
+        assert breaker.state == CLOSED
+        assert await (await limiter.get_redis()).keys("rl:*")
+    finally:
+        proc.kill()
+        proc.wait()
+        if limiter._redis is not None:
+            await limiter._redis.aclose()
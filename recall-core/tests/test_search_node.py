@@ -0,0 +1,52 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app import search_node
+from tests.conftest import FAKE_EMBEDDING, auth_headers, engine, register_agent
+
+pytest.importorskip("numpy")
+
+
+async def _write(client, key, content):
+    resp = await client.post(
+        "/api/v1/memory", json={"content": content, "tags": ["node", "test"]}, headers=auth_headers(key)
+    )
+    assert resp.status_code == 200
+    return resp.json()["id"]
+
+
+@pytest.mark.anyio
+async def test_search_node_snapshot_and_delta(client, db, tmp_path, monkeypatch):
+    _, key = await register_agent(client, "NodeAgent")
+    first = await _write(client, key, "search node snapshot memory " + "s" * 80)
+
+    with patch("app.jobs.transfer.engine", engine):
+        meta = await search_node.build_snapshot(str(tmp_path))
+    assert meta["rows"] >= 1
+    assert (tmp_path / "CURRENT").read_text() == f"snap-{meta['generation']}"
+
+    node = search_node.SearchNode()
+    assert node.load(str(tmp_path))
+    assert not node.load(str(tmp_path))  # same generation: nothing to do
+    assert first in {str(mid) for mid, _ in node.search(FAKE_EMBEDDING, 1000)}
+
+    # Written after the snapshot: only visible once the delta is fetched
+    second = await _write(client, key, "search node delta memory " + "d" * 80)
+    assert second not in {str(mid) for mid, _ in node.search(FAKE_EMBEDDING, 1000)}
+    assert await node.refresh_delta(db) >= 1
+    found = node.search(FAKE_EMBEDDING, 1000)
+    assert second in {str(mid) for mid, _ in found}
+    assert len(found) == len({mid for mid, _ in found})
+
+    # The endpoint ranks on the node and only hydrates from Postgres
+    monkeypatch.setattr(search_node, "node", node)
+    with patch("app.api.memory_read.vector_search", new_callable=AsyncMock) as pg_search:
+        resp = await client.get(
+            "/api/v1/memory/search", params={"q": "search node query", "limit": 5}, headers=auth_headers(key)
+        )
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+    assert results
+    assert all(r["similarity"] >= 0.55 for r in results)
+    pg_search.assert_not_called()
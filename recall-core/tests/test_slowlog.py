@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy import func, select, text
+
+from app.config import settings
+from app.db import slowlog
+from app.db.models import SystemConfig
+from tests.conftest import FAKE_EMBEDDING, TestSession, register_agent
+
+SAMPLE_CONTENT = "slow log memory " + "x" * 100
+
+
+@pytest.fixture
+def log_everything(monkeypatch):
+    monkeypatch.setattr(settings, "slow_query_ms", 0.001)
+    monkeypatch.setattr(settings, "slow_query_sample", 1.0)
+    slowlog.clear()
+    yield
+    slowlog.clear()
+
+
+@pytest.mark.anyio
+async def test_slow_statements_explained_without_vectors(log_everything):
+    vec = "[" + ",".join(str(x) for x in FAKE_EMBEDDING) + "]"
+    async with TestSession() as db:
+        await db.execute(
+            text("SELECT id FROM memories ORDER BY embedding <=> CAST(:vec AS vector) LIMIT :k").bindparams(vec=vec, k=3)
+        )
+        # A write only gets a plain EXPLAIN: it must not run twice
+        await db.execute(text("INSERT INTO system_config (key, value) VALUES ('slowlog_test', '1')"))
+        # DDL and utility statements aren't explainable; the transaction survives regardless
+        await db.execute(text("SET LOCAL work_mem = '8MB'"))
+        count = await db.scalar(select(func.count()).select_from(SystemConfig).where(SystemConfig.key == "slowlog_test"))
+        assert count == 1
+        await db.rollback()
+
+    entries = slowlog.status()["entries"][::-1]
+    select_entry = next(e for e in entries if "embedding <=>" in e["statement"])
+    assert select_entry["analyzed"] is True
+    assert select_entry["plan"][0]["Plan"]["Node Type"]
+    assert "Shared Hit Blocks" in str(select_entry["plan"]) or "Shared Read Blocks" in str(select_entry["plan"])
+    assert select_entry["params"] == [f"<vector {len(FAKE_EMBEDDING)}d>", 3]
+    insert_entry = next(e for e in entries if e["statement"].startswith("INSERT INTO system_config"))
+    assert insert_entry["analyzed"] is False and insert_entry["plan"]
+    set_entry = next(e for e in entries if e["statement"].startswith("SET LOCAL"))
+    assert set_entry["plan"] is None and set_entry["error"] == "not explainable"
+
+
+@pytest.mark.anyio
+async def test_slow_queries_endpoint_requires_core(client, db, log_everything):
+    plain = (await register_agent(client, "SlowPlain")).headers
+    core = (await register_agent(client, "SlowCore", trust_level=2, db=db)).headers
+    assert (await client.get("/api/v1/admin/slow-queries", headers=plain)).status_code == 403
+
+    resp = await client.get("/api/v1/admin/slow-queries?limit=5", headers=core)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["slow"] > 0 and 0 < len(data["entries"]) <= 5
+    assert (await client.delete("/api/v1/admin/slow-queries", headers=core)).status_code == 200
+    assert slowlog.status()["entries"] == []
+
+
+@pytest.mark.anyio
+async def test_search_explain(client, db):
+    core = (await register_agent(client, "ExplainCore", trust_level=2, db=db)).headers
+    plain = (await register_agent(client, "ExplainPlain")).headers
+    resp = await client.post("/api/v1/memory", json={"content": SAMPLE_CONTENT, "tags": ["slow", "log"]}, headers=core)
+    assert resp.status_code == 200
+
+    resp = await client.get("/api/v1/memory/search?q=slow+log&explain=true", headers=plain)
+    assert resp.status_code == 403
+
+    resp = await client.get("/api/v1/memory/search?q=slow+log&explain=true", headers=core)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["results"]
+    explain = data["explain"]
+    assert set(explain["timings_ms"]) == {"embed", "database", "render", "total"}
+    search = [s for s in explain["statements"] if "<=>" in s["statement"]]
+    assert search and search[0]["analyzed"] and search[0]["plan"]